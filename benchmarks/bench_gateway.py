@@ -0,0 +1,73 @@
+'''
+what each GATEWAY_PROFILE costs per guild: the GUILD_CREATE payloads discord
+would send under its intents are parsed by a real discord.py ConnectionState
+and the cache it keeps is measured
+'''
+import tracemalloc
+
+import discord
+from discord.state import ConnectionState
+import pytest
+
+from main import gateway_options
+
+GUILDS = 200
+MEMBERS = 500 # per guild
+IN_VOICE = 5
+
+def _member(guild_id: int, user_id: int) -> dict:
+    return {
+        'user': {'id': str(user_id), 'username': f'user{user_id}', 'discriminator': '0001', 'avatar': None},
+        'roles': [], 'joined_at': '2022-04-10T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0,
+    }
+
+def guild_payload(guild_id: int, self_id: int, intents: discord.Intents) -> dict:
+    '''
+    without the members intent discord only sends the bot itself and the
+    members in voice, with it (and chunking) every member plus presences
+    '''
+    user_ids = range(guild_id * 10_000, guild_id * 10_000 + MEMBERS)
+    voice_ids = list(user_ids[:IN_VOICE])
+    sent = user_ids if intents.members else voice_ids
+    return {
+        'id': str(guild_id), 'name': f'guild{guild_id}', 'owner_id': str(user_ids[0]), 'member_count': MEMBERS + 1,
+        'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                   'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+        'channels': [
+            {'id': str(guild_id + 1), 'type': 0, 'name': 'general', 'position': 0, 'permission_overwrites': []},
+            {'id': str(guild_id + 2), 'type': 2, 'name': 'music', 'position': 1, 'permission_overwrites': [], 'bitrate': 64000, 'user_limit': 0},
+        ],
+        'members': [_member(guild_id, self_id)] + [_member(guild_id, user_id) for user_id in sent],
+        'voice_states': [{'user_id': str(user_id), 'channel_id': str(guild_id + 2), 'session_id': 'x', 'deaf': False, 'mute': False,
+                          'self_deaf': False, 'self_mute': False, 'self_video': False, 'suppress': False} for user_id in voice_ids],
+        'presences': [{'user': {'id': str(user_id)}, 'status': 'online', 'activities': [], 'client_status': {'desktop': 'online'}}
+                      for user_id in sent] if intents.presences else [],
+        'emojis': [], 'stickers': [], 'features': [], 'large': MEMBERS > 250,
+    }
+
+def connection_state(profile: str) -> ConnectionState:
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=None, **gateway_options(profile))
+    state.user = discord.ClientUser(state=state, data={'id': '1', 'username': 'TKablent', 'discriminator': '0001', 'avatar': None})
+    return state
+
+def ingest(state: ConnectionState, payloads) -> ConnectionState:
+    for payload in payloads:
+        state._add_guild_from_data(payload)
+    return state
+
+@pytest.mark.benchmark(group='gateway.guild_create')
+@pytest.mark.parametrize('profile', ['minimal', 'default', 'full'])
+def bench_guild_create(benchmark, profile):
+    intents = gateway_options(profile)['intents']
+    payloads = [guild_payload(guild_id, 1, intents) for guild_id in range(1, GUILDS + 1)]
+    state = benchmark.pedantic(lambda: ingest(connection_state(profile), payloads), rounds=5)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = ingest(connection_state(profile), payloads)
+    cached = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    members = sum(len(guild.members) for guild in state.guilds)
+    assert all(guild.me is not None for guild in state.guilds)
+    benchmark.extra_info.update({'guilds': GUILDS, 'members_cached': members, 'users_cached': len(state._users),
+                                 'cache_bytes_per_guild': cached // GUILDS})
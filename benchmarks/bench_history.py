@@ -0,0 +1,63 @@
+'''
+the play history: writing columnar blocks with running totals, and what
+$stats costs compared with aggregating the raw history on every call
+'''
+import asyncio, collections, itertools, random
+from types import SimpleNamespace
+
+import pytest
+
+from utils.history import PlayHistory, decode_block
+from utils.store import store
+
+PLAYS = 20_000
+_guild_ids = itertools.count(90_000)
+
+def _songs(catalogue, count: int = 200) -> list:
+    requesters = [SimpleNamespace(id=4000 + i, name=f'user{i}') for i in range(20)]
+    return [SimpleNamespace(video_id=video['video_id'], info=video, requester=requesters[i % len(requesters)])
+            for i, video in enumerate(itertools.islice(itertools.cycle(catalogue.videos), count))]
+
+def _fill(catalogue, guild_id: int) -> PlayHistory:
+    rng = random.Random(guild_id)
+    songs = _songs(catalogue)
+    history = PlayHistory()
+
+    async def run():
+        for i in range(PLAYS):
+            history.record(guild_id, rng.choice(songs), 1.7e9 + i * 200, rng.uniform(10, 300), rng.random() < 0.2)
+        await history.flush()
+    asyncio.run(run())
+    return history
+
+def _scan(guild_id: int) -> dict:
+    plays = collections.Counter()
+    for block in store.play_blocks(guild_id):
+        plays.update(play['video_id'] for play in decode_block(block))
+    return plays
+
+@pytest.mark.benchmark(group='history')
+def bench_record(benchmark, catalogue):
+    benchmark.pedantic(lambda: _fill(catalogue, next(_guild_ids)), rounds=3)
+    benchmark.extra_info['plays'] = PLAYS
+
+@pytest.mark.benchmark(group='history')
+@pytest.mark.parametrize('kind', ['totals', 'scan'])
+def bench_stats(benchmark, catalogue, kind):
+    guild_id = next(_guild_ids)
+    history = _fill(catalogue, guild_id)
+    blocks = store.play_blocks(guild_id)
+    assert sum(block['count'] for block in blocks) == PLAYS
+    # 23 bytes a play, the track column only indexes the block's video ids
+    assert sum(sum(len(block[column]) for column in ('track', 'requester', 'started', 'listened', 'skipped')) for block in blocks) <= PLAYS * 23
+
+    if kind == 'totals':
+        stats = benchmark(lambda: asyncio.run(history.stats(guild_id)))
+        assert stats['total']['plays'] == PLAYS
+        top = stats['tracks'][0]
+        assert top['plays'] == _scan(guild_id).most_common(1)[0][1]
+        rates = [row['skips'] / row['plays'] for row in stats['skipped']]
+        assert rates == sorted(rates, reverse=True)
+    else:
+        plays = benchmark(_scan, guild_id)
+        assert sum(plays.values()) == PLAYS
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import utils.playlist
+from utils.playlist import Playlist, Song, INF
+
+@pytest.mark.benchmark(group='ingest.song')
+@pytest.mark.parametrize('kind', ['url', 'keyword', 'live'])
+def bench_song(benchmark, offline, requester, kind):
+    if kind == 'keyword':
+        query = offline.videos[5]['title'].split(' - ')[-1]
+    else:
+        query = offline.urls(1, live=kind == 'live')[0]
+    benchmark(Song, query, requester)
+
+@pytest.mark.benchmark(group='ingest.song')
+def bench_song_from_snapshot(benchmark, offline, requester):
+    benchmark(Song.from_snapshot, offline.videos[0]['video_id'], requester)
+
+@pytest.mark.benchmark(group='ingest.song')
+def bench_stream_url(benchmark, offline, requester):
+    song = Song(offline.urls(1)[0], requester)
+    def resolve():
+        song._stream_url = None
+        return song.url
+    benchmark(resolve)
+
+@pytest.mark.benchmark(group='ingest.queue')
+def bench_add_songs(benchmark, offline, guild, requester, monkeypatch):
+    # the queue grows past the default limits over the rounds
+    monkeypatch.setattr(utils.playlist, 'QUEUE_LIMIT', INF)
+    monkeypatch.setattr(utils.playlist, 'QUEUE_USER_LIMIT', INF)
+    playlist = Playlist()
+    urls = iter(offline.urls(100_000))
+    benchmark(lambda: asyncio.run(playlist.add_songs(guild.id, next(urls), requester)))
+
+@pytest.mark.benchmark(group='ingest.queue')
+def bench_process_playlist(benchmark, offline, guild, requester, fast_ticks):
+    url = offline.playlists[0]['url']
+    def ingest():
+        playlist = Playlist()
+        asyncio.run(playlist.process_playlist(guild.id, url, requester))
+        return playlist
+    playlist = benchmark.pedantic(ingest, rounds=20)
+    songs = len(playlist[guild.id].order)
+    benchmark.extra_info['songs'] = songs
+    if benchmark.stats is not None: # None with --benchmark-disable
+        benchmark.extra_info['songs_per_second'] = songs / benchmark.stats.stats.mean
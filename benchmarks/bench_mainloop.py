@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from utils.playlist import Song
+from fakes import FakeVoiceClient, create_musicbot
+
+SONGS = 10
+
+@pytest.mark.benchmark(group='mainloop')
+@pytest.mark.parametrize('guilds', [1, 10, 50])
+def bench_mainloop(benchmark, bot, offline, fast_ticks, guilds):
+    musicbot = create_musicbot(bot)
+    all_guilds = [bot.add_guild(5000 + i) for i in range(guilds)]
+    songs = {guild.id: [Song(url, guild.member(7000 + guild.id, 'requester')) for url in offline.urls(SONGS)] for guild in all_guilds}
+
+    def setup():
+        for guild in all_guilds:
+            guild.voice_client = FakeVoiceClient(guild.voice_channel)
+            musicbot[guild.id].text_channel = guild.text_channel
+            musicbot._playlist[guild.id].order = list(songs[guild.id])
+        return (), {}
+
+    async def play_all():
+        await asyncio.gather(*(musicbot._mainloop(guild) for guild in all_guilds))
+
+    benchmark.pedantic(lambda: asyncio.run(play_all()), setup=setup, rounds=10)
+    ticks = guilds * SONGS * FakeVoiceClient.ticks
+    benchmark.extra_info['ticks'] = ticks
+    if benchmark.stats is not None: # None with --benchmark-disable
+        benchmark.extra_info['us_per_guild_tick'] = benchmark.stats.stats.mean / ticks * 1e6
@@ -0,0 +1,55 @@
+'''
+how long starting a song waits for its stream url, with the url resolved
+when the song starts compared with the prefetcher resolving the upcoming
+songs of every guild in the background
+'''
+import asyncio, time
+
+import pytest
+
+import utils.playlist
+from utils.playlist import Song
+from utils.prefetch import StreamPrefetcher
+from fakes import create_musicbot
+
+SONGS = 4
+EXTRACTION = 0.02 # seconds one url resolution takes
+
+@pytest.fixture
+def slow_extraction(monkeypatch, offline):
+    get_url = utils.playlist.ytdl.get_url
+    def slow_get_url(url):
+        time.sleep(EXTRACTION)
+        return get_url(url)
+    monkeypatch.setattr(utils.playlist.ytdl, 'get_url', slow_get_url)
+
+@pytest.mark.benchmark(group='prefetch')
+@pytest.mark.parametrize('prefetch', [False, True])
+def bench_song_start_wait(benchmark, bot, offline, slow_extraction, prefetch):
+    musicbot = create_musicbot(bot)
+    guilds = [bot.add_guild(6000 + i) for i in range(5)]
+
+    async def run():
+        prefetcher = StreamPrefetcher(songs=SONGS, rate=1000, concurrency=4)
+        prefetcher.start()
+        for guild in guilds:
+            musicbot._playlist[guild.id].order = [Song(url, guild.member(7000, 'requester')) for url in offline.urls(SONGS)]
+            if prefetch:
+                prefetcher.poke(guild.id)
+        # the time the current song of every guild leaves for the prefetcher
+        await asyncio.sleep(SONGS * len(guilds) * EXTRACTION)
+        waits = []
+        for guild in guilds:
+            for song in musicbot._playlist[guild.id].order:
+                started = time.perf_counter()
+                await prefetcher.ensure(song)
+                waits.append(time.perf_counter() - started)
+        prefetcher.stop()
+        return waits
+
+    waits = benchmark.pedantic(lambda: asyncio.run(run()), rounds=3)
+    benchmark.extra_info['max_wait_ms'] = max(waits) * 1e3
+    if prefetch:
+        assert max(waits) < EXTRACTION
+    else:
+        assert min(waits) >= EXTRACTION
@@ -0,0 +1,71 @@
+import pytest
+
+import utils.playlist
+from utils.playlist import PlaylistBase, LoopState, Song
+from fakes import FakeGuild
+
+QUEUE = 10_000
+
+@pytest.fixture(scope='module')
+def songs(catalogue):
+    # snapshot songs skip extraction, only the queue operations are measured
+    requester = FakeGuild(1).member(2, 'requester')
+    videos = catalogue.videos
+    return [Song.from_snapshot(videos[i % len(videos)]['video_id'], requester) for i in range(QUEUE)]
+
+def _queue(songs, loop_state: LoopState = LoopState.NOTHING, times: int = 0) -> PlaylistBase:
+    playlist = PlaylistBase()
+    playlist.order = list(songs)
+    playlist.loop_state = loop_state
+    playlist.times = times
+    return playlist
+
+@pytest.mark.benchmark(group='queue.rule')
+@pytest.mark.parametrize('loop_state', [LoopState.NOTHING, LoopState.PLAYLIST, LoopState.SINGLE, LoopState.SINGLEINF], ids=lambda state: state.name)
+def bench_rule(benchmark, songs, loop_state):
+    # rule() consumes the queue without looping, every round starts from a full one
+    benchmark.pedantic(
+        lambda playlist: playlist.rule(),
+        setup=lambda: ((_queue(songs, loop_state, times=QUEUE),), {}),
+        rounds=1000,
+    )
+
+@pytest.mark.benchmark(group='queue.move_to')
+@pytest.mark.parametrize('origin, new', [(QUEUE - 1, 1), (1, QUEUE - 1), (QUEUE // 2, 1)], ids=['last-to-next', 'next-to-last', 'middle-to-next'])
+def bench_move_to(benchmark, songs, origin, new):
+    playlist = _queue(songs)
+    benchmark(playlist.move_to, origin, new)
+    assert len(playlist.order) == QUEUE
+
+@pytest.mark.benchmark(group='queue.swap')
+def bench_swap(benchmark, songs):
+    playlist = _queue(songs)
+    benchmark(playlist.swap, 1, QUEUE - 1)
+
+@pytest.mark.benchmark(group='queue.snapshot')
+def bench_to_dict(benchmark, songs):
+    benchmark(_queue(songs).to_dict)
+
+@pytest.fixture(scope='module')
+def requests(catalogue):
+    # one member queues half of the songs first, 19 others queue the rest one after another
+    guild = FakeGuild(1)
+    members = [guild.member(100 + i, f'member{i}') for i in range(20)]
+    owners = [members[0]] * (QUEUE // 2) + [members[1 + i * 19 // (QUEUE - QUEUE // 2)] for i in range(QUEUE - QUEUE // 2)]
+    videos = catalogue.videos
+    return [Song.from_snapshot(videos[i % len(videos)]['video_id'], owner) for i, owner in enumerate(owners)]
+
+@pytest.mark.benchmark(group='queue.add')
+@pytest.mark.parametrize('fair', [False, True], ids=['last', 'fair'])
+def bench_add(benchmark, requests, monkeypatch, fair):
+    monkeypatch.setattr(utils.playlist, 'QUEUE_LIMIT', QUEUE)
+    monkeypatch.setattr(utils.playlist, 'QUEUE_USER_LIMIT', QUEUE)
+    def add(playlist: PlaylistBase) -> PlaylistBase:
+        for song in requests:
+            playlist.add(song)
+        return playlist
+    playlist = benchmark.pedantic(add, setup=lambda: ((PlaylistBase(fair),), {}), rounds=5)
+    assert len(playlist.order) == QUEUE
+    first = {song.requester.id for song in playlist.order[:20]}
+    # fair mode starts with a round of every member, not the first member's half
+    assert len(first) == (20 if fair else 1)
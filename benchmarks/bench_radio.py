@@ -0,0 +1,53 @@
+'''
+autoplay against the fixture catalogue: ranking candidates from cached
+related videos, and a guild that keeps playing after its queue ran out
+'''
+import asyncio
+
+import pytest
+
+from utils.playlist import Song
+from utils.radio import Radio, radio_picks
+from fakes import FakeVoiceClient, create_musicbot
+
+# the catalogue only holds a few songs related to the seed (same author)
+RADIO_SONGS = 3
+# polls a song lasts. the pick is staged in a thread while the event loop
+# spins through them, 20 left too little time on a busy machine
+SONG_TICKS = 200
+
+@pytest.mark.benchmark(group='radio')
+def bench_rank(benchmark, offline):
+    radio = Radio()
+    history = [Song(url, None).info for url in offline.urls(50)]
+    related = [radio.related(info) for info in history[-3:]]
+    ranked = benchmark(radio.rank, history[:-3], related)
+    assert ranked and all(not info['stream'] for info in ranked)
+
+@pytest.mark.benchmark(group='radio')
+def bench_autoplay(benchmark, bot, offline, fast_ticks):
+    sleep = fast_ticks
+    musicbot = create_musicbot(bot)
+    guild = bot.add_guild(8000)
+
+    async def run():
+        guild.voice_client = FakeVoiceClient(guild.voice_channel)
+        guild.voice_client.ticks = SONG_TICKS
+        musicbot[guild.id].text_channel = guild.text_channel
+        state = musicbot._radio[guild.id]
+        state.enabled, state.held = True, False
+        state.history.clear()
+        musicbot._playlist[guild.id].order = [Song(url, guild.member(7000, 'requester')) for url in offline.urls(2)]
+        task = asyncio.ensure_future(musicbot._mainloop(guild))
+        while len(state.history) < 2 + RADIO_SONGS and not task.done():
+            await sleep(0.001)
+        musicbot._stop(guild)
+        await task
+        return list(state.history)
+
+    staged = radio_picks.value(staged='yes')
+    history = benchmark.pedantic(lambda: asyncio.run(run()), rounds=3)
+    played = [info['video_id'] for info in history]
+    assert len(played) == 2 + RADIO_SONGS and len(set(played)) == len(played)
+    # the next song was ready before the former one ended
+    assert radio_picks.value(staged='yes') > staged
@@ -0,0 +1,39 @@
+'''
+saved playlists: loading one from the store against resolving the same
+youtube playlist again like $play does
+'''
+import asyncio, itertools, time
+
+import pytest
+
+import utils.ytdl
+from utils.playlist import Song
+
+EXTRACTION = 0.005 # seconds youtube takes to answer, the fixtures answer at once
+_guild_ids = itertools.count(95_000)
+
+def _no_extraction(monkeypatch):
+    def extract(*args, **kwargs):
+        raise AssertionError('a saved playlist was loaded through the extractor')
+    monkeypatch.setattr(utils.ytdl.pytube, 'YouTube', extract)
+    monkeypatch.setattr(utils.ytdl.pytube, 'Playlist', extract)
+
+@pytest.mark.benchmark(group='saved')
+@pytest.mark.parametrize('source', ['saved', 'youtube'])
+def bench_load(benchmark, saved, offline, requester, monkeypatch, source):
+    url = offline.playlists[0]['url']
+    guild_id = next(_guild_ids)
+    assert asyncio.run(saved.save_youtube(guild_id, 'mix', requester.id, url)) == (50, 0)
+
+    if source == 'saved':
+        _no_extraction(monkeypatch)
+        songs = benchmark(lambda: [Song.from_info(info, requester) for info in asyncio.run(saved.load(guild_id, 'MIX'))])
+    else:
+        YouTube = utils.ytdl.pytube.YouTube
+        def slow_youtube(*args, **kwargs):
+            time.sleep(EXTRACTION)
+            return YouTube(*args, **kwargs)
+        monkeypatch.setattr(utils.ytdl.pytube, 'YouTube', slow_youtube)
+        ytdl = utils.ytdl.YTDL()
+        songs = benchmark(lambda: [Song(url, requester) for url in [ytdl.get_first_video(url)] + list(ytdl.get_playlist(url))])
+    assert [song.info['watch_url'].rsplit('=', 1)[1] for song in songs] == [url.rsplit('=', 1)[1] for url in offline.playlists[0]['video_urls']]
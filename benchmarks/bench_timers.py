@@ -0,0 +1,74 @@
+'''
+idle-leave, view timeouts and panel refreshes of every guild wait on the
+shared timer wheel, compared with what a sleeping task per timer costs
+'''
+import asyncio, tracemalloc
+
+import pytest
+
+from utils.timerwheel import TimerWheel
+
+TIMERS = 10_000
+
+def _wheel(count: int):
+    async def run():
+        wheel = TimerWheel()
+        timers = [wheel.call_later(60.0 + i % 600, lambda: None) for i in range(count)]
+        await asyncio.sleep(0)
+        for timer in timers:
+            timer.cancel()
+        await asyncio.sleep(0)
+        return len(wheel)
+    return run
+
+def _tasks(count: int):
+    async def run():
+        tasks = [asyncio.ensure_future(asyncio.sleep(60.0 + i % 600)) for i in range(count)]
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return 0
+    return run
+
+@pytest.mark.benchmark(group='timers')
+@pytest.mark.parametrize('kind', ['wheel', 'tasks'])
+def bench_schedule_cancel(benchmark, kind):
+    run = (_wheel if kind == 'wheel' else _tasks)(TIMERS)
+    assert benchmark.pedantic(lambda: asyncio.run(run()), rounds=10) == 0
+
+@pytest.mark.benchmark(group='timers')
+@pytest.mark.parametrize('kind', ['wheel', 'tasks'])
+def bench_pending_memory(benchmark, kind):
+    async def held():
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        if kind == 'wheel':
+            wheel = TimerWheel()
+            pending = [wheel.call_later(60.0 + i % 600, lambda: None) for i in range(TIMERS)]
+        else:
+            pending = [asyncio.ensure_future(asyncio.sleep(60.0 + i % 600)) for i in range(TIMERS)]
+            await asyncio.sleep(0)
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        for timer in pending:
+            timer.cancel()
+        await asyncio.sleep(0)
+        return size
+    size = benchmark.pedantic(lambda: asyncio.run(held()), rounds=3)
+    benchmark.extra_info['bytes_per_timer'] = size // TIMERS
+
+@pytest.mark.benchmark(group='timers')
+def bench_fire(benchmark):
+    # a wheel that has fallen behind walks every tick and fires what is due
+    def setup():
+        wheel = TimerWheel(tick=0.001)
+        wheel._task = object() # walk by hand, no driver task
+        for i in range(TIMERS):
+            wheel.call_later((i % 5000) * 0.001, lambda: None)
+        return (wheel,), {}
+
+    def walk(wheel):
+        while len(wheel):
+            wheel._advance()
+    benchmark.pedantic(walk, setup=setup, rounds=10)
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from utils.playlist import Song, LoopState
+
+QUEUE = 10_000
+
+@pytest.fixture
+def queued(musicbot, guild, requester, offline):
+    # extract each recorded video once and repeat them up to the queue length
+    songs = [Song(video['watch_url'], requester) for video in offline.videos]
+    playlist = musicbot._playlist[guild.id]
+    playlist.order = [songs[i % len(songs)] for i in range(QUEUE)]
+    return playlist
+
+@pytest.mark.benchmark(group='ui.song_info')
+@pytest.mark.parametrize('color_code, index', [(None, 0), ('green', QUEUE - 1), ('red', 1)], ids=['playing', 'added', 'removed'])
+def bench_song_info(benchmark, musicbot, guild, queued, color_code, index):
+    benchmark(musicbot.ui._SongInfo, guild.id, color_code, index)
+
+@pytest.mark.benchmark(group='ui.song_info')
+def bench_song_info_looping(benchmark, musicbot, guild, queued):
+    queued.loop_state, queued.times = LoopState.SINGLE, 3
+    benchmark(musicbot.ui._SongInfo, guild.id)
+
+@pytest.mark.benchmark(group='ui.song_info')
+def bench_song_info_progress(benchmark, musicbot, guild, queued):
+    benchmark(musicbot.ui._SongInfo, guild.id, progress=queued[0].info['length'] / 3)
+
+@pytest.mark.benchmark(group='ui.queue_embed')
+@pytest.mark.parametrize('page', [0, (QUEUE - 2) // 3], ids=['first', 'last'])
+def bench_queue_embed(benchmark, musicbot, queued, page):
+    benchmark(musicbot.ui._QueueEmbed, queued, page)
+
+@pytest.mark.benchmark(group='ui.panel')
+@pytest.mark.parametrize('changes', [1, 20])
+def bench_panel_burst(benchmark, musicbot, guild, queued, changes):
+    # however many changes (button presses, volume, loop...) pile up between
+    # two edits of the now playing panel, they should cost one message edit
+    musicbot[guild.id].text_channel = channel = guild.text_channel
+
+    async def burst():
+        musicbot.ui.panel.update(guild.id, create=True)
+        await musicbot.ui[guild.id].panel_task
+        musicbot.ui[guild.id].panel_edited = 0.0 # no wait for the interval
+        before = channel.sent + channel.edited
+        for _ in range(changes):
+            musicbot.ui.panel.update(guild.id)
+        await musicbot.ui[guild.id].panel_task
+        return channel.sent + channel.edited - before
+
+    writes = benchmark.pedantic(lambda: asyncio.run(burst()), rounds=20)
+    assert writes == 1
+    benchmark.extra_info['writes_per_burst'] = writes
@@ -0,0 +1,52 @@
+import asyncio, os, sys, pathlib
+
+# the store is imported with the cog, keep benchmark runs out of tkablent.db
+os.environ.setdefault('STORE_PATH', ':memory:')
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import pytest
+
+from fakes import Catalogue, FakeBot, create_musicbot, install_extractors, install_ffmpeg
+
+@pytest.fixture(scope='session')
+def catalogue() -> Catalogue:
+    return Catalogue()
+
+@pytest.fixture
+def offline(monkeypatch, catalogue):
+    '''recorded extractor responses and silent ffmpeg, nothing touches the network'''
+    install_extractors(monkeypatch, catalogue)
+    install_ffmpeg(monkeypatch)
+    return catalogue
+
+@pytest.fixture
+def bot() -> FakeBot:
+    return FakeBot()
+
+@pytest.fixture
+def guild(bot):
+    return bot.add_guild(1000)
+
+@pytest.fixture
+def requester(guild):
+    return guild.member(2000, 'requester')
+
+@pytest.fixture
+def musicbot(bot, offline):
+    return create_musicbot(bot)
+
+@pytest.fixture
+def fast_ticks(monkeypatch):
+    '''
+    the mainloop polls every 100ms and process_playlist sleeps between songs,
+    yield instead of sleeping so only their own work is measured. returns the
+    real asyncio.sleep
+    '''
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, 'sleep', lambda delay, result=None: sleep(0, result))
+    return sleep
+
+@pytest.fixture
+def saved(offline):
+    from utils.saved import SavedPlaylists
+    return SavedPlaylists()
@@ -0,0 +1,394 @@
+'''
+offline stand-ins for everything the bot normally talks to: pytube/yt_dlp
+answer from the recorded responses in fixtures/, ffmpeg is replaced by a
+silent source and discord objects only implement what the cog touches
+'''
+from typing import *
+import asyncio, json, os, pathlib, time
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+
+import pytube.exceptions
+import discord
+from discord import AudioSource
+from discord.opus import Encoder as OpusEncoder
+
+FIXTURES = pathlib.Path(__file__).parent / 'fixtures'
+
+class Catalogue:
+    '''recorded pytube responses, looked up by video id / playlist id'''
+    def __init__(self, path: pathlib.Path = FIXTURES):
+        with open(path / 'videos.json', encoding='utf-8') as f:
+            self.videos: List[dict] = json.load(f)
+        with open(path / 'playlists.json', encoding='utf-8') as f:
+            self.playlists: List[dict] = json.load(f)
+        self._by_id: Dict[str, dict] = {video['video_id']: video for video in self.videos}
+        self._playlists: Dict[str, dict] = {playlist['playlist_id']: playlist for playlist in self.playlists}
+
+    def video(self, url: str) -> dict:
+        query = parse_qs(urlparse(url).query)
+        video_id = query['v'][0] if 'v' in query else url.rsplit('/', 1)[-1]
+        if video_id not in self._by_id:
+            raise pytube.exceptions.VideoUnavailable(video_id)
+        return self._by_id[video_id]
+
+    def search(self, keyword: str) -> List[dict]:
+        '''every video with the keyword in its title, best match first like youtube'''
+        keyword = keyword.lower()
+        return [video for video in self.videos if keyword in video['title'].lower()] or self.videos[:1]
+
+    def playlist(self, url: str) -> dict:
+        return self._playlists[parse_qs(urlparse(url).query)['list'][0]]
+
+    def urls(self, count: int, live: bool = False) -> List[str]:
+        videos = [video for video in self.videos if (video['length'] == 0) == live]
+        return [videos[i % len(videos)]['watch_url'] for i in range(count)]
+
+class _Stream:
+    def __init__(self, url: str):
+        self.url: str = url
+
+class _Streams:
+    def __init__(self, url: str):
+        self._url: str = url
+
+    def get_highest_resolution(self) -> _Stream:
+        return _Stream(self._url)
+
+def fake_pytube(catalogue: Catalogue):
+    '''classes replacing pytube.YouTube / Search / Playlist'''
+    class YouTube:
+        def __init__(self, url: str, data: dict = None):
+            data = data or catalogue.video(url)
+            self.video_id: str = data['video_id']
+            self.title: str = data['title']
+            self.author: str = data['author']
+            self.channel_url: str = data['channel_url']
+            self.watch_url: str = data['watch_url']
+            self.thumbnail_url: str = data['thumbnail_url']
+            self.length: int = data['length']
+            self.streams: _Streams = _Streams(data['stream_url'])
+
+    class Search:
+        def __init__(self, keyword: str):
+            self.query: str = keyword
+            self.results: List[YouTube] = [YouTube(None, video) for video in catalogue.search(keyword)]
+
+        def fetch_query(self) -> dict:
+            '''the raw innertube response, with the videoRenderer fields youtube sends'''
+            renderers = []
+            for video in catalogue.search(self.query):
+                renderer = {
+                    'videoId': video['video_id'],
+                    'title': {'runs': [{'text': video['title']}]},
+                    'ownerText': {'runs': [{'text': video['author'], 'navigationEndpoint': {'commandMetadata': {'webCommandMetadata': {
+                        'url': urlparse(video['channel_url']).path}}}}]},
+                    'thumbnail': {'thumbnails': [{'url': video['thumbnail_url']}]},
+                }
+                if video['length']:
+                    renderer['lengthText'] = {'simpleText': f"{video['length'] // 60}:{video['length'] % 60:02}"}
+                renderers.append({'videoRenderer': renderer})
+            return {'contents': {'twoColumnSearchResultsRenderer': {'primaryContents': {'sectionListRenderer': {
+                'contents': [{'itemSectionRenderer': {'contents': renderers}}]}}}}}
+
+    class Playlist:
+        def __init__(self, url: str):
+            data = catalogue.playlist(url)
+            self.playlist_id: str = data['playlist_id']
+            self.video_urls: List[str] = list(data['video_urls'])
+
+    return YouTube, Search, Playlist
+
+class OfflineYoutubeDL:
+    '''the yt_dlp fallback must never reach the network while benchmarking'''
+    def extract_info(self, url, download=False):
+        raise RuntimeError(f'yt_dlp fallback reached offline for {url}')
+
+def install_extractors(monkeypatch, catalogue: Catalogue):
+    import utils.ytdl
+    YouTube, Search, Playlist = fake_pytube(catalogue)
+    monkeypatch.setattr(utils.ytdl.pytube, 'YouTube', YouTube)
+    monkeypatch.setattr(utils.ytdl.pytube, 'Search', Search)
+    monkeypatch.setattr(utils.ytdl.pytube, 'Playlist', Playlist)
+    monkeypatch.setattr(utils.ytdl, '_ytdl', OfflineYoutubeDL())
+
+class SilentSource(AudioSource):
+    '''replaces the ffmpeg pipeline, yields `frames` frames of silence'''
+    FRAME = b'\x00' * OpusEncoder.FRAME_SIZE
+
+    def __init__(self, source=None, *, guild_id=None, frames: int = 50 * 60 * 10, **kwargs):
+        self.guild_id = guild_id
+        self.remaining: int = frames
+
+    def read(self) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        self.remaining -= 1
+        return self.FRAME
+
+    def cleanup(self):
+        self.remaining = 0
+
+def install_ffmpeg(monkeypatch):
+    import utils.playlist
+    monkeypatch.setattr(utils.playlist, 'SupervisedFFmpegPCMAudio', SilentSource)
+
+class FakeUser:
+    def __init__(self, id: int, name: str):
+        self.id: int = id
+        self.name: str = name
+        self.discriminator: str = '0001'
+        self.display_avatar: str = f'https://cdn.discordapp.com/embed/avatars/{id % 5}.png'
+        self.bot: bool = False
+
+    def __str__(self):
+        return f'{self.name}#{self.discriminator}'
+
+class FakeMember(FakeUser):
+    def __init__(self, id: int, name: str, guild: 'FakeGuild'):
+        super().__init__(id, name)
+        self.guild: FakeGuild = guild
+        self.voice: SimpleNamespace = None # .channel / .suppress like discord.VoiceState
+
+    def join_voice(self, channel: 'FakeVoiceChannel'):
+        self.voice = SimpleNamespace(channel=channel, suppress=False)
+        channel.members.append(self)
+
+class FakeMessage:
+    _ids = 0
+
+    def __init__(self, channel: 'FakeTextChannel', content=None, embed=None):
+        FakeMessage._ids += 1
+        self.id: int = FakeMessage._ids
+        self.channel: FakeTextChannel = channel
+        self.content = content
+        self.embed = embed
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        self.channel.edited += 1
+        self.content, self.embed = content, embed
+        return self
+
+    async def delete(self):
+        pass
+
+class FakeTextChannel:
+    def __init__(self, id: int, guild: 'FakeGuild'):
+        self.id: int = id
+        self.guild: FakeGuild = guild
+        self.sent: int = 0
+        self.edited: int = 0
+
+    async def send(self, content=None, embed=None, **kwargs) -> FakeMessage:
+        self.sent += 1
+        return FakeMessage(self, content, embed)
+
+    def typing(self):
+        return _Typing()
+
+    def get_partial_message(self, id: int) -> FakeMessage:
+        message = FakeMessage(self)
+        message.id = id
+        return message
+
+class _Typing:
+    async def __aenter__(self): ...
+    async def __aexit__(self, *exc): ...
+
+class FakeVoiceChannel:
+    def __init__(self, id: int, guild: 'FakeGuild'):
+        self.id: int = id
+        self.guild: FakeGuild = guild
+        self.name: str = f'voice-{id}'
+        self.members: List[FakeMember] = []
+        self.instance = None
+
+    @property
+    def voice_states(self) -> Dict[int, SimpleNamespace]:
+        return {member.id: member.voice for member in self.members}
+
+    async def connect(self) -> 'FakeVoiceClient':
+        self.guild.voice_client = FakeVoiceClient(self)
+        return self.guild.voice_client
+
+class _Player:
+    def __init__(self):
+        self.loops: int = 0
+
+class FakeVoiceClient(discord.VoiceClient):
+    '''
+    plays without a socket. every is_playing() poll counts as one 100ms tick
+    of the mainloop and advances the player by the 5 frames it would have
+    sent, after `ticks` polls the song ends. with `read_frames` the frames are
+    actually pulled through the source (volume, effects) like the real player.
+    subclassed only so the isinstance checks in the cog pass, the parent's
+    __init__ is never run
+    '''
+    ticks: int = 20
+    read_frames: bool = False
+
+    def __init__(self, channel: FakeVoiceChannel):
+        self.channel: FakeVoiceChannel = channel
+        self._source: AudioSource = None
+        self._player: _Player = None
+        self._paused: bool = False
+        self._left: int = 0
+        self.started: float = None # perf_counter of the last play()
+
+    @property
+    def source(self) -> AudioSource:
+        return self._source
+
+    @source.setter
+    def source(self, value: AudioSource):
+        # like the real player, swapping the source restarts its frame count
+        self._source = value
+        if self._player is not None:
+            self._player.loops = 0
+
+    def play(self, source: AudioSource, *, after=None):
+        self._source = source
+        self._player = _Player()
+        self._paused = False
+        self._left = self.ticks
+        self.started = time.perf_counter()
+
+    @property
+    def busy(self) -> bool:
+        '''is_playing() or is_paused() without advancing the song'''
+        return self._source is not None and self._left > 0
+
+    def is_connected(self) -> bool:
+        return self.channel.guild.voice_client is self
+
+    def is_playing(self) -> bool:
+        if self._source is None or self._paused:
+            return False
+        if self._left <= 0:
+            self._source = None
+            return False
+        self._left -= 1
+        for _ in range(5):
+            if self.read_frames and not self._source.read():
+                self._left = 0
+                break
+            self._player.loops += 1
+        return True
+
+    def is_paused(self) -> bool:
+        return self._source is not None and self._paused
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        self._left = 0
+        self._paused = False
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self.channel.guild.voice_client = None
+
+class FakeGuild:
+    def __init__(self, id: int):
+        self.id: int = id
+        self.voice_client: FakeVoiceClient = None
+        self.voice_channel: FakeVoiceChannel = FakeVoiceChannel(id * 10 + 1, self)
+        self.text_channel: FakeTextChannel = FakeTextChannel(id * 10 + 2, self)
+        self.me: FakeMember = None
+        self._members: Dict[int, FakeMember] = {}
+
+    def member(self, id: int, name: str = None) -> FakeMember:
+        if id not in self._members:
+            self._members[id] = FakeMember(id, name or f'user{id}', self)
+        return self._members[id]
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    def get_member(self, id: int) -> Optional[FakeMember]:
+        return self._members.get(id)
+
+    async def fetch_member(self, id: int) -> FakeMember:
+        return self.member(id)
+
+    def get_channel(self, id: int):
+        return {self.voice_channel.id: self.voice_channel, self.text_channel.id: self.text_channel}.get(id)
+
+class FakeContext:
+    '''the part of commands.Context the cog uses, for calling commands directly'''
+    def __init__(self, bot: 'FakeBot', guild: FakeGuild, author: FakeMember, command: str):
+        self.bot: FakeBot = bot
+        self.guild: FakeGuild = guild
+        self.author: FakeMember = author
+        self.channel: FakeTextChannel = guild.text_channel
+        self.message: SimpleNamespace = SimpleNamespace(author=author, guild=guild, channel=guild.text_channel)
+        self.command: SimpleNamespace = SimpleNamespace(name=command, qualified_name=command)
+        self.invoked_with: str = command
+        self.interaction = None # always a prefix invocation
+
+    async def defer(self, *, ephemeral=False):
+        pass
+
+    async def send(self, content=None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+    def typing(self):
+        return self.channel.typing()
+
+class FakeBot:
+    command_prefix = '%'
+
+    def __init__(self):
+        self.user: FakeUser = FakeUser(1, 'TKablent')
+        self._guilds: Dict[int, FakeGuild] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return asyncio.get_running_loop()
+
+    @property
+    def guilds(self) -> List[FakeGuild]:
+        return list(self._guilds.values())
+
+    @property
+    def users(self) -> List[FakeUser]:
+        return [member for guild in self._guilds.values() for member in guild.members]
+
+    @property
+    def voice_clients(self) -> List[FakeVoiceClient]:
+        return [guild.voice_client for guild in self._guilds.values() if guild.voice_client is not None]
+
+    def add_guild(self, id: int) -> FakeGuild:
+        guild = FakeGuild(id)
+        guild.me = guild.member(self.user.id, self.user.name)
+        self._guilds[id] = guild
+        return guild
+
+    def get_guild(self, id: int) -> Optional[FakeGuild]:
+        return self._guilds.get(id)
+
+    def add_view(self, view, *, message_id=None):
+        pass
+
+def create_musicbot(bot: FakeBot):
+    '''a MusicBot cog wired to the fake bot, with its UI built'''
+    os.environ.setdefault('STORE_PATH', ':memory:')
+    from utils.player import MusicBot
+    from utils.ui import UI
+    from utils.registry import registry
+    registry.clear() # per guild state of an earlier bot
+    musicbot = MusicBot(bot)
+    # the part of add_cog that matters offline: commands calling each other
+    # (play -> join) need to know their cog
+    for command in musicbot.walk_commands():
+        command.cog = musicbot
+    musicbot.ui = UI(musicbot, 'benchmark')
+    return musicbot
@@ -0,0 +1,317 @@
+'''
+load generator for capacity planning. N simulated guilds join, queue songs
+and keep sending play / skip / seek / queue commands to one MusicBot cog on
+the fake gateway from fakes.py. extraction answers from the recorded
+fixtures, audio comes from a local http media server (through real ffmpeg
+when it is installed) and the voice clients read frames like the player would
+
+    python benchmarks/loadtest.py --guilds 100 --duration 120
+
+reports command latency percentiles, time to first audio, event loop lag,
+and cpu / memory per guild (ffmpeg children included)
+'''
+from typing import *
+import argparse, asyncio, json, os, pathlib, random, resource, shutil, sys, time, wave, io
+
+os.environ.setdefault('STORE_PATH', ':memory:')
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+
+import pytest
+from aiohttp import web
+
+from fakes import Catalogue, FakeBot, FakeContext, FakeGuild, FakeVoiceClient, SilentSource, create_musicbot, install_extractors
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+COMMANDS = {
+    # name: (attribute on the cog, weight)
+    'play': ('play', 35),
+    'queue': ('show_queue', 30),
+    'seek': ('seek', 20),
+    'skip': ('skip', 15),
+}
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+class MediaServer:
+    '''serves one silent wav for every video id, ffmpeg reads it like a stream url'''
+    def __init__(self, seconds: int, host: str = '127.0.0.1'):
+        self.host: str = host
+        self.port: int = None
+        self.body: bytes = self._wav(seconds)
+        self.requests: int = 0
+        self._runner: web.AppRunner = None
+
+    @staticmethod
+    def _wav(seconds: int, rate: int = 8000) -> bytes:
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(rate)
+            f.writeframes(b'\x00\x00' * rate * seconds)
+        return buffer.getvalue()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/media/{video_id}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.Response(body=self.body, content_type='audio/wav')
+
+    def url(self, video_id: str) -> str:
+        return f'http://{self.host}:{self.port}/media/{video_id}.wav'
+
+class Usage:
+    '''cpu seconds and resident memory of this process and its ffmpeg children'''
+    def __init__(self):
+        self._process = psutil.Process() if psutil is not None else None
+
+    def rss(self) -> int:
+        if self._process is not None:
+            return self._process.memory_info().rss
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def cpu(self) -> float:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def children_cpu(self) -> float:
+        '''exited children from rusage, running ones from the ffmpeg supervisor'''
+        from utils.ffmpeg import supervisor
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        running = supervisor.stats()
+        return usage.ru_utime + usage.ru_stime + sum(p['cpu_seconds'] or 0 for p in running)
+
+    def children_rss(self) -> int:
+        from utils.ffmpeg import supervisor
+        return sum(p['rss_bytes'] or 0 for p in supervisor.stats())
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in COMMANDS}
+        self.errors: Dict[str, int] = {name: 0 for name in COMMANDS}
+        self.first_audio: List[float] = []
+        self.lag: List[float] = []
+
+class SimulatedGuild:
+    def __init__(self, harness: 'LoadTest', guild: FakeGuild, rng: random.Random):
+        self.harness: LoadTest = harness
+        self.guild: FakeGuild = guild
+        self.rng: random.Random = rng
+        self.member = guild.member(guild.id * 10 + 3, f'listener{guild.id}')
+        self.member.join_voice(guild.voice_channel)
+
+    async def command(self, name: str, *args, **kwargs):
+        musicbot, results = self.harness.musicbot, self.harness.results
+        ctx = FakeContext(self.harness.bot, self.guild, self.member, name)
+        start = time.perf_counter()
+        try:
+            await musicbot.cog_before_invoke(ctx)
+            await getattr(musicbot, COMMANDS[name][0])(ctx, *args, **kwargs)
+        except Exception as e:
+            results.errors[name] += 1
+            if self.harness.verbose:
+                print(f'[Loadtest] {name} failed in guild {self.guild.id}: {e!r}')
+        results.latencies[name].append(time.perf_counter() - start)
+
+    def _playing(self) -> bool:
+        voice_client = self.guild.voice_client
+        return voice_client is not None and voice_client.busy
+
+    async def play(self):
+        requested = time.perf_counter()
+        idle = not self._playing()
+        await self.command('play', url=self.rng.choice(self.harness.urls))
+        if idle:
+            self.harness.loop.create_task(self._first_audio(requested))
+
+    async def _first_audio(self, requested: float, timeout: float = 30.0):
+        while time.perf_counter() - requested < timeout:
+            voice_client = self.guild.voice_client
+            if voice_client is not None and voice_client.started is not None and voice_client.started >= requested:
+                self.harness.results.first_audio.append(voice_client.started - requested)
+                return
+            await asyncio.sleep(0.01)
+
+    async def run(self, deadline: float):
+        for _ in range(self.harness.initial_songs):
+            await self.play()
+        names, weights = zip(*((name, weight) for name, (_, weight) in COMMANDS.items()))
+        while True:
+            pause = self.rng.expovariate(1 / self.harness.interval)
+            if time.perf_counter() + pause >= deadline:
+                break
+            await asyncio.sleep(pause)
+            name = self.rng.choices(names, weights)[0]
+            if name == 'play':
+                await self.play()
+            elif name == 'seek':
+                song = self.harness.musicbot._playlist[self.guild.id].current()
+                if song is None or not self._playing() or song.info['stream']:
+                    continue
+                await self.command('seek', float(self.rng.uniform(0, min(song.info['length'], self.harness.song_seconds) * 0.8)))
+            else:
+                await self.command(name)
+
+class LoadTest:
+    def __init__(self, guilds: int, duration: float, interval: float, ramp: float, song_seconds: int,
+                 initial_songs: int = 3, ffmpeg: bool = None, seed: int = 0, verbose: bool = False):
+        self.guilds: int = guilds
+        self.duration: float = duration
+        self.interval: float = interval
+        self.ramp: float = ramp
+        self.song_seconds: int = song_seconds
+        self.initial_songs: int = initial_songs
+        self.ffmpeg: bool = shutil.which('ffmpeg') is not None if ffmpeg is None else ffmpeg
+        self.seed: int = seed
+        self.verbose: bool = verbose
+        self.results: Results = Results()
+        self.usage: Usage = Usage()
+        self.bot: FakeBot = FakeBot()
+        self.musicbot = None
+        self.loop: asyncio.AbstractEventLoop = None
+        self.urls: List[str] = []
+
+    def _patch(self, monkeypatch: pytest.MonkeyPatch, server: MediaServer):
+        catalogue = Catalogue()
+        for video in catalogue.videos:
+            video['stream_url'] = server.url(video['video_id'])
+        install_extractors(monkeypatch, catalogue)
+        if not self.ffmpeg:
+            import utils.playlist
+            frames = self.song_seconds * 50
+            monkeypatch.setattr(utils.playlist, 'SupervisedFFmpegPCMAudio', lambda *args, **kwargs: SilentSource(frames=frames, **kwargs))
+        monkeypatch.setattr(FakeVoiceClient, 'ticks', self.song_seconds * 10)
+        monkeypatch.setattr(FakeVoiceClient, 'read_frames', True)
+        self.urls = [video['watch_url'] for video in catalogue.videos]
+
+    async def _sample_lag(self, interval: float = 0.1):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.results.lag.append(max(0.0, time.perf_counter() - start - interval))
+
+    async def run(self) -> dict:
+        self.loop = asyncio.get_running_loop()
+        server = MediaServer(self.song_seconds)
+        await server.start()
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            self._patch(monkeypatch, server)
+            self.musicbot = create_musicbot(self.bot)
+            self.musicbot._watchdog.start()
+            rss_before, cpu_before, children_before = self.usage.rss(), self.usage.cpu(), self.usage.children_cpu()
+            lag = self.loop.create_task(self._sample_lag())
+            start = time.perf_counter()
+
+            rng = random.Random(self.seed)
+            simulated = [SimulatedGuild(self, self.bot.add_guild(100_000 + i), random.Random(rng.random())) for i in range(self.guilds)]
+            deadline = start + self.duration
+            tasks = []
+            for i, guild in enumerate(simulated):
+                tasks.append(self.loop.create_task(guild.run(deadline)))
+                await asyncio.sleep(self.ramp / self.guilds)
+            await asyncio.gather(*tasks)
+
+            elapsed = time.perf_counter() - start
+            rss, children_rss = self.usage.rss(), self.usage.children_rss()
+            cpu, children_cpu = self.usage.cpu() - cpu_before, self.usage.children_cpu() - children_before
+            playing = sum(1 for guild in simulated if guild._playing())
+            lag.cancel()
+            self.musicbot._watchdog.stop()
+            for guild in simulated:
+                await self.musicbot._leave(guild.guild)
+                self.musicbot._cleanup(guild.guild)
+        await server.stop()
+        return self.report(elapsed, rss - rss_before, children_rss, cpu, children_cpu, playing, server.requests)
+
+    def report(self, elapsed, rss, children_rss, cpu, children_cpu, playing, media_requests) -> dict:
+        from utils.watchdog import loop_stalls
+        results = self.results
+        def summary(values: List[float]) -> dict:
+            return {
+                'count': len(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p90_ms': percentile(values, 90) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': max(values, default=float('nan')) * 1000,
+            }
+        return {
+            'guilds': self.guilds,
+            'ffmpeg': self.ffmpeg,
+            'seconds': elapsed,
+            'playing_at_end': playing,
+            'media_requests': media_requests,
+            'commands': {name: dict(summary(values), errors=results.errors[name]) for name, values in results.latencies.items()},
+            'time_to_first_audio': summary(results.first_audio),
+            'loop_lag': summary(results.lag),
+            'loop_stalls': loop_stalls.value(),
+            'cpu': {
+                'bot_percent': cpu / elapsed * 100,
+                'ffmpeg_percent': children_cpu / elapsed * 100,
+                'per_guild_percent': (cpu + children_cpu) / elapsed * 100 / self.guilds,
+            },
+            'memory': {
+                'bot_rss_growth_mb': rss / 2 ** 20,
+                'ffmpeg_rss_mb': children_rss / 2 ** 20,
+                'per_guild_kb': (rss + children_rss) / self.guilds / 1024,
+            },
+        }
+
+def print_report(report: dict):
+    print(f"\n{report['guilds']} guilds for {report['seconds']:.1f}s, "
+          f"{'ffmpeg' if report['ffmpeg'] else 'silent sources'}, {report['playing_at_end']} still playing at the end")
+    print(f"{'':<22}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    rows = [(name, stats) for name, stats in report['commands'].items()]
+    rows += [('time to first audio', report['time_to_first_audio']), ('event loop lag', report['loop_lag'])]
+    for name, stats in rows:
+        print(f"{name:<22}{stats['count']:>8}{stats['p50_ms']:>10.1f}{stats['p90_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}{stats.get('errors', ''):>8}")
+    cpu, memory = report['cpu'], report['memory']
+    print(f"cpu     bot {cpu['bot_percent']:.1f}% | ffmpeg {cpu['ffmpeg_percent']:.1f}% | {cpu['per_guild_percent']:.2f}% per guild")
+    print(f"memory  bot +{memory['bot_rss_growth_mb']:.1f}MB | ffmpeg {memory['ffmpeg_rss_mb']:.1f}MB | {memory['per_guild_kb']:.0f}KB per guild")
+    print(f"event loop stalls {report['loop_stalls']:.0f} | media requests {report['media_requests']}")
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='simulate many guilds using the music bot at once')
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds every guild keeps sending commands')
+    parser.add_argument('--interval', type=float, default=5.0, help='mean seconds between commands of one guild')
+    parser.add_argument('--ramp', type=float, default=5.0, help='seconds over which the guilds start')
+    parser.add_argument('--song-seconds', type=int, default=30, help='how long every song plays')
+    parser.add_argument('--initial-songs', type=int, default=3)
+    parser.add_argument('--ffmpeg', dest='ffmpeg', action='store_true', default=None, help='decode through ffmpeg (default when installed)')
+    parser.add_argument('--no-ffmpeg', dest='ffmpeg', action='store_false')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the report to this file')
+    parser.add_argument('--verbose', action='store_true', help='print every failed command')
+    args = parser.parse_args(argv)
+
+    test = LoadTest(args.guilds, args.duration, args.interval, args.ramp, args.song_seconds,
+                    args.initial_songs, args.ffmpeg, args.seed, args.verbose)
+    report = asyncio.run(test.run())
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
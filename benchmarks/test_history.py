@@ -0,0 +1,34 @@
+'''
+the play history keeps plays whose write failed
+'''
+import asyncio, itertools
+from types import SimpleNamespace
+
+import pytest
+
+import utils.history
+from utils.history import PlayHistory
+from utils.store import store
+
+_guild_ids = itertools.count(91_000)
+
+def test_flush_retries(catalogue, monkeypatch):
+    guild_id, requester = next(_guild_ids), SimpleNamespace(id=4000, name='user')
+    songs = [SimpleNamespace(video_id=video['video_id'], info=video, requester=requester) for video in catalogue.videos[:3]]
+    history = PlayHistory()
+    append_plays = store.append_plays
+    def busy(*args):
+        # a play recorded while the write is running is kept as well
+        history.record(guild_id, songs[2], 1.7e9 + 2, 30, True)
+        raise RuntimeError('database is locked')
+
+    async def run():
+        history.record(guild_id, songs[0], 1.7e9, 100, False)
+        history.record(guild_id, songs[1], 1.7e9 + 1, 50, True)
+        monkeypatch.setattr(utils.history.store, 'append_plays', busy)
+        with pytest.raises(RuntimeError):
+            await history.flush(guild_id)
+        monkeypatch.setattr(utils.history.store, 'append_plays', append_plays)
+        return await history.stats(guild_id)
+    stats = asyncio.run(run())
+    assert (stats['total']['plays'], stats['total']['skips']) == (3, 2)
@@ -0,0 +1,52 @@
+'''
+fair mode ordering, the queue benchmarks only measure it
+'''
+import random
+
+from utils.playlist import PlaylistBase, LoopState, Song
+from fakes import FakeGuild
+
+def test_fair_keeps_order(catalogue):
+    video_ids = [video['video_id'] for video in catalogue.videos[:8]]
+    guild = FakeGuild(2)
+    a, b, c = (guild.member(200 + i, name) for i, name in enumerate('abc'))
+    playlist = PlaylistBase()
+    for video_id, requester in zip(video_ids, [a, a, a, a, b]):
+        playlist.add(Song.from_snapshot(video_id, requester))
+    # switched on with a queue that is not in rounds, a requester's songs still play in the order they were queued
+    playlist.fair = True
+    playlist.add(Song.from_snapshot(video_ids[5], c))
+    playlist.add(Song.from_snapshot(video_ids[6], b))
+    queued = [song for song in playlist.order if song.requester.id == b.id]
+    assert [song.video_id for song in queued] == [video_ids[4], video_ids[6]]
+    # a song moved ahead does not pull the requester's next one before the others
+    playlist.move_to(playlist.order.index(queued[1]), 1)
+    playlist.add(Song.from_snapshot(video_ids[7], b))
+    assert playlist.order.index(queued[0]) < len(playlist.order) - 1 and playlist.order[-1].requester.id == b.id
+
+def test_fair_invariants(catalogue):
+    # whatever happened to the queue, a fair add lands after its requester's songs
+    rng = random.Random(0)
+    guild = FakeGuild(3)
+    members = [guild.member(300 + i, f'member{i}') for i in range(5)]
+    video_ids = [video['video_id'] for video in catalogue.videos]
+    playlist = PlaylistBase(fair=True)
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.5 or len(playlist.order) < 2:
+            requester = rng.choice(members)
+            index = playlist.add(Song.from_snapshot(rng.choice(video_ids), requester))
+            assert all(song.requester is not requester for song in playlist.order[index + 1:])
+        elif action < 0.65:
+            playlist.remove(rng.randrange(len(playlist.order)))
+        elif action < 0.8:
+            playlist.swap(rng.randrange(len(playlist.order)), rng.randrange(len(playlist.order)))
+        elif action < 0.95:
+            playlist.move_to(rng.randrange(len(playlist.order)), rng.randrange(-3, len(playlist.order) + 3))
+        else:
+            playlist.loop_state = rng.choice([LoopState.NOTHING, LoopState.PLAYLIST])
+            playlist.rule()
+        if len(playlist.order) > 40:
+            playlist.remove(0)
+        assert sorted(playlist._counts.items()) == sorted(
+            (id, sum(song.requester.id == id for song in playlist.order)) for id in {song.requester.id for song in playlist.order})
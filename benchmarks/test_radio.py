@@ -0,0 +1,22 @@
+'''
+autoplay seeded from the play history in the store
+'''
+import asyncio
+
+from utils.playlist import Song
+from utils.radio import Radio, RadioState
+from utils.history import PlayHistory
+
+def test_seed(offline, requester):
+    # a restarted bot goes on from the play history in the store
+    songs = [Song(url, requester) for url in offline.urls(6)]
+    history = PlayHistory()
+    async def run():
+        for i, song in enumerate(songs[:5]):
+            history.record(requester.guild.id, song, 1.7e9 + i, 100, False)
+        await history.flush()
+        state = RadioState(requester.guild.id)
+        state.history.append(songs[5].info)
+        await Radio()._seed(state)
+        return [info['video_id'] for info in state.history]
+    assert asyncio.run(run()) == [song.video_id for song in songs]
@@ -0,0 +1,51 @@
+'''
+saved playlists: export / import round trips, untrusted files and owners
+'''
+import asyncio, itertools, json
+
+import pytest
+
+import utils.saved
+from utils.saved import SavedPlaylistError, export_json, export_m3u
+
+_guild_ids = itertools.count(96_000)
+
+@pytest.mark.parametrize('format', ['json', 'm3u'])
+def test_export_import(saved, offline, requester, format):
+    guild_id = next(_guild_ids)
+    asyncio.run(saved.save_youtube(guild_id, 'mix', requester.id, offline.playlists[0]['url']))
+    infos = asyncio.run(saved.load(guild_id, 'mix'))
+    text = export_json('mix', infos) if format == 'json' else export_m3u(infos)
+    # m3u only carries urls, they are resolved once while importing
+    assert asyncio.run(saved.import_file(guild_id, 'copy', requester.id, text)) == (50, 0)
+    copy = asyncio.run(saved.load(guild_id, 'copy'))
+    assert [(info['video_id'], info['title']) for info in copy] == [(info['video_id'], info['title']) for info in infos]
+    assert asyncio.run(saved.names(guild_id)) == [('copy', 50), ('mix', 50)]
+
+def test_import_untrusted(saved, offline, requester):
+    guild_id = next(_guild_ids)
+    asyncio.run(saved.save_youtube(guild_id, 'mix', requester.id, offline.playlists[0]['url']))
+    infos = asyncio.run(saved.load(guild_id, 'mix'))
+    forged = [dict(infos[0], title='forged'), dict(infos[1], thumbnail_url='https://evil.example/x.png'), dict(infos[2], length='1')]
+    asyncio.run(saved.import_file(guild_id, 'forged', requester.id, json.dumps({'tracks': forged})))
+    # valid metadata from a file never replaces the known one, invalid metadata is resolved again
+    assert [info['title'] for info in asyncio.run(saved.load(guild_id, 'forged'))] == [info['title'] for info in infos[:3]]
+    assert asyncio.run(saved.load(guild_id, 'forged'))[1]['thumbnail_url'] == infos[1]['thumbnail_url']
+
+def test_owner(saved, offline, requester):
+    guild_id, other = next(_guild_ids), requester.id + 1
+    asyncio.run(saved.save_youtube(guild_id, 'mix', requester.id, offline.playlists[0]['url']))
+    text = export_m3u(asyncio.run(saved.load(guild_id, 'mix'))[:2])
+    with pytest.raises(SavedPlaylistError):
+        asyncio.run(saved.import_file(guild_id, 'mix', other, text))
+    with pytest.raises(SavedPlaylistError):
+        asyncio.run(saved.delete(guild_id, 'mix', other))
+    assert asyncio.run(saved.names(guild_id)) == [('mix', 50)]
+    assert asyncio.run(saved.import_file(guild_id, 'mix', other, text, manager=True)) == (2, 0)
+    asyncio.run(saved.delete(guild_id, 'mix', other))
+    assert asyncio.run(saved.names(guild_id)) == []
+
+def test_cap(saved, offline, requester, monkeypatch):
+    monkeypatch.setattr(utils.saved, 'SAVED_PLAYLIST_MAX', 10)
+    # the rest of a longer playlist is left out, not reported as failed
+    assert asyncio.run(saved.save_youtube(next(_guild_ids), 'mix', requester.id, offline.playlists[0]['url'])) == (10, 0)
@@ -1,30 +1,98 @@
 bot_version = 'LOCAL DEVELOPMENT'
 
+import time
+# cold start profile, seconds since the interpreter reached this line
+_started = time.perf_counter()
+_startup: dict = {}
+
+def _mark(stage: str):
+    if stage not in _startup:
+        _startup[stage] = time.perf_counter() - _started
+
 from typing import *
 import os, dotenv, sys
+import multiprocessing
 
 import discord
 from discord.ext import commands
 
-print(f'''
-Current Version
-{sys.version}
-''')
-
 dotenv.load_dotenv()
 TOKEN = os.getenv('TOKEN')
+# PROCESSES > 1 spreads the shards over that many worker processes,
+# SHARD_COUNT defaults to one shard per process
+PROCESSES = int(os.getenv('PROCESSES', 1))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', PROCESSES))
+# SYNC_COMMANDS=1 pushes the slash commands to discord on startup, only
+# needed after they changed (the owner can also run %sync)
+SYNC_COMMANDS = os.getenv('SYNC_COMMANDS', '0') == '1'
+# GATEWAY_PROFILE decides what discord sends and what discord.py caches
+#   minimal  slash commands only: guilds and voice states
+#   default  minimal plus guild messages and their content for % commands
+#   full     every intent, every member chunked at startup (the old setup)
+# MEMBER_CACHE=none|voice|all overrides the member cache of the profile, the
+# bot's own member (guild.me) is cached regardless
+GATEWAY_PROFILE = os.getenv('GATEWAY_PROFILE', 'default')
+MEMBER_CACHE = os.getenv('MEMBER_CACHE')
 
-presence = discord.Game(name='播放音樂 | $play')
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='%', intents=intents, help_command=None, activity=presence, status=discord.Status.online)
+def gateway_options(profile: str = GATEWAY_PROFILE, member_cache: str = MEMBER_CACHE) -> dict:
+    if profile == 'full':
+        intents = discord.Intents.all()
+    elif profile in ('minimal', 'default'):
+        intents = discord.Intents(guilds=True, voice_states=True)
+        if profile == 'default':
+            intents.guild_messages = intents.message_content = True
+    else:
+        raise ValueError(f'unknown GATEWAY_PROFILE {profile!r}')
+    member_cache = member_cache or ('all' if profile == 'full' else 'voice')
+    if member_cache == 'all':
+        flags = discord.MemberCacheFlags.from_intents(intents)
+    elif member_cache == 'voice':
+        flags = discord.MemberCacheFlags.none()
+        flags.voice = True
+    elif member_cache == 'none':
+        flags = discord.MemberCacheFlags.none()
+    else:
+        raise ValueError(f'unknown MEMBER_CACHE {member_cache!r}')
+    return {'intents': intents, 'member_cache_flags': flags, 'chunk_guilds_at_startup': profile == 'full'}
 
-from utils import *
+class Bot(commands.AutoShardedBot):
+    async def get_context(self, origin, /, *, cls=None):
+        from utils import MusicContext
+        return await super().get_context(origin, cls=cls or MusicContext)
 
-@bot.event
-async def on_ready():
-    await bot.add_cog(MusicBot(bot))
-    await bot.cogs.get('MusicBot').resolve_ui()
-    print(f'''
+def create_bot(shard_ids: List[int] = None, shard_count: int = None) -> commands.Bot:
+    presence = discord.Game(name='播放音樂 | $play')
+    bot = Bot(command_prefix='%', help_command=None, activity=presence, status=discord.Status.online,
+              shard_ids=shard_ids, shard_count=shard_count, **gateway_options())
+
+    from utils import MusicBot
+    _mark('imports')
+
+    async def setup_hook():
+        # runs once before connecting, on_ready fires again on every reconnect
+        await bot.add_cog(MusicBot(bot))
+        if SYNC_COMMANDS:
+            await bot.tree.sync()
+        _mark('setup')
+    bot.setup_hook = setup_hook
+
+    @bot.listen('on_command_completion')
+    async def first_response(ctx: commands.Context):
+        if 'first_command' in _startup:
+            return
+        _mark('first_command')
+        print(f"[Startup] First command response {_startup['first_command']:.2f}s after launch")
+
+    @bot.event
+    async def on_ready():
+        await bot.cogs.get('MusicBot').resolve_ui()
+        await bot.cogs.get('MusicBot').restore()
+        if 'ready' not in _startup:
+            _mark('ready')
+            print('[Startup] ' + ' | '.join(f'{stage} {seconds:.2f}s' for stage, seconds in _startup.items()))
+            print(f'[Startup] {GATEWAY_PROFILE} profile | {len(bot.guilds)} guilds | '
+                  f'{sum(len(guild.members) for guild in bot.guilds)} members cached | {len(bot.users)} users cached')
+        print(f'''
         =========================================
         Codename TKablent | Version Alpha
         Copyright 2022-present @ TK Entertainment
@@ -32,6 +100,7 @@ async def on_ready():
         =========================================
 
         Discord Bot TOKEN | Vaild 有效
+        Shards {bot.shard_ids} / {bot.shard_count}
 
         If there is any problem, open an Issue with log
         else no any response or answer
@@ -42,24 +111,53 @@ async def on_ready():
         即代表此機器人已成功開機
     ''')
 
-try:
-    bot.run(TOKEN)
-except AttributeError:
-    print(f'''
+    return bot
+
+def run(shard_ids: List[int] = None, shard_count: int = None):
+    bot = create_bot(shard_ids, shard_count)
+    try:
+        bot.run(TOKEN)
+    except AttributeError:
+        print(f'''
     =========================================
     Codename TKablent | Version Alpha
     Copyright 2022-present @ TK Entertainment
     Shared under CC-NC-SS-4.0 license
     =========================================
-    
+
     Discord Bot TOKEN | Invaild 無效
 
     我們在準備您的機器人時發生了一點問題
     We encountered some problem when the bot is getting ready
-    
+
     似乎您提供在 .env 檔案中的 TOKEN 是無效的
     請確認您已在 .env 檔案中輸入有效且完整的 TOKEN
     It looks like your TOKEN is invaild
     Please make sure that your Discord Bot TOKEN is already in .env file
     and it's a VAILD TOKEN.
-    ''')
\ No newline at end of file
+    ''')
+
+def launch(processes: int, shard_count: int):
+    # every process owns a disjoint set of shards, discord routes a guild to
+    # shard (guild_id >> 22) % shard_count so no guild is served twice
+    ctx = multiprocessing.get_context('spawn')
+    workers = []
+    for idx in range(processes):
+        shard_ids = [shard for shard in range(shard_count) if shard % processes == idx]
+        if not shard_ids:
+            continue
+        worker = ctx.Process(target=run, args=(shard_ids, shard_count), name=f'tkablent-shard-{idx}')
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+
+if __name__ == '__main__':
+    print(f'''
+Current Version
+{sys.version}
+''')
+    if PROCESSES > 1:
+        launch(PROCESSES, SHARD_COUNT)
+    else:
+        run()
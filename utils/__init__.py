@@ -1,5 +1,11 @@
 from .playlist import Playlist, Song
 from .ytdl import YTDL
 from .player import Player
-from .ui import UI
-from .player import MusicBot
\ No newline at end of file
+from .player import MusicBot, MusicContext
+
+def __getattr__(name):
+    # the UI module is only imported when the cog builds it after login
+    if name == 'UI':
+        from .ui import UI
+        return UI
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,205 @@
+from typing import *
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools, multiprocessing, threading
+
+from discord import AudioSource
+
+# frames asked from a worker at a time, and how low the local buffer may go
+# before the next batch is requested (50 frames = 1 second)
+BATCH = 25
+LOW_WATERMARK = 25
+READ_TIMEOUT = 10.0
+
+class _Session:
+    '''worker side of one playing source: ffmpeg -> volume -> opus'''
+    def __init__(self, url: str, ffmpeg_options: dict, volume: float):
+        from discord.opus import Encoder
+        from .ffmpeg import SupervisedFFmpegPCMAudio
+        from .dsp import volume_source
+        self.source = volume_source(SupervisedFFmpegPCMAudio(url, **ffmpeg_options), volume)
+        self.encoder = Encoder()
+        self.finished: bool = False
+        self.lock = threading.Lock()
+
+    def read(self, frames: int) -> List[bytes]:
+        packets = []
+        with self.lock:
+            for _ in range(frames):
+                if self.finished:
+                    break
+                data = self.source.read()
+                if len(data) != self.encoder.FRAME_SIZE:
+                    self.finished = True
+                    break
+                packets.append(self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME))
+        return packets
+
+    def cleanup(self):
+        with self.lock:
+            self.finished = True
+            self.source.cleanup()
+
+def _worker_main(conn):
+    '''
+    audio worker process: owns the ffmpeg pipelines and opus encoders for
+    the sessions it is given and answers frame requests from the gateway
+    '''
+    sessions: Dict[int, _Session] = {}
+    send_lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=8)
+
+    def send(*message):
+        with send_lock:
+            conn.send(message)
+
+    def serve(session_id: int, frames: int):
+        session = sessions.get(session_id)
+        if session is None:
+            return send('end', session_id)
+        packets = session.read(frames)
+        if packets:
+            send('frames', session_id, packets)
+        if session.finished:
+            send('end', session_id)
+
+    while True:
+        try:
+            op, session_id, *args = conn.recv()
+        except EOFError:
+            break
+        if op == 'open':
+            try:
+                sessions[session_id] = _Session(*args)
+            except Exception as e:
+                send('error', session_id, repr(e))
+        elif op == 'need':
+            executor.submit(serve, session_id, *args)
+        elif op == 'volume':
+            if session_id in sessions:
+                sessions[session_id].source.volume = args[0]
+        elif op == 'close':
+            session = sessions.pop(session_id, None)
+            if session is not None:
+                executor.submit(session.cleanup)
+        elif op == 'shutdown':
+            break
+    for session in sessions.values():
+        session.cleanup()
+    executor.shutdown(wait=False)
+
+class RemoteOpusSource(AudioSource):
+    '''gateway side of a session, hands pre-encoded opus packets to the voice client'''
+    def __init__(self, worker: '_WorkerHandle', session_id: int, volume: float):
+        self.worker = worker
+        self.session_id: int = session_id
+        self.error: Optional[str] = None
+        self._volume: float = volume
+        self._packets: Deque[bytes] = deque()
+        self._requested: bool = False
+        self._ended: bool = False
+        self._cond = threading.Condition()
+
+    def is_opus(self) -> bool:
+        return True
+
+    @property
+    def volume(self) -> float:
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = value
+        self.worker.send('volume', self.session_id, value)
+
+    def feed(self, packets: List[bytes]):
+        with self._cond:
+            self._packets.extend(packets)
+            self._requested = False
+            self._cond.notify_all()
+
+    def end(self, error: str = None):
+        with self._cond:
+            self.error = error
+            self._ended = True
+            self._cond.notify_all()
+
+    def read(self) -> bytes:
+        with self._cond:
+            if len(self._packets) < LOW_WATERMARK and not self._requested and not self._ended:
+                self._requested = True
+                self.worker.send('need', self.session_id, BATCH)
+            if not self._packets and not self._ended:
+                self._cond.wait_for(lambda: self._packets or self._ended, timeout=READ_TIMEOUT)
+            return self._packets.popleft() if self._packets else b''
+
+    def cleanup(self):
+        self.end()
+        self.worker.close(self)
+
+class _WorkerHandle:
+    def __init__(self, ctx, idx: int):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), name=f'tkablent-audio-{idx}', daemon=True)
+        self.process.start()
+        child.close()
+        self.sources: Dict[int, RemoteOpusSource] = {}
+        self._send_lock = threading.Lock()
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+    def send(self, *message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def close(self, source: RemoteOpusSource):
+        if self.sources.pop(source.session_id, None) is not None:
+            self.send('close', source.session_id)
+
+    def _receive(self):
+        while True:
+            try:
+                op, session_id, *args = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            source = self.sources.get(session_id)
+            if source is None:
+                continue
+            if op == 'frames':
+                source.feed(args[0])
+            elif op == 'end':
+                source.end()
+            elif op == 'error':
+                source.end(args[0])
+        # worker died, let every player it served run out instead of hanging
+        for source in list(self.sources.values()):
+            source.end('audio worker exited')
+
+class AudioWorkerPool:
+    '''
+    decode and opus encoding run in separate processes, the command process
+    only sends play/seek/volume/stop intents and forwards the encoded packets
+    '''
+    def __init__(self, processes: int):
+        ctx = multiprocessing.get_context('spawn')
+        self._workers: List[_WorkerHandle] = [_WorkerHandle(ctx, idx) for idx in range(processes)]
+        self._ids = itertools.count(1)
+
+    def worker_for(self, guild_id: int) -> _WorkerHandle:
+        # keep a guild on the same worker so its seeks reuse a warm process
+        return self._workers[guild_id % len(self._workers)]
+
+    def open(self, guild_id: int, url: str, ffmpeg_options: dict, volume: float) -> RemoteOpusSource:
+        worker = self.worker_for(guild_id)
+        source = RemoteOpusSource(worker, next(self._ids), volume)
+        worker.sources[source.session_id] = source
+        worker.send('open', source.session_id, url, ffmpeg_options, volume)
+        return source
+
+    def shutdown(self):
+        for worker in self._workers:
+            try:
+                worker.send('shutdown', 0)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.process.join(timeout=5)
@@ -0,0 +1,190 @@
+from typing import *
+from collections import deque
+import os, math, audioop
+
+from discord import AudioSource, ClientException, PCMVolumeTransformer
+from discord.opus import Encoder as OpusEncoder
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FRAMES_PER_SEC = 50
+FRAME_SIZE = OpusEncoder.FRAME_SIZE # 20ms of 48kHz 16-bit stereo
+CHANNELS = OpusEncoder.CHANNELS
+
+class AudioProcessor(AudioSource):
+    '''
+    numpy replacement for PCMVolumeTransformer. frames are processed in
+    batches, volume changes ramp smoothly instead of jumping, peaks are
+    soft clipped and loudness can optionally be normalized
+    '''
+    def __init__(self, original: AudioSource, volume: float = 1.0, *,
+                 normalize: bool = False, gain_db: float = None,
+                 batch: int = 10, ramp: float = 0.2, target_db: float = -14.0):
+        if not isinstance(original, AudioSource):
+            raise TypeError(f'expected AudioSource not {original.__class__.__name__}.')
+        if original.is_opus():
+            raise ClientException('AudioSource must not be Opus encoded.')
+
+        self.original: AudioSource = original
+        self.batch: int = batch
+        self.ramp_frames: int = max(1, int(ramp * FRAMES_PER_SEC))
+        self.normalize: bool = normalize
+        # ReplayGain style track gain, applied on top of the volume. Song
+        # passes it from the loudness youtube measured for the track
+        self.track_gain: float = 10 ** (gain_db / 20) if gain_db is not None else 1.0
+        self._target_rms: float = 10 ** (target_db / 20)
+        self._mean_square: float = None
+        self._current: float = max(volume, 0.0)
+        self._volume: float = self._current
+        self._pending: Deque[bytes] = deque()
+
+    @property
+    def volume(self) -> float:
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        # the change is ramped in over the next batches, no stream restart needed
+        self._volume = max(value, 0.0)
+
+    def cleanup(self):
+        self._pending.clear()
+        self.original.cleanup()
+
+    def read(self) -> bytes:
+        if not self._pending:
+            self._fill()
+        return self._pending.popleft() if self._pending else b''
+
+    def _fill(self):
+        frames = []
+        for _ in range(self.batch):
+            data = self.original.read()
+            if len(data) != FRAME_SIZE:
+                break
+            frames.append(data)
+        if not frames:
+            return
+
+        samples = np.frombuffer(b''.join(frames), dtype=np.int16).astype(np.float32)
+        samples = samples.reshape(-1, CHANNELS) / 32768.0
+
+        curve = self._gain_curve(len(frames)) * self.track_gain
+        samples *= curve[:, None]
+        gain = float(curve.max())
+        if self.normalize:
+            normalize = self._normalize_gain(samples)
+            samples *= normalize
+            gain *= normalize
+        # decoded samples are within full scale, only a boost can push them past it
+        if gain > 1.0:
+            samples = self._soft_clip(samples)
+
+        out = (samples * 32767.0).astype(np.int16).tobytes()
+        self._pending.extend(out[i:i + FRAME_SIZE] for i in range(0, len(out), FRAME_SIZE))
+
+    def _gain_curve(self, frames: int):
+        per_frame = FRAME_SIZE // (2 * CHANNELS)
+        length = frames * per_frame
+        if self._current == self._volume:
+            return np.full(length, self._current, dtype=np.float32)
+        # move at most one batch worth of the ramp towards the target
+        step = (self._volume - self._current) * min(1.0, frames / self.ramp_frames)
+        end = self._current + step
+        if abs(self._volume - end) < 1e-4:
+            end = self._volume
+        curve = np.linspace(self._current, end, length, dtype=np.float32)
+        self._current = end
+        return curve
+
+    def _normalize_gain(self, samples) -> float:
+        # running loudness estimate, quiet passages (< -70 dBFS) are gated out
+        # like EBU R128 so fades and silence do not pump the gain up
+        mean_square = float(np.mean(samples * samples))
+        if mean_square > 1e-7:
+            if self._mean_square is None:
+                self._mean_square = mean_square
+            else:
+                self._mean_square += (mean_square - self._mean_square) * 0.05
+        if not self._mean_square:
+            return 1.0
+        gain = self._target_rms / (self._mean_square ** 0.5)
+        return min(max(gain, 0.25), 4.0)
+
+    @staticmethod
+    def _soft_clip(samples, threshold: float = 0.95):
+        peak = np.abs(samples)
+        over = peak > threshold
+        if over.any():
+            knee = 1.0 - threshold
+            samples[over] = np.sign(samples[over]) * (threshold + knee * np.tanh((peak[over] - threshold) / knee))
+        return samples
+
+def volume_source(original: AudioSource, volume: float, **kwargs) -> AudioSource:
+    '''use AudioProcessor when numpy is installed, PCMVolumeTransformer otherwise'''
+    if np is None:
+        return PCMVolumeTransformer(original, volume=volume)
+    kwargs.setdefault('normalize', bool(os.getenv('NORMALIZE')))
+    if kwargs['normalize']:
+        # the running normalization replaces the static track gain
+        kwargs.pop('gain_db', None)
+    return AudioProcessor(original, volume, **kwargs)
+
+def _mix(a: bytes, b: bytes, gain_a: float, gain_b: float) -> bytes:
+    if np is not None:
+        mixed = np.frombuffer(a, dtype=np.int16) * gain_a + np.frombuffer(b, dtype=np.int16) * gain_b
+        return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+    return audioop.add(audioop.mul(a, 2, gain_a), audioop.mul(b, 2, gain_b), 2)
+
+class CrossfadeSource(AudioSource):
+    '''
+    overlap the tail of the playing source with the head of the next one
+    using an equal power curve, then pass the next source straight through
+    '''
+    def __init__(self, current: AudioSource, following: AudioSource, length: float):
+        self.current: Optional[AudioSource] = current
+        self.following: AudioSource = following
+        self.frames: int = max(1, int(length * FRAMES_PER_SEC))
+        self.position: int = 0
+
+    @property
+    def done(self) -> bool:
+        return self.position >= self.frames
+
+    @property
+    def volume(self) -> float:
+        return getattr(self.following, 'volume', 1.0)
+
+    @volume.setter
+    def volume(self, value: float):
+        for source in (self.current, self.following):
+            if hasattr(source, 'volume'):
+                source.volume = value
+
+    def read(self) -> bytes:
+        if self.done:
+            return self.following.read()
+        head = self.following.read()
+        tail = self.current.read() if self.current is not None else b''
+        self.position += 1
+        if self.done:
+            self._drop_current()
+        if len(head) != FRAME_SIZE:
+            return tail
+        if len(tail) != FRAME_SIZE:
+            # current song ended before the fade did, keep ramping the new one in
+            tail = bytes(FRAME_SIZE)
+        t = self.position / self.frames
+        return _mix(tail, head, math.cos(t * math.pi / 2), math.sin(t * math.pi / 2))
+
+    def _drop_current(self):
+        if self.current is not None:
+            self.current.cleanup()
+            self.current = None
+
+    def cleanup(self):
+        self._drop_current()
+        self.following.cleanup()
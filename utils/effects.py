@@ -0,0 +1,125 @@
+from typing import *
+
+SAMPLE_RATE = 48000
+
+class EffectError(Exception): ...
+
+PRESETS: Dict[str, dict] = {
+    'nightcore': {'speed': 1.25, 'pitch': 1.25},
+    'vaporwave': {'speed': 0.8, 'pitch': 0.8},
+    'bassboost': {'bass': 10.0},
+    'daycore': {'speed': 0.85, 'pitch': 0.85},
+}
+
+def _atempo(rate: float) -> List[str]:
+    # a single atempo only accepts 0.5 ~ 2.0, chain them for anything outside
+    filters = []
+    while rate > 2.0:
+        filters.append('atempo=2.0')
+        rate /= 2.0
+    while rate < 0.5:
+        filters.append('atempo=0.5')
+        rate /= 0.5
+    if abs(rate - 1.0) > 1e-6:
+        filters.append(f'atempo={rate:.6f}')
+    return filters
+
+class AudioEffects:
+    '''per guild effect settings, rendered into an ffmpeg -af filter graph'''
+    def __init__(self):
+        self.speed: float = 1.0 # playback rate, changes the song clock
+        self.pitch: float = 1.0 # pitch ratio, independent from speed
+        self.bass: float = 0.0 # dB
+        self.treble: float = 0.0 # dB
+        self.equalizer: Dict[int, float] = {} # band centre Hz -> dB
+        self.preset: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.filter_graph != ''
+
+    @property
+    def rate(self) -> float:
+        '''media seconds played per wall clock second'''
+        return self.speed
+
+    def reset(self):
+        self.__init__()
+
+    def state(self) -> dict:
+        return dict(vars(self), equalizer=dict(self.equalizer))
+
+    def restore(self, state: dict):
+        '''undo every change made since state() was taken'''
+        self.__dict__.update(state, equalizer=dict(state['equalizer']))
+
+    def set_speed(self, speed: float):
+        if not 0.25 <= speed <= 4.0:
+            raise EffectError(f'speed must be between 0.25 and 4.0, got {speed}')
+        self.speed = speed
+        self.preset = None
+
+    def set_pitch(self, pitch: float):
+        if not 0.5 <= pitch <= 2.0:
+            raise EffectError(f'pitch must be between 0.5 and 2.0, got {pitch}')
+        self.pitch = pitch
+        self.preset = None
+
+    def set_bass(self, gain: float):
+        if not -20.0 <= gain <= 20.0:
+            raise EffectError(f'bass gain must be between -20 and 20 dB, got {gain}')
+        self.bass = gain
+        self.preset = None
+
+    def set_band(self, frequency: int, gain: float):
+        if not 20 <= frequency <= 20000 or not -20.0 <= gain <= 20.0:
+            raise EffectError(f'invalid equalizer band {frequency}Hz / {gain}dB')
+        if gain == 0:
+            self.equalizer.pop(frequency, None)
+        else:
+            self.equalizer[frequency] = gain
+        self.preset = None
+
+    def apply_preset(self, name: str):
+        if name not in PRESETS:
+            raise EffectError(f'unknown preset {name}')
+        self.reset()
+        for key, value in PRESETS[name].items():
+            setattr(self, key, value)
+        self.preset = name
+
+    @property
+    def filter_graph(self) -> str:
+        filters = []
+        if abs(self.pitch - 1.0) > 1e-6:
+            # asetrate shifts pitch and speed together, atempo then takes the
+            # speed part back so only the requested rate remains
+            filters.append(f'aresample={SAMPLE_RATE}')
+            filters.append(f'asetrate={round(SAMPLE_RATE * self.pitch)}')
+            filters.append(f'aresample={SAMPLE_RATE}')
+            filters.extend(_atempo(self.speed / self.pitch))
+        else:
+            filters.extend(_atempo(self.speed))
+        if self.bass:
+            filters.append(f'bass=g={self.bass}')
+        if self.treble:
+            filters.append(f'treble=g={self.treble}')
+        for frequency, gain in sorted(self.equalizer.items()):
+            filters.append(f'equalizer=f={frequency}:t=o:w=1:g={gain}')
+        return ','.join(filters)
+
+    def describe(self) -> str:
+        if self.preset is not None:
+            return self.preset
+        parts = []
+        if self.speed != 1.0:
+            parts.append(f'speed x{self.speed}')
+        if self.pitch != 1.0:
+            parts.append(f'pitch x{self.pitch}')
+        if self.bass:
+            parts.append(f'bass {self.bass:+}dB')
+        if self.treble:
+            parts.append(f'treble {self.treble:+}dB')
+        for frequency, gain in sorted(self.equalizer.items()):
+            parts.append(f'{frequency}Hz {gain:+}dB')
+        return ', '.join(parts)
@@ -0,0 +1,145 @@
+from typing import *
+import os, subprocess, threading, time
+
+from discord import FFmpegPCMAudio
+
+from .metrics import ffmpeg_spawns
+from .tracing import tracer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class FFmpegCapacityError(Exception): ...
+
+class ProcessInfo:
+    def __init__(self, guild_id: Optional[int], process: subprocess.Popen):
+        self.guild_id: Optional[int] = guild_id # None for pipelines shared by several guilds
+        self.process: subprocess.Popen = process
+        self.started: float = time.time()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def usage(self) -> Tuple[Optional[float], Optional[int]]:
+        '''cpu seconds and rss bytes of the process, None if unavailable'''
+        if psutil is not None:
+            try:
+                proc = psutil.Process(self.pid)
+                cpu = proc.cpu_times()
+                return cpu.user + cpu.system, proc.memory_info().rss
+            except psutil.Error:
+                return None, None
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                # the command name may contain spaces, fields start after ')'
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{self.pid}/statm') as f:
+                rss_pages = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            return None, None
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        return cpu, rss_pages * os.sysconf('SC_PAGE_SIZE')
+
+class FFmpegSupervisor:
+    '''keep track of every ffmpeg child, cap how many run at once and reap the dead ones'''
+    def __init__(self, limit: int):
+        self.limit: int = limit
+        self.spawned: int = 0
+        self._processes: Dict[int, ProcessInfo] = {}
+        self._reserved: int = 0 # slots taken by spawns that have not registered yet
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._processes)
+
+    def register(self, guild_id: Optional[int], process: subprocess.Popen):
+        with self._lock:
+            self._reserved -= 1
+            self._processes[process.pid] = ProcessInfo(guild_id, process)
+            self.spawned += 1
+
+    def unregister(self, process: subprocess.Popen):
+        # cleanup() may run twice, the second time the process is already gone
+        pid = getattr(process, 'pid', None)
+        if pid is None:
+            return
+        with self._lock:
+            self._processes.pop(pid, None)
+
+    def reserve(self):
+        '''take a slot for a spawn, it is handed back by register() or release()'''
+        self.reap()
+        with self._lock:
+            if len(self._processes) + self._reserved >= self.limit:
+                raise FFmpegCapacityError(f'ffmpeg process limit reached ({self.limit})')
+            self._reserved += 1
+
+    def release(self):
+        '''the reserved spawn failed'''
+        with self._lock:
+            self._reserved -= 1
+
+    def reap(self) -> int:
+        '''drop exited processes, poll() also collects zombies'''
+        with self._lock:
+            dead = [pid for pid, info in self._processes.items() if info.process.poll() is not None]
+            for pid in dead:
+                del self._processes[pid]
+        return len(dead)
+
+    def guild_processes(self, guild_id: int) -> List[ProcessInfo]:
+        with self._lock:
+            return [info for info in self._processes.values() if info.guild_id == guild_id]
+
+    def kill_guild(self, guild_id: int):
+        '''never waits, the killed processes are collected by the next reap()'''
+        for info in self.guild_processes(guild_id):
+            try:
+                info.process.kill()
+            except ProcessLookupError:
+                pass
+
+    def stats(self) -> List[dict]:
+        self.reap()
+        with self._lock:
+            processes = list(self._processes.values())
+        result = []
+        for info in processes:
+            cpu, rss = info.usage()
+            result.append({
+                'pid': info.pid,
+                'guild_id': info.guild_id,
+                'uptime': time.time() - info.started,
+                'cpu_seconds': cpu,
+                'rss_bytes': rss,
+            })
+        return result
+
+supervisor = FFmpegSupervisor(int(os.getenv('FFMPEG_LIMIT', 64)))
+
+class SupervisedFFmpegPCMAudio(FFmpegPCMAudio):
+    '''FFmpegPCMAudio that reports its process to the supervisor'''
+    def __init__(self, source, *, guild_id: Optional[int] = None, **kwargs):
+        self.guild_id: Optional[int] = guild_id
+        super().__init__(source, **kwargs)
+
+    def _spawn_process(self, args, **subprocess_kwargs) -> subprocess.Popen:
+        supervisor.reserve()
+        try:
+            with tracer.span('ffmpeg.spawn', guild=self.guild_id):
+                process = super()._spawn_process(args, **subprocess_kwargs)
+        except BaseException:
+            supervisor.release()
+            raise
+        supervisor.register(self.guild_id, process)
+        ffmpeg_spawns.inc()
+        return process
+
+    def cleanup(self):
+        process = self._process
+        super().cleanup()
+        supervisor.unregister(process)
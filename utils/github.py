@@ -1,4 +1,4 @@
-import requests, json, os, dotenv
+import json, os, dotenv
 
 dotenv.load_dotenv()
 
@@ -33,6 +33,8 @@ class GithubIssue:
             "SKIPFAIL": "機器人嘗試跳過音樂時失敗",
             "STOPFAIL": "機器人嘗試停止音樂時失敗",
             "VOLUMEADJUSTFAIL": "機器人嘗試調整音量時失敗",
+            "EFFECTFAIL": "機器人嘗試套用音效時失敗",
+            "CROSSFADEFAIL": "機器人嘗試調整淡入淡出長度時失敗",
             "SEEKFAIL": "機器人嘗試跳轉音樂時失敗",
             "REPLAYFAIL": "機器人嘗試重新播放音樂時失敗",
             "LOOPFAIL_SIG": "機器人嘗試切換重新播放功能時失敗",
@@ -77,6 +79,7 @@ class GithubIssue:
             "labels": ['bug', 'bug_from_bot']
             }
 
+        import requests # only needed once somebody actually reports a bug
         owo = requests.post(
             self.issue_url, 
             data=json.dumps(data),
@@ -0,0 +1,183 @@
+from typing import *
+import asyncio, collections, json, os, time
+from array import array
+
+from .store import store
+
+# plays a guild collects in memory before they are written as one block
+HISTORY_BLOCK = int(os.getenv('HISTORY_BLOCK', 256))
+# a guild with fewer plays is still written after this many seconds
+HISTORY_FLUSH = float(os.getenv('HISTORY_FLUSH', 300))
+# tracks played fewer times are left out of the skip rates
+STATS_MIN_PLAYS = int(os.getenv('STATS_MIN_PLAYS', 3))
+
+class PlayLog:
+    '''
+    plays of one guild not written yet, one array per column. video ids are
+    dictionary encoded, the track column holds indexes into `tracks`
+    '''
+    __slots__ = ('tracks', 'infos', 'names', 'track', 'requester', 'started', 'listened', 'skipped', 'created')
+
+    def __init__(self):
+        self.tracks: Dict[str, int] = {}
+        self.infos: Dict[str, dict] = {} # metadata of the tracks, saved with the block
+        self.names: Dict[int, str] = {}
+        self.track: array = array('H')
+        self.requester: array = array('Q')
+        self.started: array = array('d')
+        self.listened: array = array('f')
+        self.skipped: array = array('B')
+        self.created: float = time.monotonic()
+
+    def __len__(self):
+        return len(self.track)
+
+    def append(self, info: dict, requester_id: int, name: str, started: float, listened: float, skipped: bool):
+        index = self.tracks.setdefault(info['video_id'], len(self.tracks))
+        self.infos[info['video_id']] = info
+        self.names[requester_id] = name
+        self.track.append(index)
+        self.requester.append(requester_id)
+        self.started.append(started)
+        self.listened.append(max(listened, 0.0))
+        self.skipped.append(skipped)
+
+    def merge(self, later: 'PlayLog'):
+        '''append the plays of a log started after this one'''
+        videos = list(later.tracks)
+        for track, requester, started, listened, skipped in zip(later.track, later.requester, later.started, later.listened, later.skipped):
+            self.append(later.infos[videos[track]], requester, later.names[requester], started, listened, bool(skipped))
+
+    def block(self) -> dict:
+        '''the columns as stored, one blob each'''
+        return {
+            'first': self.started[0],
+            'count': len(self),
+            'tracks': json.dumps(list(self.tracks), separators=(',', ':')),
+            'track': self.track.tobytes(),
+            'requester': self.requester.tobytes(),
+            'started': self.started.tobytes(),
+            'listened': self.listened.tobytes(),
+            'skipped': self.skipped.tobytes(),
+        }
+
+    def totals(self) -> List[tuple]:
+        '''(kind, key, label, plays, skips, listened) the block adds to the running totals'''
+        videos = list(self.tracks)
+        totals = collections.defaultdict(lambda: [0, 0, 0.0])
+        for track, requester, listened, skipped in zip(self.track, self.requester, self.listened, self.skipped):
+            for key in (('track', videos[track]), ('requester', str(requester)), ('guild', '')):
+                row = totals[key]
+                row[0] += 1
+                row[1] += skipped
+                row[2] += listened
+        labels = {'track': {video_id: info['title'] for video_id, info in self.infos.items()}, 'requester': {str(id): name for id, name in self.names.items()}}
+        return [(kind, key, labels.get(kind, {}).get(key, ''), *row) for (kind, key), row in totals.items()]
+
+def decode_block(row: dict) -> List[dict]:
+    '''the plays of a stored block, oldest first'''
+    columns = {}
+    for name, code in (('track', 'H'), ('requester', 'Q'), ('started', 'd'), ('listened', 'f'), ('skipped', 'B')):
+        columns[name] = array(code)
+        columns[name].frombytes(row[name])
+    tracks = json.loads(row['tracks'])
+    return [{
+        'video_id': tracks[columns['track'][i]],
+        'requester': columns['requester'][i],
+        'started': columns['started'][i],
+        'listened': columns['listened'][i],
+        'skipped': bool(columns['skipped'][i]),
+    } for i in range(row['count'])]
+
+def recent_videos(guild_id: int, limit: int) -> List[dict]:
+    '''blocking, metadata of the latest distinct videos played in a guild, oldest first'''
+    latest: Dict[str, None] = {}
+    # a handful of blocks hold far more plays than the limit
+    for block in store.latest_play_blocks(guild_id, 8):
+        for play in reversed(decode_block(block)):
+            latest.setdefault(play['video_id'])
+            if len(latest) == limit:
+                break
+        if len(latest) == limit:
+            break
+    videos = store.videos(list(latest))
+    return [videos[video_id] for video_id in reversed(latest) if video_id in videos]
+
+class PlayHistory:
+    '''
+    append only play history of every guild. plays are kept in columns and
+    written a block at a time, together with running per track, per
+    requester and per guild totals, so stats() reads a handful of indexed
+    rows instead of scanning the history
+    '''
+    def __init__(self, block: int = HISTORY_BLOCK, interval: float = HISTORY_FLUSH):
+        self.block: int = block
+        self.interval: float = interval
+        self._pending: Dict[int, PlayLog] = {}
+        self._task: asyncio.Task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def record(self, guild_id: int, song, started: float, listened: float, skipped: bool):
+        log = self._pending.get(guild_id)
+        if log is None:
+            log = self._pending[guild_id] = PlayLog()
+        log.append(song.info, song.requester.id, song.requester.name, started, listened, skipped)
+        if len(log) == self.block: # once, the flush starts a new log
+            asyncio.get_running_loop().create_task(self._flush_logged(guild_id))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval / 4)
+            deadline = time.monotonic() - self.interval
+            for guild_id in [guild_id for guild_id, log in self._pending.items() if log.created < deadline]:
+                await self._flush_logged(guild_id)
+
+    async def _flush_logged(self, guild_id: int):
+        try:
+            await self.flush(guild_id)
+        except Exception as e:
+            print(f'[History] Failed to write the plays of guild {guild_id}: {e!r}')
+
+    async def flush(self, guild_id: int = None):
+        '''write the pending plays of one guild, or of all of them'''
+        guilds = [guild_id] if guild_id is not None else list(self._pending)
+        logs = [(guild_id, self._pending.pop(guild_id)) for guild_id in guilds if guild_id in self._pending]
+        if not logs:
+            return
+
+        written = set()
+        def write():
+            for guild_id, log in logs:
+                store.append_plays(guild_id, log.block(), log.totals(), list(log.infos.values()))
+                written.add(guild_id)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write)
+        except Exception:
+            # nothing is lost, the plays not written go back ahead of those recorded meanwhile
+            for guild_id, log in logs:
+                if guild_id not in written:
+                    if guild_id in self._pending:
+                        log.merge(self._pending[guild_id])
+                    self._pending[guild_id] = log
+            raise
+
+    async def stats(self, guild_id: int, limit: int = 5) -> dict:
+        await self.flush(guild_id)
+
+        def read() -> dict:
+            totals = store.play_totals(guild_id, 'guild', 'plays', 1)
+            return {
+                'total': totals[0] if totals else {'plays': 0, 'skips': 0, 'listened': 0.0},
+                'tracks': store.play_totals(guild_id, 'track', 'plays', limit),
+                'requesters': store.play_totals(guild_id, 'requester', 'plays', limit),
+                'skipped': [row for row in store.play_totals(guild_id, 'track', 'skip_rate', limit, STATS_MIN_PLAYS) if row['skips'] > 0],
+            }
+        return await asyncio.get_running_loop().run_in_executor(None, read)
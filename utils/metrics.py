@@ -0,0 +1,193 @@
+from typing import *
+import asyncio, bisect, math, os, threading, time
+
+class _Metric:
+    kind: str = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labels)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}'] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [f'{self.name}{self._format_labels(key)} {value}' for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    '''a gauge is either set directly or computed by `fn` at scrape time'''
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), fn: Callable[[], float] = None):
+        super().__init__(name, documentation, labels)
+        self.fn = fn
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.fn is not None:
+            try:
+                return [f'{self.name} {self.fn()}']
+            except Exception:
+                return []
+        with self._lock:
+            return [f'{self.name}{self._format_labels(key)} {value}' for key, value in self._values.items()]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def time(self, **labels) -> '_Timer':
+        return _Timer(self, labels)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                total = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    total += count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f'{self.name}_bucket{self._format_labels(key, {"le": le})} {total}')
+                lines.append(f'{self.name}_sum{self._format_labels(key)} {self._sums[key]}')
+                lines.append(f'{self.name}_count{self._format_labels(key)} {total}')
+        return lines
+
+class _Timer:
+    '''with histogram.time(backend='pytube'): ...'''
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+# extraction
+extraction_seconds = Histogram('tkablent_extraction_seconds', 'Time spent extracting metadata or stream urls', ('backend', 'op'))
+extraction_errors = Counter('tkablent_extraction_errors_total', 'Failed extractions', ('backend', 'op'))
+stream_url_cache = Counter('tkablent_stream_url_cache_total', 'Stream url lookups served from the song cache or resolved', ('result',))
+# playback
+time_to_first_audio = Histogram('tkablent_time_to_first_audio_seconds', 'Time from $play to the voice client starting playback')
+ffmpeg_spawns = Counter('tkablent_ffmpeg_spawns_total', 'FFmpeg processes spawned')
+loop_lag = Histogram('tkablent_event_loop_lag_seconds', 'How late the event loop woke up a sleeping task', buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+
+class MetricsServer:
+    '''serve the registry in prometheus text format (and the memory report as json), sample event loop lag'''
+    def __init__(self, musicbot, host: str = '127.0.0.1', port: int = None, lag_interval: float = 0.5):
+        self.musicbot = musicbot
+        self.host: str = host
+        self.port: int = port if port is not None else int(os.getenv('METRICS_PORT', 0))
+        self.lag_interval: float = lag_interval
+        self._runner = None
+        self._lag_task: asyncio.Task = None
+
+        from .ffmpeg import supervisor
+        bot = musicbot.bot
+        Gauge('tkablent_ffmpeg_processes', 'FFmpeg processes currently running', fn=lambda: len(supervisor))
+        Gauge('tkablent_ffmpeg_rss_bytes', 'Resident memory of all ffmpeg processes', fn=lambda: sum(p['rss_bytes'] or 0 for p in supervisor.stats()))
+        Gauge('tkablent_voice_sessions', 'Connected voice clients', fn=lambda: len(bot.voice_clients))
+        Gauge('tkablent_guilds', 'Guilds the bot is in', fn=lambda: len(bot.guilds))
+        Gauge('tkablent_queued_songs', 'Songs in all queues', fn=lambda: sum(len(p.order) for p in musicbot._playlist._guilds_info.values()))
+        Gauge('tkablent_queue_length_max', 'Longest queue of any guild', fn=lambda: max((len(p.order) for p in musicbot._playlist._guilds_info.values()), default=0))
+
+    async def start(self):
+        self._lag_task = self.musicbot.bot.loop.create_task(self._sample_lag())
+        if not self.port:
+            return
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        app.router.add_get('/memory', self._handle_memory)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        from aiohttp import web
+        return web.Response(text=registry.render(), content_type='text/plain')
+
+    async def _handle_memory(self, request):
+        from aiohttp import web
+        return web.json_response(self.musicbot.memory_report())
+
+    async def _sample_lag(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            loop_lag.observe(max(0.0, time.perf_counter() - start - self.lag_interval))
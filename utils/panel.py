@@ -0,0 +1,251 @@
+from typing import *
+import asyncio, os, time
+
+import discord
+
+from .playlist import LoopState
+from .metrics import Counter
+from .registry import registry
+from .timerwheel import wheel
+
+# minimum seconds between two edits of one panel, everything that changes in
+# between is folded into the next edit
+PANEL_EDIT_INTERVAL = float(os.getenv('PANEL_EDIT_INTERVAL', 1.5))
+VOLUME_STEP = 0.1
+# PROGRESS_INTERVAL > 0 shows a live progress bar redrawn about that often.
+# all bars share PROGRESS_EDITS_PER_SECOND, with many sessions each bar
+# slows down instead of the bot running into discord's rate limits
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 0))
+PROGRESS_EDITS_PER_SECOND = float(os.getenv('PROGRESS_EDITS_PER_SECOND', 5))
+
+panel_updates = Counter('tkablent_panel_updates_total', 'Now playing panel changes requested')
+panel_writes = Counter('tkablent_panel_writes_total', 'Now playing panel messages sent or edited', ('kind',))
+
+class PanelView(discord.ui.View):
+    '''
+    the panel buttons. one persistent instance (fixed custom ids, no timeout)
+    serves the panels of every guild, also the ones sent before a restart
+    '''
+    def __init__(self, editor: 'PanelEditor'):
+        super().__init__(timeout=None)
+        self.editor: PanelEditor = editor
+
+    @property
+    def musicbot(self):
+        return self.editor.ui.musicbot
+
+    async def _control(self, interaction: discord.Interaction, action: Callable[[discord.Guild], None]):
+        guild = interaction.guild
+        voice_client = guild.voice_client if guild is not None else None
+        voice = getattr(interaction.user, 'voice', None)
+        if voice_client is None or voice is None or voice.channel != voice_client.channel:
+            await interaction.response.send_message('**:no_entry: | 請先加入機器人所在的語音頻道**', ephemeral=True)
+            return
+        try:
+            action(guild)
+        except Exception as e:
+            await interaction.response.send_message(f'**:no_entry: | 操作失敗**\n{e}', ephemeral=True)
+            return
+        # acknowledge without a message, the panel edit shows the result
+        await interaction.response.defer()
+        self.editor.update(guild.id)
+
+    def _toggle_pause(self, guild: discord.Guild):
+        if guild.voice_client.is_paused():
+            self.musicbot._resume(guild)
+        else:
+            self.musicbot._pause(guild)
+        self.editor.ui[guild.id].status = None
+
+    def _skip(self, guild: discord.Guild):
+        self.musicbot._skip(guild)
+        self.editor.ui.SkipProceed(guild.id)
+
+    def _cycle_loop(self, guild: discord.Guild):
+        # off -> single -> whole queue -> off
+        playlist = self.musicbot._playlist
+        state = playlist[guild.id].loop_state
+        if state == LoopState.PLAYLIST:
+            playlist.playlist_loop(guild.id)
+        elif state == LoopState.NOTHING:
+            playlist.single_loop(guild.id)
+        else:
+            playlist.single_loop(guild.id)
+            playlist.playlist_loop(guild.id)
+
+    def _step_volume(self, guild: discord.Guild, step: float):
+        volume = min(max(round(self.musicbot[guild.id].volume_level + step, 2), 0.0), 2.0)
+        self.musicbot._volume(guild, volume)
+        self.editor.ui[guild.id].mute = volume == 0
+
+    @discord.ui.button(emoji='⏯️', style=discord.ButtonStyle.blurple, custom_id='tkablent:panel:pause')
+    async def pause(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._control(interaction, self._toggle_pause)
+
+    @discord.ui.button(emoji='⏭️', style=discord.ButtonStyle.blurple, custom_id='tkablent:panel:skip')
+    async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._control(interaction, self._skip)
+
+    @discord.ui.button(emoji='🔁', style=discord.ButtonStyle.gray, custom_id='tkablent:panel:loop')
+    async def repeat(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._control(interaction, self._cycle_loop)
+
+    @discord.ui.button(emoji='🔉', style=discord.ButtonStyle.gray, custom_id='tkablent:panel:volume_down')
+    async def volume_down(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._control(interaction, lambda guild: self._step_volume(guild, -VOLUME_STEP))
+
+    @discord.ui.button(emoji='🔊', style=discord.ButtonStyle.gray, custom_id='tkablent:panel:volume_up')
+    async def volume_up(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._control(interaction, lambda guild: self._step_volume(guild, VOLUME_STEP))
+
+    @discord.ui.button(emoji='📜', style=discord.ButtonStyle.gray, custom_id='tkablent:panel:queue', row=1)
+    async def queue(self, interaction: discord.Interaction, button: discord.ui.Button):
+        playlist = self.musicbot._playlist[interaction.guild.id]
+        if len(playlist.order) < 2:
+            await interaction.response.send_message('**:information_source: | 目前沒有任何歌曲待播中**', ephemeral=True)
+        else:
+            await interaction.response.send_message(embed=self.editor.ui._QueueEmbed(playlist, 0), ephemeral=True)
+
+class PanelEditor:
+    '''
+    keeps one now playing message per guild and edits it in place. update()
+    only marks the panel stale and the latest state is written at most once
+    every `interval` seconds, so a burst of changes (skip, loop, volume
+    presses...) costs a single edit. the wait runs on the shared timer
+    wheel, a task only exists while a write is in flight
+    '''
+    def __init__(self, ui, interval: float = PANEL_EDIT_INTERVAL):
+        self.ui = ui
+        self.interval: float = interval
+        self._view: PanelView = None
+        self._bars: int = 0 # live progress bars waiting for their next redraw
+
+    def view(self) -> PanelView:
+        # a View needs a running loop, so it is built on first use
+        if self._view is None:
+            self._view = PanelView(self)
+            self.ui.bot.add_view(self._view)
+        return self._view
+
+    def update(self, guild_id: int, create: bool = False):
+        '''redraw the panel soon, `create` posts one if the guild has none'''
+        info = self.ui[guild_id]
+        if info.playinfo is None and not create:
+            return
+        panel_updates.inc()
+        info.panel_stale = True
+        if info.panel_task is None and info.panel_timer is None:
+            self._schedule_flush(guild_id)
+
+    def _schedule_flush(self, guild_id: int):
+        info = self.ui[guild_id]
+        wait = info.panel_edited + self.interval - time.monotonic()
+        if wait > 0:
+            info.panel_timer = wheel.call_later(wait, self._flush_due, guild_id)
+        else:
+            info.panel_task = asyncio.get_running_loop().create_task(self._flush(guild_id))
+
+    def _flush_due(self, guild_id: int):
+        info = self.ui[guild_id]
+        info.panel_timer = None
+        info.panel_task = asyncio.get_running_loop().create_task(self._flush(guild_id))
+
+    async def _flush(self, guild_id: int):
+        info = self.ui[guild_id]
+        try:
+            info.panel_stale = False
+            await self._write(guild_id)
+        finally:
+            info.panel_task = None
+            # changed while the write was in flight
+            if info.panel_stale:
+                self._schedule_flush(guild_id)
+
+    async def _write(self, guild_id: int):
+        info = self.ui[guild_id]
+        render = self.ui._PanelContent(guild_id)
+        channel = self.ui.musicbot[guild_id].text_channel
+        if render is None or channel is None:
+            return
+        render['view'] = self.view()
+        message = info.playinfo
+        if message is not None and message.channel.id != channel.id:
+            # playback moved to another text channel, the panel follows it
+            await self._detach(message)
+            message = None
+        info.panel_edited = time.monotonic()
+        try:
+            if message is not None:
+                await message.edit(**render)
+                panel_writes.inc(kind='edit')
+                self._schedule_progress(guild_id)
+                return
+        except discord.NotFound:
+            pass # deleted by someone, post a new one
+        except discord.HTTPException as e:
+            print(f'[Panel] Failed to edit the panel of guild {guild_id}: {e!r}')
+            return
+        info.playinfo = await channel.send(**render)
+        panel_writes.inc(kind='send')
+        self._schedule_progress(guild_id)
+
+    @property
+    def progress(self) -> bool:
+        return PROGRESS_INTERVAL > 0
+
+    def progress_interval(self) -> float:
+        return max(PROGRESS_INTERVAL, self._bars / PROGRESS_EDITS_PER_SECOND)
+
+    def _schedule_progress(self, guild_id: int):
+        info = self.ui[guild_id]
+        if not self.progress or info.progress_timer is not None:
+            return
+        self._bars += 1
+        # one shared wheel instead of a sleeping task per guild
+        info.progress_timer = wheel.call_later(self.progress_interval(), self._progress_tick, guild_id)
+
+    def _cancel_progress(self, info):
+        if info.progress_timer is not None:
+            info.progress_timer.cancel()
+            info.progress_timer = None
+            self._bars -= 1
+
+    def _progress_tick(self, guild_id: int):
+        self._bars -= 1
+        info = registry.peek(guild_id, 'ui')
+        if info is None:
+            return # evicted, the bar stops
+        info.progress_timer = None
+        if info.playinfo is None:
+            return
+        guild = self.ui.bot.get_guild(guild_id)
+        voice_client = guild.voice_client if guild is not None else None
+        if voice_client is not None and voice_client.is_playing():
+            self.update(guild_id) # the write schedules the next tick
+        else:
+            self._schedule_progress(guild_id) # paused, check again later
+
+    async def _detach(self, message: discord.PartialMessage, **final):
+        try:
+            await message.edit(view=None, **final)
+            panel_writes.inc(kind='edit')
+        except discord.HTTPException:
+            pass
+
+    async def close(self, guild_id: int, **final) -> bool:
+        '''turn the panel into a plain message with `final`, the next song posts a new one'''
+        info = self.ui[guild_id]
+        if info.panel_task is not None:
+            info.panel_task.cancel()
+            info.panel_task = None
+        if info.panel_timer is not None:
+            info.panel_timer.cancel()
+            info.panel_timer = None
+        info.panel_stale = False
+        info.status = None
+        self._cancel_progress(info)
+        message, info.playinfo = info.playinfo, None
+        if message is None:
+            return False
+        await self._detach(message, **final)
+        return True
@@ -1,16 +1,56 @@
 from typing import *
-import threading, asyncio, gc, weakref
+import threading, asyncio, contextvars, gc, weakref, io, os, time, resource, tracemalloc
 
 import discord
-from discord import VoiceClient, VoiceChannel, FFmpegPCMAudio, PCMVolumeTransformer
+from discord import VoiceClient, VoiceChannel, FFmpegPCMAudio
 from discord.ext import commands
 
-from .playlist import Song, Playlist, LoopState
+from .playlist import Song, Playlist, PlaylistBase, LoopState, SeekError, QueueFull
 from .ytdl import YTDL
+from .shared import SharedStreamPool
+from .ffmpeg import supervisor
+from .dsp import CrossfadeSource
+from .effects import AudioEffects
+from .store import settings
+from .audioworker import AudioWorkerPool
+from .snapshot import Snapshotter
+from .metrics import MetricsServer, time_to_first_audio
+from .watchdog import LoopWatchdog
+from .tracing import tracer, Span
+from .registry import registry
+from .timerwheel import wheel, Timer
+from .prefetch import prefetcher
+from .radio import Radio
+from .history import PlayHistory
+from .saved import SavedPlaylists, SavedPlaylistError, export_json, export_m3u
 
 
 INF = int(1e18)
 bot_version = 'master Branch'
+# seconds before a crossfade starts that the next song's ffmpeg is spawned,
+# so the pipe already holds audio when the mix begins
+PREFETCH_LEAD = 3.0
+# longest crossfade a guild may set, in seconds
+CROSSFADE_MAX = 12.0
+# seconds the bot stays in voice after the queue ran out
+IDLE_TIMEOUT = 60.0
+
+def _parse(value, cls):
+    '''
+    slash command options arrive as text, convert like the former
+    Union[cls, str] annotations did: a number if it parses, else the raw text
+    '''
+    if value is None or isinstance(value, cls):
+        return value
+    try:
+        return cls(value)
+    except ValueError:
+        return value
+
+def _manager(ctx: commands.Context) -> bool:
+    '''members who manage the server may replace or delete anyone's saved playlist'''
+    permissions = getattr(ctx.author, 'guild_permissions', None)
+    return permissions is not None and permissions.manage_guild
 
 class GuildInfo:
     def __init__(self, guild_id):
@@ -18,7 +58,15 @@ class GuildInfo:
         self.text_channel: discord.TextChannel = None
         self._volume_level: int = None
         self._task: asyncio.Task = None
-        self._timer: asyncio.Task = None
+        self._timer: Timer = None # idle leave, on the shared timer wheel
+        self._crossfaded: bool = False
+        self._play_requested: float = None # perf_counter of the $play waiting for audio
+        self._play_span: Span = None # trace of that $play, the mainloop finishes it
+        self._skipped: bool = False # the current song was cut short by a user
+        self.crossfade: float = settings.get(guild_id, 'crossfade', float(os.getenv('CROSSFADE', 0)))
+        if not 0 <= self.crossfade <= CROSSFADE_MAX: # saved before lengths were bounded
+            self.crossfade = 0.0
+        self.effects: AudioEffects = AudioEffects()
     
     @property
     def volume_level(self):
@@ -33,21 +81,99 @@ class GuildInfo:
 
     def fetch(self):
         '''fetch from database'''
+        self._volume_level = settings.get(self.guild_id, 'volume', 1.0)
 
     def update(self):
         '''update database'''
+        settings.set(self.guild_id, 'volume', self._volume_level)
 
 class Player(commands.Cog):
     def __init__(self, bot: commands.Bot):
         super().__init__()
         self.bot = bot
         self._playlist: Playlist = Playlist()
-        self._guilds_info: Dict[int, GuildInfo] = dict()
+        self._radio: Radio = Radio()
+        self._history: PlayHistory = PlayHistory()
+        self._saved: SavedPlaylists = SavedPlaylists()
+        registry.register('player', GuildInfo)
+        registry.guard('player', self._busy)
+        # share one ffmpeg pipeline between guilds playing the same track
+        self._shared: Optional[SharedStreamPool] = SharedStreamPool() if os.getenv('SHARED_SOURCE') else None
+        # move decoding and opus encoding out of the gateway process
+        self._workers: Optional[AudioWorkerPool] = AudioWorkerPool(int(os.getenv('AUDIO_WORKERS'))) if os.getenv('AUDIO_WORKERS') else None
+
+        self._snapshot: Snapshotter = Snapshotter(self)
+        self._metrics: MetricsServer = MetricsServer(self)
+        self._watchdog: LoopWatchdog = LoopWatchdog()
+        self._restored: bool = False
+
+    async def cog_load(self):
+        self._watchdog.start()
+        registry.start()
+        prefetcher.start()
+        self._history.start()
+        self._snapshot.start()
+        await self._metrics.start()
+
+    async def cog_unload(self):
+        self._watchdog.stop()
+        registry.stop()
+        prefetcher.stop()
+        self._history.stop()
+        await self._history.flush()
+        self._snapshot.stop()
+        await self._metrics.stop()
+        if self._workers is not None:
+            self._workers.shutdown()
+
+    async def restore(self):
+        # on_ready fires again on every reconnect, only restore the first time
+        if self._restored:
+            return
+        self._restored = True
+        await self._snapshot.restore()
+
+    @property
+    def _guilds_info(self) -> Dict[int, GuildInfo]:
+        return registry.table('player')
 
     def __getitem__(self, guild_id) -> GuildInfo:
-        if self._guilds_info.get(guild_id) is None:
-            self._guilds_info[guild_id] = GuildInfo(guild_id)
-        return self._guilds_info[guild_id] 
+        return registry[guild_id, 'player']
+
+    def peek(self, guild_id) -> Optional[GuildInfo]:
+        '''like self[guild_id] but never creates the state'''
+        return registry.peek(guild_id, 'player')
+
+    def memory_report(self) -> dict:
+        '''what the per guild state holds, songs alive outside any queue point at a leak'''
+        report = registry.report()
+        tracked = (Song, GuildInfo, PlaylistBase, discord.Message)
+        live = dict.fromkeys((cls.__name__ for cls in tracked), 0)
+        for obj in gc.get_objects():
+            for cls in tracked:
+                if isinstance(obj, cls):
+                    live[cls.__name__] += 1
+                    break
+        queued = sum(len(playlist.order) for playlist in self._playlist._guilds_info.values())
+        report.update({
+            'queued_songs': queued,
+            'live_objects': live,
+            'untracked_songs': live['Song'] - queued,
+            'ffmpeg_processes': len(supervisor),
+            'cached_members': sum(len(guild.members) for guild in self.bot.guilds),
+            'cached_users': len(self.bot.users),
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        })
+        if tracemalloc.is_tracing(): # PYTHONTRACEMALLOC=1
+            report['top_allocations'] = [str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:5]]
+        return report
+
+    def _busy(self, guild_id: int) -> bool:
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None and guild.voice_client is not None:
+            return True
+        info = self.peek(guild_id)
+        return info is not None and (info._task is not None or info._timer is not None)
 
     async def _join(self, channel: discord.VoiceChannel):
         voice_client = channel.guild.voice_client
@@ -60,15 +186,17 @@ class Player(commands.Cog):
             self._stop(guild)
             await voice_client.disconnect()
             
-    async def _search(self, guild: discord.Guild, url, requester: discord.Member):
-        await self._playlist.add_songs(guild.id, url, requester)
+    async def _search(self, guild: discord.Guild, url, requester: discord.Member) -> int:
+        index = await self._playlist.add_songs(guild.id, url, requester)
         if self._playlist.is_playlist(url):
             self._start_playlist_process(guild, url, requester)
+        return index
 
     def _start_playlist_process(self, guild: discord.Guild, url, requester: discord.Member):
         coro = self._playlist.process_playlist(guild.id, url, requester)
         id = self._playlist.get_playlist_id(url)
         task = self.bot.loop.create_task(coro)
+        self._watchdog.tag(task, guild=guild.id, task='playlist')
             
         self._playlist[guild.id]._playlisttask[id] = task
         task.add_done_callback(lambda task , guild_id=guild.id, playlist_id=id: self._end_playlist_process(guild_id, playlist_id))
@@ -87,22 +215,30 @@ class Player(commands.Cog):
     def _resume(self, guild: discord.Guild):
         voice_client: VoiceClient = guild.voice_client
         if voice_client.is_paused():
-            self._playlist[guild.id].current().left_off += voice_client._player.loops / 50
+            song = self._playlist[guild.id].current()
+            song.left_off = song.position(voice_client._player.loops)
             voice_client.resume()
 
     def _skip(self, guild: discord.Guild):
         voice_client: VoiceClient = guild.voice_client
         if voice_client.is_playing() or voice_client.is_paused():
             voice_client.stop()
-        self._playlist[guild].times = 0
+            self[guild.id]._skipped = True
+        self._playlist[guild.id].times = 0
     
     def _stop(self, guild: discord.Guild):
+        self._radio.hold(guild.id)
         self._playlist[guild.id].clear()
+        self._playlist.save(guild.id)
         self._skip(guild)
     
     def current_timestamp(self, guild: discord.Guild) -> float:
         voice_client: discord.VoiceClient = guild.voice_client
-        return self._playlist[guild.id].current().left_off + voice_client._player.loops / 50
+        song = self._playlist[guild.id].current()
+        # no player between stop() and the next play(), e.g. while the next url is resolved
+        if voice_client is None or voice_client._player is None:
+            return song.left_off
+        return song.position(voice_client._player.loops)
     
     def _seek(self, guild: discord.Guild, timestamp: float):
         voice_client: discord.VoiceClient = guild.voice_client
@@ -110,9 +246,19 @@ class Player(commands.Cog):
             voice_client.stop()
             return 'Exceed'
         self._playlist[guild.id].current().seek(timestamp)
+        self._swap_source(guild)
+
+    def _swap_source(self, guild: discord.Guild):
+        voice_client: discord.VoiceClient = guild.voice_client
         volume_level = self[guild.id].volume_level
-        self._playlist[guild.id].current().set_source(volume_level)
+        self._playlist[guild.id].current().set_source(volume_level, self._shared, self._workers)
+        former = voice_client.source
+        paused = voice_client.is_paused()
         voice_client.source = self._playlist[guild.id].current().source
+        # swapping the source resumes the player and does not clean up the old ffmpeg process
+        if paused:
+            voice_client.pause()
+        former.cleanup()
     
     def _volume(self, guild: discord.Guild, volume: float):
         voice_client: discord.VoiceClient = guild.voice_client
@@ -120,6 +266,66 @@ class Player(commands.Cog):
             self[guild.id].volume_level = volume
             voice_client.source.volume = volume
 
+    def _apply_effects(self, guild: discord.Guild):
+        voice_client: discord.VoiceClient = guild.voice_client
+        song = self._playlist[guild.id].current()
+        if voice_client is None or song is None or voice_client.source is None:
+            return
+        # restart ffmpeg with the new filter graph where the clock says we are,
+        # the stream url is cached on the song so nothing is resolved again
+        clock = song.left_off, song.rate, song.ffmpeg_options
+        try:
+            try:
+                song.seek(self.current_timestamp(guild))
+            except SeekError:
+                song.set_ffmpeg_options(0)
+            self._swap_source(guild)
+        except Exception:
+            # the former source keeps playing, and so does its clock
+            song.left_off, song.rate, song.ffmpeg_options = clock
+            raise
+
+    def _crossfade_length(self, guild: discord.Guild, length: float):
+        # also false for nan
+        if not 0 <= length <= CROSSFADE_MAX:
+            raise ValueError(f'crossfade length {length} is not between 0 and {CROSSFADE_MAX}')
+        self[guild.id].crossfade = length
+        settings.set(guild.id, 'crossfade', self[guild.id].crossfade)
+
+    async def _prefetch_next(self, guild: discord.Guild) -> Optional[Song]:
+        playlist = self._playlist[guild.id]
+        # only fade into a different song, single loop replays the current one
+        if playlist.loop_state not in (LoopState.NOTHING, LoopState.PLAYLIST) or len(playlist.order) < 2:
+            return None
+        following = playlist[1]
+        if following.source is None:
+            # metadata and stream url are resolved off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, lambda: following.info)
+            await prefetcher.ensure(following)
+            # the queue may have changed meanwhile
+            if self._playlist[guild.id].order[1:2] != [following]:
+                return None
+            if following.source is None:
+                following.set_ffmpeg_options(0, self[guild.id].effects)
+                following.set_source(self[guild.id].volume_level, self._shared, self._workers)
+        return following
+
+    async def _crossfade(self, guild: discord.Guild) -> bool:
+        voice_client: discord.VoiceClient = guild.voice_client
+        following = await self._prefetch_next(guild)
+        # sources from audio workers are already opus encoded and can not be mixed
+        if following is None or following.source is None or following.source.is_opus():
+            return False
+        if not voice_client.is_playing():
+            return False
+        current = voice_client.source
+        if isinstance(current, CrossfadeSource) and current.done:
+            current = current.following
+        # swapping the source resets the player loops, so the next song's
+        # clock (left_off 0) starts together with the fade
+        voice_client.source = CrossfadeSource(current, following.source, self[guild.id].crossfade)
+        return True
+
     async def _play(self, guild: discord.Guild, channel: discord.TextChannel):
         self[guild.id].text_channel = channel
         await self._start_mainloop(guild)
@@ -132,6 +338,7 @@ class Player(commands.Cog):
             return
         coro = self._mainloop(guild)
         self[guild.id]._task = self.bot.loop.create_task(coro)
+        self._watchdog.tag(self[guild.id]._task, guild=guild.id, task='mainloop')
         self[guild.id]._task.add_done_callback(lambda task, guild=guild: self._start_timer(guild))
     
     async def _mainloop(self, guild: discord.Guild):
@@ -156,21 +363,27 @@ class Player(commands.Cog):
             self[guild.id]._task = None
         if self[guild.id]._timer is not None:
             self[guild.id]._timer.cancel()
-        coro = self._timer(guild)
-        self[guild.id]._timer = self.bot.loop.create_task(coro)
-    
-    async def _timer(self, guild: discord.Guild):
-        await asyncio.sleep(60.0)
-        await self._leave(guild)
+        self[guild.id]._timer = wheel.call_later(IDLE_TIMEOUT, self._leave, guild)
     
     def _cleanup(self, guild: discord.Guild):
         if self[guild.id]._task is not None:
             self[guild.id]._task = None
         del self._playlist[guild.id]
+        self._radio.hold(guild.id)
         if self[guild.id]._timer is not None:
             self[guild.id]._timer.cancel()
             self[guild.id]._timer = None
+        supervisor.kill_guild(guild.id)
+        self.bot.loop.call_later(1, supervisor.reap)
+
 
+class MusicContext(commands.Context):
+    '''remembers whether the command answered, an interaction has to be answered once'''
+    replied: bool = False
+
+    async def send(self, *args, **kwargs):
+        self.replied = True
+        return await super().send(*args, **kwargs)
 
 class MusicBot(Player, commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -181,11 +394,27 @@ class MusicBot(Player, commands.Cog):
     def in_playlist_process(self, ctx: commands.Context):
         return len(self._playlist[ctx.guild.id]._playlisttask) > 0
 
+    async def cog_before_invoke(self, ctx: commands.Context):
+        self._watchdog.tag(guild=ctx.guild.id if ctx.guild else None, command=ctx.command.qualified_name)
+        if ctx.guild is not None:
+            # the guild state the command creates reads its settings from memory
+            await settings.load(ctx.guild.id)
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        # an interaction nobody answered shows "the application did not respond"
+        if ctx.interaction is not None and not getattr(ctx, 'replied', True):
+            await ctx.send('✅', ephemeral=True)
+
     async def resolve_ui(self):   
+        # built once, the footer needs bot.user which only exists after login
+        if getattr(self, 'ui', None) is not None:
+            return
         from .ui import UI
         self.ui = UI(self, bot_version)
+        # panels sent before a restart keep working once the view is registered
+        self.ui.panel.view()
     
-    @commands.command(name='help')
+    @commands.hybrid_command(name='help', description='顯示指令說明')
     async def help(self, ctx: commands.Context):
         await self.ui.Help(ctx)
     
@@ -210,7 +439,7 @@ class MusicBot(Player, commands.Cog):
                 isinstance(former.instance, discord.StageInstance):
             await former.delete()
     
-    @commands.command(name='join')
+    @commands.hybrid_command(name='join', description='將機器人加入到您目前所在的語音頻道')
     async def join(self, ctx: commands.Context):
         voice_client: discord.VoiceClient = ctx.guild.voice_client
         if isinstance(voice_client, discord.VoiceClient):
@@ -230,7 +459,7 @@ class MusicBot(Player, commands.Cog):
         except Exception as e:
             await self.ui.JoinFailed(ctx, e)
     
-    @commands.command(name='leave', aliases=['quit'])
+    @commands.hybrid_command(name='leave', description='使機器人離開其所在的語音頻道', aliases=['quit'])
     async def leave(self, ctx: commands.Context):
         voice_client: discord.VoiceClient = ctx.guild.voice_client
         try:
@@ -242,7 +471,7 @@ class MusicBot(Player, commands.Cog):
         except Exception as e:
             await self.ui.LeaveFailed(ctx, e)
     
-    @commands.command(name='pause')
+    @commands.hybrid_command(name='pause', description='暫停歌曲播放')
     async def pause(self, ctx: commands.Context):
         try:
             self._pause(ctx.guild)
@@ -250,7 +479,7 @@ class MusicBot(Player, commands.Cog):
         except Exception as e:
             await self.ui.PauseFailed(ctx, e)
     
-    @commands.command(name='resume')
+    @commands.hybrid_command(name='resume', description='續播歌曲')
     async def resume(self, ctx: commands.Context):
         try:
             self._resume(ctx.guild)
@@ -258,7 +487,7 @@ class MusicBot(Player, commands.Cog):
         except Exception as e:
             await self.ui.ResumeFailed(ctx, e)
 
-    @commands.command(name='skip')
+    @commands.hybrid_command(name='skip', description='跳過目前歌曲')
     async def skip(self, ctx: commands.Context):
         try:
             self._skip(ctx.guild)
@@ -266,7 +495,7 @@ class MusicBot(Player, commands.Cog):
         except Exception as e:
             await self.ui.SkipFailed(ctx, e)
 
-    @commands.command(name='stop')
+    @commands.hybrid_command(name='stop', description='停止歌曲並清除所有隊列')
     async def stop(self, ctx: commands.Context):
         try:
             self._stop(ctx.guild)
@@ -274,8 +503,9 @@ class MusicBot(Player, commands.Cog):
         except Exception as e:
             await self.ui.StopFailed(ctx, e)
     
-    @commands.command(name='seek')
-    async def seek(self, ctx: commands.Context, timestamp: Union[float, str]):
+    @commands.hybrid_command(name='seek', description='快轉至指定時間 (秒數或時間戳 ex.00:04)')
+    async def seek(self, ctx: commands.Context, timestamp: str):
+        timestamp = _parse(timestamp, float)
         try:
             if isinstance(timestamp, str):
                 tmp = map(int, reversed(timestamp.split(":")))
@@ -290,8 +520,9 @@ class MusicBot(Player, commands.Cog):
             # await self.ui.SeekSucceed(ctx, timestamp, self)
             return
 
-    @commands.command(name='volume')
-    async def volume(self, ctx: commands.Context, percent: Union[float, str]=None):
+    @commands.hybrid_command(name='volume', description='顯示機器人目前音量/更改音量')
+    async def volume(self, ctx: commands.Context, percent: str=None):
+        percent = _parse(percent, float)
         if not isinstance(percent, float) and percent is not None:
             await self.ui.VolumeAdjustFailed(ctx)
             return
@@ -299,7 +530,68 @@ class MusicBot(Player, commands.Cog):
         if percent is not None:
             self._volume(ctx.guild, percent / 100)
 
-    @commands.command(name="mute", aliases=['quiet', 'shutup'])
+    @commands.hybrid_command(name='crossfade', description='顯示/設定歌曲間淡入淡出長度 (0 為關閉)', aliases=['fade'])
+    async def crossfade(self, ctx: commands.Context, seconds: str=None):
+        seconds = _parse(seconds, float)
+        if not isinstance(seconds, float) and seconds is not None:
+            await self.ui.CrossfadeFailed(ctx)
+            return
+        if seconds is not None:
+            try:
+                self._crossfade_length(ctx.guild, seconds)
+            except ValueError:
+                await self.ui.CrossfadeFailed(ctx)
+                return
+        await self.ui.CrossfadeAdjust(ctx, self[ctx.guild.id].crossfade)
+
+    async def _effect_command(self, ctx: commands.Context, apply: Callable[[AudioEffects], None]):
+        effects = self[ctx.guild.id].effects
+        state = effects.state()
+        try:
+            apply(effects)
+            self._apply_effects(ctx.guild)
+        except Exception as e:
+            # invalid values, or the source could not be restarted (ffmpeg
+            # capacity, extraction), the former effects stay in place
+            effects.restore(state)
+            await self.ui.EffectFailed(ctx, e)
+            return
+        await self.ui.EffectSucceed(ctx, effects)
+
+    @commands.hybrid_command(name='effect', description='顯示/套用音效 (nightcore / vaporwave / bassboost / reset)', aliases=['fx'])
+    async def effect(self, ctx: commands.Context, name: str=None):
+        if name is None:
+            await self.ui.EffectSucceed(ctx, self[ctx.guild.id].effects)
+        elif name in ('reset', 'off', 'clear'):
+            await self._effect_command(ctx, lambda effects: effects.reset())
+        else:
+            await self._effect_command(ctx, lambda effects: effects.apply_preset(name.lower()))
+
+    @commands.hybrid_command(name='nightcore', description='套用 nightcore 音效')
+    async def nightcore(self, ctx: commands.Context):
+        await self._effect_command(ctx, lambda effects: effects.apply_preset('nightcore'))
+
+    @commands.hybrid_command(name='speed', description='調整播放速度', aliases=['tempo'])
+    async def speed(self, ctx: commands.Context, rate: str):
+        rate = _parse(rate, float)
+        await self._effect_command(ctx, lambda effects: effects.set_speed(rate))
+
+    @commands.hybrid_command(name='pitch', description='調整音高')
+    async def pitch(self, ctx: commands.Context, ratio: str):
+        ratio = _parse(ratio, float)
+        await self._effect_command(ctx, lambda effects: effects.set_pitch(ratio))
+
+    @commands.hybrid_command(name='bassboost', description='重低音 (dB)', aliases=['bass'])
+    async def bassboost(self, ctx: commands.Context, gain: str='10'):
+        gain = _parse(gain, float)
+        await self._effect_command(ctx, lambda effects: effects.set_bass(gain))
+
+    @commands.hybrid_command(name='equalizer', description='等化器 (頻率 dB)', aliases=['eq'])
+    async def equalizer(self, ctx: commands.Context, frequency: str, gain: str):
+        frequency, gain = _parse(frequency, int), _parse(gain, float)
+        await self._effect_command(ctx, lambda effects: effects.set_band(frequency, gain))
+
+    @commands.hybrid_command(name="mute", description='切換靜音狀態', aliases=['quiet', 'shutup'])
     async def mute(self, ctx: commands.Context):
         if self[ctx.guild.id]._volume_level == 0: 
             await self.volume(ctx, 100.0)
@@ -307,7 +599,18 @@ class MusicBot(Player, commands.Cog):
             await self.volume(ctx, 0.0)
         await self.ui.MuteorUnMute(ctx, self[ctx.guild.id]._volume_level)
 
-    @commands.command(name='restart', aliases=['replay'])
+    @commands.command(name='sync')
+    @commands.is_owner()
+    async def sync(self, ctx: commands.Context):
+        synced = await self.bot.tree.sync()
+        await ctx.send(f'**:arrows_counterclockwise: | 已同步 {len(synced)} 個斜線指令**')
+
+    @commands.command(name='memory', aliases=['mem'])
+    @commands.is_owner()
+    async def memory(self, ctx: commands.Context):
+        await self.ui.MemoryReport(ctx, self.memory_report())
+
+    @commands.hybrid_command(name='restart', description='重新播放目前歌曲', aliases=['replay'])
     async def restart(self, ctx: commands.Context):
         try:
             self._seek(0)
@@ -315,24 +618,120 @@ class MusicBot(Player, commands.Cog):
         except Exception as e:
             await self.ui.ReplayFailed(ctx, e)
 
-    @commands.command(name='loop', aliases=['songloop'])
-    async def single_loop(self, ctx: commands.Context, times: Union[int, str]=INF):
+    @commands.hybrid_command(name='loop', description='切換單曲循環開關', aliases=['songloop'])
+    async def single_loop(self, ctx: commands.Context, times: str=None):
+        times = INF if times is None else _parse(times, int)
         if not isinstance(times, int):
             return await self.ui.SingleLoopFailed(ctx)
         self._playlist.single_loop(ctx.guild.id, times)
         await self.ui.LoopSucceed(ctx)
 
-    @commands.command(name='playlistloop', aliases=['queueloop', 'qloop', 'all_loop'])
+    @commands.hybrid_command(name='playlistloop', description='切換全隊列循環開關', aliases=['queueloop', 'qloop', 'all_loop'])
     async def playlist_loop(self, ctx: commands.Context):
         self._playlist.playlist_loop(ctx.guild.id)
         await self.ui.LoopSucceed(ctx)
 
-    @commands.command(name='show_queue', aliases=['queuelist', 'queue', 'show'])
+    @commands.hybrid_command(name='fairqueue', description='切換公平隊列 (輪流播放每位成員點的歌)', aliases=['fair'])
+    async def fair_queue(self, ctx: commands.Context):
+        await self.ui.FairQueueToggle(ctx, self._playlist.fair_queue(ctx.guild.id))
+
+    @commands.hybrid_command(name='autoplay', description='切換自動播放 (隊列播完後播放相關歌曲)', aliases=['radio'])
+    async def autoplay(self, ctx: commands.Context):
+        enabled = self._radio.toggle(ctx.guild.id)
+        # turned on during the last song, pick its successor right away
+        if enabled and len(self._playlist[ctx.guild.id].order) == 1:
+            self._radio.prepare(ctx.guild.id, ctx.guild.me)
+        await self.ui.AutoplayToggle(ctx, enabled)
+
+    @commands.hybrid_command(name='stats', description='顯示本伺服器的播放統計')
+    async def stats(self, ctx: commands.Context):
+        await ctx.defer()
+        await self.ui.Stats(ctx, await self._history.stats(ctx.guild.id))
+
+    @commands.hybrid_group(name='playlist', description='列出本伺服器儲存的播放清單', fallback='list', aliases=['pl'])
+    async def saved(self, ctx: commands.Context):
+        await self.ui.SavedPlaylistList(ctx, await self._saved.names(ctx.guild.id))
+
+    @saved.command(name='save', description='將目前隊列或指定的 YouTube 播放清單儲存為播放清單')
+    async def saved_save(self, ctx: commands.Context, name: str, url: str=None):
+        # a youtube playlist is resolved once here, loading it later is offline
+        await ctx.defer()
+        try:
+            if url is None:
+                saved, failed = await self._saved.save(ctx.guild.id, name, ctx.author.id, list(self._playlist[ctx.guild.id].order), _manager(ctx)), 0
+            elif self._playlist.is_playlist(url):
+                saved, failed = await self._saved.save_youtube(ctx.guild.id, name, ctx.author.id, url, _manager(ctx))
+            else:
+                raise SavedPlaylistError(f'{url} is not a youtube playlist')
+            await self.ui.SavedPlaylistSaved(ctx, name, saved, failed)
+        except Exception as e:
+            await self.ui.SavedPlaylistFailed(ctx, e)
+
+    @saved.command(name='load', description='將儲存的播放清單加入隊列並開始播放')
+    async def saved_load(self, ctx: commands.Context, name: str):
+        # joining and starting playback can take longer than an interaction may wait
+        await ctx.defer()
+        try:
+            infos = await self._saved.load(ctx.guild.id, name)
+        except SavedPlaylistError as e:
+            await self.ui.SavedPlaylistFailed(ctx, e)
+            return
+        voice_client: VoiceClient = ctx.guild.voice_client
+        if not isinstance(voice_client, discord.VoiceClient) or \
+                ctx.author.voice is None or voice_client.channel != ctx.author.voice.channel:
+            await self.join(ctx)
+            if not isinstance(ctx.guild.voice_client, discord.VoiceClient):
+                return
+        try:
+            self._playlist[ctx.guild.id].check(ctx.author)
+        except QueueFull as e:
+            await self.ui.QueueFull(ctx, e)
+            return
+        added = self._playlist[ctx.guild.id].extend(Song.from_info(info, ctx.author) for info in infos)
+        self._playlist.save(ctx.guild.id)
+        await self.ui.SavedPlaylistLoaded(ctx, name, added, len(infos) - added)
+        await self._play(ctx.guild, ctx.channel)
+
+    @saved.command(name='delete', description='刪除儲存的播放清單')
+    async def saved_delete(self, ctx: commands.Context, name: str):
+        try:
+            await self._saved.delete(ctx.guild.id, name, ctx.author.id, _manager(ctx))
+            await self.ui.SavedPlaylistDeleted(ctx, name)
+        except SavedPlaylistError as e:
+            await self.ui.SavedPlaylistFailed(ctx, e)
+
+    @saved.command(name='export', description='匯出儲存的播放清單 (json / m3u)')
+    async def saved_export(self, ctx: commands.Context, name: str, format: str='json'):
+        try:
+            infos = await self._saved.load(ctx.guild.id, name)
+        except SavedPlaylistError as e:
+            await self.ui.SavedPlaylistFailed(ctx, e)
+            return
+        if format.lower() == 'm3u':
+            data, filename = export_m3u(infos), f'{name}.m3u'
+        else:
+            data, filename = export_json(name, infos), f'{name}.json'
+        await self.ui.SavedPlaylistExport(ctx, name, discord.File(io.BytesIO(data.encode('utf-8')), filename=filename))
+
+    @saved.command(name='import', description='從 json / m3u 檔案匯入播放清單')
+    async def saved_import(self, ctx: commands.Context, name: str, file: discord.Attachment):
+        await ctx.defer()
+        try:
+            if file.size > 1024 * 1024:
+                raise SavedPlaylistError('the file is larger than 1MB')
+            text = (await file.read()).decode('utf-8', errors='replace')
+            saved, failed = await self._saved.import_file(ctx.guild.id, name, ctx.author.id, text, _manager(ctx))
+            await self.ui.SavedPlaylistSaved(ctx, name, saved, failed)
+        except Exception as e:
+            await self.ui.SavedPlaylistFailed(ctx, e)
+
+    @commands.hybrid_command(name='show_queue', description='顯示待播歌曲列表', aliases=['queuelist', 'queue', 'show'])
     async def show_queue(self, ctx: commands.Context):
         await self.ui.ShowQueue(ctx)
 
-    @commands.command(name='remove', aliases=['queuedel'])
-    async def remove(self, ctx: commands.Context, idx: Union[int, str]):
+    @commands.hybrid_command(name='remove', description='移除指定待播歌曲', aliases=['queuedel'])
+    async def remove(self, ctx: commands.Context, idx: str):
+        idx = _parse(idx, int)
         try:
             if self.in_playlist_process(ctx):
                 await self.ui.PlaylistProcessing(ctx)
@@ -342,8 +741,9 @@ class MusicBot(Player, commands.Cog):
         except (IndexError, TypeError) as e:
             await self.ui.RemoveFailed(ctx, e)
     
-    @commands.command(name='swap')
-    async def swap(self, ctx: commands.Context, idx1: Union[int, str], idx2: Union[int, str]):
+    @commands.hybrid_command(name='swap', description='交換指定待播歌曲順序')
+    async def swap(self, ctx: commands.Context, idx1: str, idx2: str):
+        idx1, idx2 = _parse(idx1, int), _parse(idx2, int)
         try:
             if self.in_playlist_process(ctx):
                 await self.ui.PlaylistProcessing(ctx)
@@ -353,8 +753,9 @@ class MusicBot(Player, commands.Cog):
         except (IndexError, TypeError) as e:
             await self.ui.SwapFailed(ctx, e)
 
-    @commands.command(name='move_to', aliases=['insert_to', 'move'])
-    async def move_to(self, ctx: commands.Context, origin: Union[int, str], new: Union[int, str]):
+    @commands.hybrid_command(name='move_to', description='移動指定待播歌曲至指定順序', aliases=['insert_to', 'move'])
+    async def move_to(self, ctx: commands.Context, origin: str, new: str):
+        origin, new = _parse(origin, int), _parse(new, int)
         try:
             if self.in_playlist_process(ctx):
                 await self.ui.PlaylistProcessing(ctx)
@@ -364,70 +765,149 @@ class MusicBot(Player, commands.Cog):
         except (IndexError, TypeError) as e:
             await self.ui.MoveToFailed(ctx, e)
 
-    async def search(self, ctx: commands.Context, *url):
-        # Get user defined url/keyword
-        url = ' '.join(url)
-
+    async def search(self, ctx: commands.Context, url: str):
         async with ctx.typing():
             # Show searching UI (if user provide exact url, then it
             # won't send the UI)
-            await self.ui.StartSearch(ctx, url)
+            with tracer.span('ui.start_search'):
+                await self.ui.StartSearch(ctx, url)
             # Call search function
             try: 
-                await self._search(ctx.guild, url, requester=ctx.message.author)
+                with tracer.span('search', query=url):
+                    index = await self._search(ctx.guild, url, requester=ctx.author)
+            except QueueFull as e:
+                await self.ui.QueueFull(ctx, e)
+                return
             except Exception as e:
                 # If search failed, sent to handler
                 await self.ui.SearchFailed(ctx, url, e)
                 return
             # If queue has more than 1 songs, then show the UI
-            await self.ui.Embed_AddedToQueue(ctx, url)
+            await self.ui.Embed_AddedToQueue(ctx, url, index)
     
-    @commands.command(name='play', aliases=['p', 'P'])
-    async def play(self, ctx: commands.Context, *url):
-        # Try to make bot join author's channel
-        voice_client: VoiceClient = ctx.guild.voice_client
-        if not isinstance(voice_client, discord.VoiceClient) or \
-                voice_client.channel != ctx.author.voice.channel:
-            await self.join(ctx)
-            voice_client = ctx.guild.voice_client
-            if not isinstance(voice_client, discord.VoiceClient):
-                return
+    @commands.hybrid_command(name='play', description='開始播放指定歌曲 (輸入名稱會啟動搜尋)', aliases=['p', 'P'])
+    async def play(self, ctx: commands.Context, *, url: str):
+        # searching can outlast the 3 seconds an interaction has to be answered in
+        await ctx.defer()
+        with tracer.span('play', guild=ctx.guild.id, command=ctx.invoked_with) as span:
+            # only a $play that starts playback counts for time to first audio
+            voice_client: VoiceClient = ctx.guild.voice_client
+            if voice_client is None or not (voice_client.is_playing() or voice_client.is_paused()):
+                self[ctx.guild.id]._play_requested = time.perf_counter()
+                self[ctx.guild.id]._play_span = span if isinstance(span, Span) else None
+            # Try to make bot join author's channel
+            voice_client: VoiceClient = ctx.guild.voice_client
+            if not isinstance(voice_client, discord.VoiceClient) or \
+                    voice_client.channel != ctx.author.voice.channel:
+                with tracer.span('join'):
+                    await self.join(ctx)
+                voice_client = ctx.guild.voice_client
+                if not isinstance(voice_client, discord.VoiceClient):
+                    return
 
-        # Start search process
-        await self.search(ctx, *url)
+            # Start search process
+            await self.search(ctx, url)
 
-        # Get bot user value
-        bot_itself: discord.Member = await ctx.guild.fetch_member(self.bot.user.id)
-        if self.ui.auto_stage_available(ctx.guild.id) and \
-                isinstance(ctx.author.voice.channel, discord.StageChannel) and \
-                bot_itself.voice.suppress:
-            try: 
-                await bot_itself.edit(suppress=False)
-            except: 
-                pass
+            # Get bot user value
+            # always cached, whatever the member cache policy
+            bot_itself: discord.Member = ctx.guild.me
+            if self.ui.auto_stage_available(ctx.guild.id) and \
+                    isinstance(ctx.author.voice.channel, discord.StageChannel) and \
+                    bot_itself.voice.suppress:
+                try: 
+                    await bot_itself.edit(suppress=False)
+                except: 
+                    pass
 
-        await self._play(ctx.guild, ctx.channel)
+            with tracer.span('start_mainloop'):
+                await self._play(ctx.guild, ctx.channel)
 
     async def _mainloop(self, guild: discord.Guild):
         while len(self._playlist[guild.id].order):
             voice_client: VoiceClient = guild.voice_client
             song = self._playlist[guild.id].current()
+            crossfaded, self[guild.id]._crossfaded = self[guild.id]._crossfaded, False
+            started, paused = None, 0.0 # for the play history
             try:
-                song.set_ffmpeg_options(0)
-
-                try:
-                    voice_client.play(discord.FFmpegPCMAudio(song.url, **song.ffmpeg_options))
-                    print('owo')
+                if crossfaded:
+                    # already started by the crossfade at the end of the former song
+                    started = time.time()
                     await self.ui.PlayingMsg(self[guild.id].text_channel)
-                except Exception as e:
-                    await self.ui.PlayingError(self[guild.id].text_channel, e)
-
+                    self._radio.played(guild.id, song, len(self._playlist[guild.id].order) - 1, guild.me)
+                else:
+                    song.set_ffmpeg_options(song.start_at, self[guild.id].effects)
+                    song.start_at = 0
+
+                    # the mainloop task inherited the context of the $play that
+                    # created it, only the first song belongs to that trace
+                    play_span, self[guild.id]._play_span = self[guild.id]._play_span, None
+                    try:
+                        with tracer.span('start_song', parent=play_span, guild=guild.id, video_id=song.video_id):
+                            if song.source is not None:
+                                song.source.cleanup()
+                            # normally prefetched already, otherwise resolved
+                            # off the event loop instead of inside set_source.
+                            # so is the metadata of a song restored from a
+                            # snapshot, set_source and PlayingMsg read it
+                            await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, lambda: song.info)
+                            await prefetcher.ensure(song)
+                            song.set_source(self[guild.id].volume_level, self._shared, self._workers)
+                            voice_client.play(song.source)
+                        started = time.time()
+                        if self[guild.id]._play_requested is not None:
+                            time_to_first_audio.observe(time.perf_counter() - self[guild.id]._play_requested)
+                            self[guild.id]._play_requested = None
+                        await self.ui.PlayingMsg(self[guild.id].text_channel)
+                        self._radio.played(guild.id, song, len(self._playlist[guild.id].order) - 1, guild.me)
+                    except Exception as e:
+                        await self.ui.PlayingError(self[guild.id].text_channel, e)
+
+                fade_failed = False
                 while voice_client.is_playing() or voice_client.is_paused():
                     await asyncio.sleep(0.1)
+                    if voice_client.is_paused():
+                        paused += 0.1
+                        continue
+                    crossfade = self[guild.id].crossfade
+                    if crossfade <= 0 or fade_failed or self._workers is not None or song.info['stream']:
+                        continue
+                    remaining = song.info['length'] - self.current_timestamp(guild)
+                    try:
+                        if remaining <= crossfade + PREFETCH_LEAD:
+                            await self._prefetch_next(guild)
+                        if remaining <= crossfade and await self._crossfade(guild):
+                            self[guild.id]._crossfaded = True
+                            break
+                    except Exception as e:
+                        # the next song could not be opened, it gets a hard cut
+                        # and PlayingError once the mainloop reaches it
+                        print(f'[Player] Crossfade into the next song of guild {guild.id} failed: {e!r}')
+                        fade_failed = True
             finally:
+                skipped, self[guild.id]._skipped = self[guild.id]._skipped, False
+                # the source is consumed, a looped replay has to spawn a new one
+                song.source = None
                 self._playlist.rule(guild.id)
+                if started is not None:
+                    try:
+                        self._history.record(guild.id, song, started, time.time() - started - paused, skipped)
+                    except Exception as e:
+                        print(f'[History] Failed to record a play of guild {guild.id}: {e!r}')
+            if not len(self._playlist[guild.id].order):
+                await self._autoplay(guild)
         await self.ui.DonePlaying(self[guild.id].text_channel)
         
+    async def _autoplay(self, guild: discord.Guild):
+        song = await self._radio.next(guild.id, guild.me)
+        if song is not None:
+            self._playlist[guild.id].append(song)
+            self._playlist.save(guild.id)
+
+    @commands.Cog.listener('on_guild_remove')
+    async def _forget_guild(self, guild: discord.Guild):
+        self._cleanup(guild)
+        registry.discard(guild.id)
+
     @commands.Cog.listener(name='on_voice_state_update')
     async def end_session(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         if member.id != self.bot.user.id or not (before.channel is not None and after.channel is None):
@@ -463,8 +943,10 @@ class MusicBot(Player, commands.Cog):
                 if not voice_client.is_playing() or not voice_client.is_paused():
                     self._stop(member.guild)
                     return
-            if len(voice_client.channel.members) == 1 and not voice_client.is_paused():
-                await self.ui.PauseOnAllMemberLeave(self[member.guild.id].text_channel, self)
+            # voice states are tracked whatever MEMBER_CACHE is, members are
+            # not cached at all with MEMBER_CACHE=none
+            if len(voice_client.channel.voice_states) == 1 and not voice_client.is_paused():
+                await self.ui.PauseOnAllMemberLeave(self[member.guild.id].text_channel, member.guild.id)
                 self._pause(member.guild)
         except: 
             pass
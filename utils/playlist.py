@@ -1,24 +1,47 @@
 from typing import *
 from enum import Enum, auto
 
-import asyncio
+import asyncio, os, time
+from concurrent.futures import Future
+from urllib.parse import urlparse, parse_qs
 
 import discord
-from discord import FFmpegPCMAudio, PCMVolumeTransformer, TextChannel, VoiceClient
+from discord import AudioSource, TextChannel, VoiceClient
 
 from .ytdl import YTDL
+from .shared import SharedStreamPool
+from .ffmpeg import SupervisedFFmpegPCMAudio
+from .dsp import volume_source
+from .effects import AudioEffects
+from .store import store, settings
+from .audioworker import AudioWorkerPool
+from .metrics import stream_url_cache
+from .tracing import tracer
+from .registry import registry
+from .prefetch import prefetcher
 
 INF = int(1e18)
 
+# songs the queue of a guild may hold, and songs one member may have in it
+QUEUE_LIMIT = int(os.getenv('QUEUE_LIMIT', 1000))
+QUEUE_USER_LIMIT = int(os.getenv('QUEUE_USER_LIMIT', 250))
+
 class SeekError(Exception): ...
 class OutOfBound(Exception): ...
 
+class QueueFull(Exception):
+    def __init__(self, limit: int, requester: bool):
+        super().__init__(f'{"a member" if requester else "the queue"} may hold at most {limit} songs')
+        self.limit: int = limit
+        self.requester: bool = requester # the limit of the member was hit, not the one of the queue
+
 ytdl = YTDL()
 # db = _database()
 
+WATCH_URL = 'https://www.youtube.com/watch?v={}'
+
 class Song:
-    info: dict
-    source: PCMVolumeTransformer[FFmpegPCMAudio]
+    source: AudioSource
 
     # def __new__(cls, url, *args, **kwargs):
     #     song = object.__new__(cls)
@@ -26,31 +49,118 @@ class Song:
     #         pass
     #     song.info = ytdl.get_info(url)
     
-    def __init__(self, url, requester: discord.Member):
+    def __init__(self, url, requester: discord.Member, lazy: bool = False):
         self.requester: discord.Member = requester
         self.left_off: float = 0
-        self.info = ytdl.get_info(url)
+        self.start_at: float = 0 # where the mainloop starts this song, set when restoring
+        self._url: str = url
+        # lazy songs come from a snapshot, their info is only extracted once
+        # something actually needs it
+        self._info: dict = None if lazy else self._get_info(url)
         # flag for local server, need to change for multiple server
-        self.source: PCMVolumeTransformer[FFmpegPCMAudio] = None
+        self.source: AudioSource = None
+        self.effects: AudioEffects = None
+        self.rate: float = 1.0 # media seconds per played second, set by effects
+        self._stream_url: str = None
+        self._stream_expire: float = 0
         # self.add_info(url, requester)
 
+    @classmethod
+    def from_snapshot(cls, video_id: str, requester: discord.Member) -> 'Song':
+        song = cls(WATCH_URL.format(video_id), requester, lazy=True)
+        song._video_id = video_id
+        return song
+
+    @classmethod
+    def from_info(cls, info: dict, requester: discord.Member) -> 'Song':
+        '''a song whose metadata is already known, nothing is extracted'''
+        song = cls(info['watch_url'], requester, lazy=True)
+        song._info = info
+        return song
+
+    @staticmethod
+    def _get_info(url) -> dict:
+        with tracer.span('get_info', url=url):
+            return ytdl.get_info(url)
+
+    @property
+    def info(self) -> dict:
+        if self._info is None:
+            self._info = self._get_info(self._url)
+        return self._info
+
+    @property
+    def loaded(self) -> bool:
+        '''the metadata is known, reading info does not extract anything'''
+        return self._info is not None
+
+    @property
+    def video_id(self) -> str:
+        if self._info is None and getattr(self, '_video_id', None) is not None:
+            return self._video_id
+        return self.info['video_id']
+
     @property
     def url(self) -> Union[str, Exception]:
-        return ytdl.get_url(self.info['watch_url'])
+        # signed stream urls stay valid for hours, only resolve again when
+        # the cached one is about to expire
+        if not self.url_fresh():
+            stream_url_cache.inc(result='miss')
+            self.refresh_url()
+        else:
+            stream_url_cache.inc(result='hit')
+        return self._stream_url
+
+    def url_fresh(self, margin: float = 60) -> bool:
+        return self._stream_url is not None and time.time() <= self._stream_expire - margin
+
+    def refresh_url(self):
+        '''blocking, the prefetcher runs it in a thread'''
+        with tracer.span('get_url'):
+            url = ytdl.get_url(self.info['watch_url'] if self._info is not None else self._url)
+        expire = parse_qs(urlparse(url).query).get('expire')
+        self._stream_url, self._stream_expire = url, float(expire[0]) if expire else time.time() + 3600
+
+    def position(self, loops: int) -> float:
+        '''media time after the voice player has read `loops` frames of the current source'''
+        return self.left_off + loops / 50 * self.rate
 
     # @property
     # def source(self, volume_level):
     #     return PCMVolumeTransformer(FFmpegPCMAudio(self.url, **self.ffmpeg_options), volume=volume_level)
 
-    def set_source(self, volumelevel):
-        self.source = PCMVolumeTransformer(FFmpegPCMAudio(self.url, **self.ffmpeg_options), volume=volumelevel)
-        
-    def set_ffmpeg_options(self, timestamp):
-        self.left_off = timestamp
-        self.ffmpeg_options = {
-            'options': f'-vn -ss {timestamp}',
+    def set_source(self, volumelevel, shared: SharedStreamPool = None, workers: AudioWorkerPool = None):
+        if workers is not None:
+            self.source = workers.open(self.requester.guild.id, self.url, self.ffmpeg_options, volumelevel)
+            return
+        # filtered audio is per guild, it can not come from a shared pipeline
+        if shared is None or (self.effects is not None and self.effects.active):
+            source = SupervisedFFmpegPCMAudio(self.url, guild_id=self.requester.guild.id, **self.ffmpeg_options)
+        else:
+            source = shared.open(self.info['video_id'], self.url, self.left_off, self._ffmpeg_options, live=self.info['stream'])
+        self.source = volume_source(source, volumelevel, gain_db=self.gain_db)
+
+    @property
+    def gain_db(self) -> Optional[float]:
+        # youtube turns loud tracks down by their loudness and leaves quiet ones, so do we
+        loudness = self.info.get('loudness')
+        return -loudness if loudness is not None and loudness > 0 else None
+
+    def _ffmpeg_options(self, timestamp) -> dict:
+        options = f'-vn -ss {timestamp}'
+        if self.effects is not None and self.effects.active:
+            options += f' -af "{self.effects.filter_graph}"'
+        return {
+            'options': options,
             'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10',
         }
+        
+    def set_ffmpeg_options(self, timestamp, effects: AudioEffects = None):
+        if effects is not None:
+            self.effects = effects
+        self.left_off = timestamp
+        self.rate = self.effects.rate if self.effects is not None else 1.0
+        self.ffmpeg_options = self._ffmpeg_options(timestamp)
     
     def seek(self, stamp: float):
         if self.info['stream']:
@@ -63,10 +173,20 @@ class LoopState(Enum):
     PLAYLIST = auto()
     SINGLEINF = auto()
 
+def _requester_id(requester: discord.Member) -> Optional[int]:
+    return requester.id if requester is not None else None
+
 class PlaylistBase:
     '''maintain some info in a playlist for single guild'''
-    def __init__(self):
-        self.order: List[Song] = [] # maintain the song order in a playlist
+    def __init__(self, fair: bool = False):
+        self._order: List[Song] = [] # maintain the song order in a playlist
+        # songs every requester has in the queue, the current one included
+        self._counts: Dict[Optional[int], int] = {}
+        # index of every requester's last song in the queue, or an index past
+        # it after that song moved ahead or was removed. kept up to date per
+        # requester, never by looking through the songs
+        self._last: Dict[Optional[int], int] = {}
+        self.fair: bool = fair # queue songs round robin between requesters
         self.loop_state: LoopState = LoopState.NOTHING
         self.times: int = 0 # use to indicate the times left to play current song
         self.text_channel: discord.TextChannel = None # where to show information to user
@@ -77,8 +197,103 @@ class PlaylistBase:
             return None
         return self.order[idx]
 
+    @property
+    def order(self) -> List[Song]:
+        return self._order
+
+    @order.setter
+    def order(self, songs: List[Song]):
+        self._order = songs
+        self._counts, self._last = {}, {}
+        for index, song in enumerate(songs):
+            self._count(song, 1)
+            self._last[_requester_id(song.requester)] = index
+
+    def _count(self, song: Song, delta: int):
+        key = _requester_id(song.requester)
+        count = self._counts.get(key, 0) + delta
+        if count > 0:
+            self._counts[key] = count
+        else:
+            self._counts.pop(key, None)
+            self._last.pop(key, None)
+
+    def _insert(self, index: int, song: Song):
+        self._order.insert(index, song)
+        for key, last in self._last.items():
+            if last >= index:
+                self._last[key] = last + 1
+        self._count(song, 1)
+        key = _requester_id(song.requester)
+        self._last[key] = max(self._last.get(key, -1), index)
+
+    def _pop(self, index: int) -> Song:
+        song = self._order.pop(index)
+        # a requester whose last song was the removed one keeps the index
+        # before it, their remaining songs are all at or ahead of it
+        for key, last in self._last.items():
+            if last >= index:
+                self._last[key] = last - 1
+        self._count(song, -1)
+        return song
+
+    @staticmethod
+    def _insert_index(index: int, length: int) -> int:
+        '''where list.insert(index, ...) puts an item'''
+        if index < 0:
+            index += length
+        return min(max(index, 0), length)
+
+    def room(self, requester: discord.Member) -> int:
+        '''songs `requester` may still add'''
+        return max(0, min(QUEUE_LIMIT - len(self._order), QUEUE_USER_LIMIT - self._counts.get(_requester_id(requester), 0)))
+
+    def check(self, requester: discord.Member):
+        if len(self._order) >= QUEUE_LIMIT:
+            raise QueueFull(QUEUE_LIMIT, False)
+        if self._counts.get(_requester_id(requester), 0) >= QUEUE_USER_LIMIT:
+            raise QueueFull(QUEUE_USER_LIMIT, True)
+
+    def _fair_index(self, requester: discord.Member) -> int:
+        # the queue is read as rounds holding at most one song of every
+        # requester. the new song is the (n+1)th of its requester, it goes
+        # after the songs every other requester has in the first n+1 rounds,
+        # which only takes the per requester counts, not a scan of the queue.
+        # songs queued before fair mode, or moved, may sit later than the
+        # rounds say, the new song still goes after the requester's last one
+        key = _requester_id(requester)
+        count = self._counts.get(key, 0)
+        index = sum(min(queued, count + 1) for queued in self._counts.values())
+        return max(index, self._last.get(key, -1) + 1)
+
+    def add(self, song: Song) -> int:
+        '''queue a song within the limits, where fair mode puts it. returns its index'''
+        self.check(song.requester)
+        index = self._fair_index(song.requester) if self.fair else len(self._order)
+        self._insert(index, song)
+        return index
+
+    def extend(self, songs: Iterable[Song]) -> int:
+        '''add the songs until the queue is full, returns how many were added'''
+        added = 0
+        for song in songs:
+            if not self.room(song.requester):
+                break
+            self.add(song)
+            added += 1
+        return added
+
+    def append(self, song: Song):
+        '''queue a song last, past the limits. restored queues keep their order'''
+        self._insert(len(self._order), song)
+
+    def remove(self, idx: int) -> Song:
+        return self._pop(range(len(self._order))[idx])
+
     def clear(self):
-        self.order.clear()
+        self._order.clear()
+        self._counts.clear()
+        self._last.clear()
         for key in self._playlisttask: 
             self._playlisttask[key].cancel()
         self._playlisttask.clear()
@@ -89,10 +304,16 @@ class PlaylistBase:
         return self[0]
     
     def swap(self, idx1: int, idx2: int):
-        self.order[idx1], self.order[idx2] = self.order[idx2], self.order[idx1]
+        idx1, idx2 = range(len(self._order))[idx1], range(len(self._order))[idx2]
+        self._order[idx1], self._order[idx2] = self._order[idx2], self._order[idx1]
+        # a song moved ahead leaves its requester's last index past their songs
+        for index in (idx1, idx2):
+            key = _requester_id(self._order[index].requester)
+            self._last[key] = max(self._last[key], index)
 
     def move_to(self, origin: int, new: int):
-        self.order.insert(new, self.order.pop(origin))
+        origin = range(len(self._order))[origin]
+        self._insert(self._insert_index(new, len(self._order) - 1), self._pop(origin))
     
     def rule(self):
         if len(self.order) == 0:
@@ -102,9 +323,9 @@ class PlaylistBase:
         if self.loop_state == LoopState.SINGLE:
             self.times -= 1
         elif self.loop_state == LoopState.PLAYLIST:
-            self.order.append(self.order.pop(0))
+            self.append(self._pop(0))
         else:
-            self.order.pop(0)
+            self.remove(0)
         if self.loop_state == LoopState.SINGLE and self.times == 0:
             self.loop_state =  LoopState.NOTHING
             
@@ -124,39 +345,84 @@ class PlaylistBase:
         else:
             self.loop_state = LoopState.PLAYLIST
 
+    def to_dict(self) -> dict:
+        return {
+            'songs': [[song.video_id, song.requester.id] for song in self.order],
+            'loop': self.loop_state.name,
+            'times': self.times,
+        }
+
 class Playlist:
     def __init__(self):
-        self._guilds_info: Dict[int, PlaylistBase] = dict()
+        registry.register('playlist', lambda guild_id: PlaylistBase(settings.get(guild_id, 'fair', os.getenv('FAIR_QUEUE') == '1')))
+        registry.guard('playlist', self._busy)
+        self._dirty: Set[int] = set() # guilds changed since the last snapshot
+
+    @property
+    def _guilds_info(self) -> Dict[int, PlaylistBase]:
+        return registry.table('playlist')
+
+    def _busy(self, guild_id: int) -> bool:
+        playlist = registry.peek(guild_id, 'playlist')
+        return playlist is not None and (len(playlist.order) > 0 or len(playlist._playlisttask) > 0)
 
     def __delitem__(self, guild_id: int):
-        if self._guilds_info.get(guild_id) is None:
+        if registry.peek(guild_id, 'playlist') is None:
             return
-        del self._guilds_info[guild_id]
+        registry.discard(guild_id, 'playlist')
+        self._dirty.discard(guild_id)
+        # never on the event loop, a writer of another shard may hold the database
+        store.queue_writer.submit(store.delete_queue, guild_id).add_done_callback(self._deleted)
+
+    @staticmethod
+    def _deleted(future: Future):
+        if future.exception() is not None:
+            print(f'[Playlist] Failed to delete a saved queue: {future.exception()!r}')
         
     def __getitem__(self, guild_id) -> PlaylistBase:
-        if self._guilds_info.get(guild_id) is None:
-            self._guilds_info[guild_id] = PlaylistBase()
-        return self._guilds_info[guild_id]
+        return registry[guild_id, 'playlist']
+
+    def save(self, guild_id: int):
+        '''mark the queue of a guild for the next snapshot and the url prefetcher'''
+        self._dirty.add(guild_id)
+        prefetcher.poke(guild_id)
+
+    def pop_dirty(self) -> Set[int]:
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def mark_dirty(self, guild_ids: Iterable[int]):
+        '''guilds a snapshot could not write, the next one takes them again'''
+        self._dirty.update(guild_ids)
 
     def is_playlist(self, url):
         return ytdl.is_playlist(url)
 
     async def process_playlist(self, guild_id, url, requester):
+        tracer.detach()
         for url in ytdl.get_playlist(url):
+            # a full queue ends the playlist, nothing is extracted for songs
+            # that would be dropped
+            if not self[guild_id].room(requester):
+                break
             song = Song(url, requester)
-            self[guild_id].order.append(song)
+            self[guild_id].add(song)
             await asyncio.sleep(0.1)
+        self.save(guild_id)
         return
 
     def get_playlist_id(self, url):
         return ytdl.get_playlist_id(url)
 
-    async def add_songs(self, guild_id, url, requester):
+    async def add_songs(self, guild_id, url, requester) -> int:
         # info = ytdl.get_info(url)
+        self[guild_id].check(requester)
         if self.is_playlist(url):
             url = ytdl.get_first_video(url)
         song = Song(url, requester)
-        self[guild_id].order.append(song)
+        index = self[guild_id].add(song)
+        self.save(guild_id)
+        return index
         # self.requester = requester
         # self.set_ffmpeg_options(0)
 
@@ -168,18 +434,31 @@ class Playlist:
 
     def swap(self, guild_id: int, idx1: int, idx2: int):
         self[guild_id].swap(idx1, idx2)
+        self.save(guild_id)
 
     def move_to(self, guild_id: int, origin: int, new: int):
         self[guild_id].move_to(origin, new)
+        self.save(guild_id)
     
     def pop(self, guild_id: int, idx: int):
-        self[guild_id].order.pop(idx)
+        self[guild_id].remove(idx)
+        self.save(guild_id)
 
     def rule(self, guild_id: int):
         self[guild_id].rule()
+        self.save(guild_id)
             
     def single_loop(self, guild_id: int, times: int = INF):
         self[guild_id].single_loop(times)
+        self.save(guild_id)
 
     def playlist_loop(self, guild_id: int):
-        self[guild_id].playlist_loop()
\ No newline at end of file
+        self[guild_id].playlist_loop()
+        self.save(guild_id)
+
+    def fair_queue(self, guild_id: int) -> bool:
+        '''toggle fair mode, only songs queued afterwards are placed round robin'''
+        playlist = self[guild_id]
+        playlist.fair = not playlist.fair
+        settings.set(guild_id, 'fair', playlist.fair)
+        return playlist.fair
\ No newline at end of file
@@ -0,0 +1,144 @@
+from typing import *
+import asyncio, contextvars, heapq, itertools, os, time, weakref
+
+from .metrics import Counter, Gauge
+from .registry import registry
+from .timerwheel import wheel, Timer
+
+# how many songs after the current one keep a resolved stream url
+PREFETCH_SONGS = int(os.getenv('PREFETCH_SONGS', 3))
+# resolutions per second for all guilds together, and how many run at once
+PREFETCH_RATE = float(os.getenv('PREFETCH_RATE', 2))
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', 2))
+# resolve again this many seconds before the signed url expires
+PREFETCH_MARGIN = float(os.getenv('PREFETCH_MARGIN', 600))
+
+prefetch_resolutions = Counter('tkablent_prefetch_resolutions_total', 'Stream urls resolved ahead of playback', ('result',))
+
+class StreamPrefetcher:
+    '''
+    keeps the stream urls of the first PREFETCH_SONGS + 1 songs of every
+    queue resolved, so starting a song never waits for extraction. queues
+    poke() it when they change, songs are resolved lowest queue position
+    first across all guilds under one rate budget, and each guild has a
+    timer on the wheel that pokes it again before its urls expire
+    '''
+    def __init__(self, songs: int = PREFETCH_SONGS, rate: float = PREFETCH_RATE,
+                 concurrency: int = PREFETCH_CONCURRENCY, margin: float = PREFETCH_MARGIN):
+        self.songs: int = songs
+        self.rate: float = rate
+        self.concurrency: int = concurrency
+        self.margin: float = margin
+        self._dirty: Set[int] = set()
+        self._heap: List[tuple] = [] # (position, expire, seq, guild_id, song)
+        self._queued: Set[Any] = set()
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        self._failed: weakref.WeakSet = weakref.WeakSet() # not prefetched again, the mainloop resolves them
+        self._refresh: Dict[int, Timer] = {}
+        self._seq = itertools.count()
+        self._next_slot: float = 0.0
+        self._wake: asyncio.Event = None
+        self._slots: asyncio.Semaphore = None
+        self._task: asyncio.Task = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def start(self):
+        if self._task is None and self.songs >= 0:
+            self._wake = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            if self._dirty:
+                self._wake.set()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for timer in self._refresh.values():
+            timer.cancel()
+        self._refresh.clear()
+        self._heap.clear()
+        self._queued.clear()
+
+    def poke(self, guild_id: int):
+        '''the queue of a guild changed'''
+        self._dirty.add(guild_id)
+        if self._wake is not None:
+            self._wake.set()
+
+    async def ensure(self, song):
+        '''resolve now if needed, in a thread and shared with a prefetch already running'''
+        if not song.url_fresh():
+            await self._resolve(song)
+
+    def _resolve(self, song) -> Awaitable:
+        future = self._inflight.get(song)
+        if future is None:
+            # executor threads do not inherit contextvars, the get_url span stays under the caller's
+            future = self._inflight[song] = asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, song.refresh_url)
+            future.add_done_callback(lambda future, song=song: self._inflight.pop(song, None))
+        # one waiter giving up must not cancel the others
+        return asyncio.shield(future)
+
+    def _upcoming(self, guild_id: int) -> list:
+        playlist = registry.peek(guild_id, 'playlist')
+        return playlist.order[:self.songs + 1] if playlist is not None else []
+
+    def _plan(self, guild_id: int):
+        if guild_id in self._refresh:
+            self._refresh.pop(guild_id).cancel()
+        soonest = None
+        for position, song in enumerate(self._upcoming(guild_id)):
+            if song.url_fresh(self.margin):
+                soonest = song._stream_expire if soonest is None else min(soonest, song._stream_expire)
+            elif song not in self._queued and song not in self._inflight and song not in self._failed:
+                self._queued.add(song)
+                heapq.heappush(self._heap, (position, song._stream_expire, next(self._seq), guild_id, song))
+        if soonest is not None:
+            self._refresh[guild_id] = wheel.call_later(soonest - self.margin - time.time(), self.poke, guild_id)
+
+    async def _take_budget(self):
+        now = time.monotonic()
+        start = max(self._next_slot, now)
+        self._next_slot = start + 1 / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._dirty or self._heap:
+                dirty, self._dirty = self._dirty, set()
+                for guild_id in dirty:
+                    self._plan(guild_id)
+                if not self._heap:
+                    break
+                _, _, _, guild_id, song = heapq.heappop(self._heap)
+                self._queued.discard(song)
+                # the queue may have moved on while this waited
+                if song.url_fresh(self.margin) or song not in self._upcoming(guild_id):
+                    continue
+                await self._take_budget()
+                await self._slots.acquire()
+                asyncio.get_running_loop().create_task(self._prefetch(guild_id, song))
+
+    async def _prefetch(self, guild_id: int, song):
+        try:
+            await self._resolve(song)
+            prefetch_resolutions.inc(result='resolved')
+            if not song.url_fresh(self.margin):
+                # expires sooner than the margin, resolving again would not help
+                self._failed.add(song)
+        except Exception:
+            # the mainloop tries again and reports it when the song is played
+            self._failed.add(song)
+            prefetch_resolutions.inc(result='failed')
+        finally:
+            self._slots.release()
+        self.poke(guild_id) # schedules the refresh of what was just resolved
+
+prefetcher = StreamPrefetcher()
+Gauge('tkablent_prefetch_pending', 'Songs waiting for their stream url to be prefetched', fn=lambda: len(prefetcher))
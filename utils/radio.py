@@ -0,0 +1,184 @@
+from typing import *
+import asyncio, collections, os
+
+import discord
+
+from .playlist import Song, ytdl
+from .prefetch import prefetcher
+from .registry import registry
+from .store import store, settings
+from .history import recent_videos
+from .metrics import Counter
+
+# songs remembered per guild, autoplay never picks one of them again
+RADIO_HISTORY = int(os.getenv('RADIO_HISTORY', 50))
+# how many of the latest songs seed the candidates
+RADIO_SEEDS = int(os.getenv('RADIO_SEEDS', 3))
+RELATED_LIMIT = 10
+# related videos are shared by every guild and kept this many days
+RELATED_TTL = float(os.getenv('RELATED_TTL', 7)) * 86400
+
+radio_picks = Counter('tkablent_radio_picks_total', 'Songs queued by autoplay, by whether one was staged before the queue ran out', ('staged',))
+related_cache = Counter('tkablent_related_cache_total', 'Related video lookups served from the store or extracted', ('result',))
+
+class RadioState:
+    def __init__(self, guild_id: int):
+        self.guild_id: int = guild_id
+        self.enabled: bool = settings.get(guild_id, 'autoplay', False)
+        self.seeded: bool = False # history of former runs read from the play history
+        self.held: bool = False # stopped by a user, the next song they play lifts it
+        self.history: Deque[dict] = collections.deque(maxlen=RADIO_HISTORY) # info of played songs, latest last
+        self.staged: Song = None # the next pick, its stream url already resolved
+        self.task: asyncio.Task = None
+
+class Radio:
+    '''
+    autoplay: when the queue of a guild runs out, queue a song related to
+    what it has been playing. while the last song plays, candidates are
+    ranked from the related videos of the latest songs in the background
+    and the best playable one is staged with its stream url resolved, so
+    next() normally hands it over without waiting
+    '''
+    def __init__(self):
+        registry.register('radio', RadioState)
+
+    def __getitem__(self, guild_id: int) -> RadioState:
+        return registry[guild_id, 'radio']
+
+    def toggle(self, guild_id: int) -> bool:
+        state = self[guild_id]
+        state.enabled = not state.enabled
+        settings.set(guild_id, 'autoplay', state.enabled)
+        if not state.enabled:
+            self._drop(state)
+        return state.enabled
+
+    def hold(self, guild_id: int):
+        '''the queue was stopped on purpose, do not refill it'''
+        state = registry.peek(guild_id, 'radio')
+        if state is not None:
+            state.held = True
+            self._drop(state)
+
+    def _drop(self, state: RadioState):
+        if state.task is not None:
+            state.task.cancel()
+            state.task = None
+        state.staged = None
+
+    def played(self, guild_id: int, song: Song, remaining: int, requester: discord.Member):
+        '''a song started with `remaining` songs queued after it'''
+        state = self[guild_id]
+        state.held = False
+        # loops start the same song again
+        if not state.history or state.history[-1]['video_id'] != song.info['video_id']:
+            state.history.append(song.info)
+        if state.enabled and remaining == 0:
+            self.prepare(guild_id, requester)
+
+    def prepare(self, guild_id: int, requester: discord.Member):
+        '''stage the next pick in the background'''
+        state = self[guild_id]
+        if not state.history:
+            return
+        self._drop(state)
+        state.task = asyncio.get_running_loop().create_task(self._stage(state, requester))
+
+    async def next(self, guild_id: int, requester: discord.Member) -> Optional[Song]:
+        '''the song to queue now that the queue ran out, None if autoplay is off or found nothing'''
+        state = self[guild_id]
+        if not state.enabled or state.held or not state.history:
+            return None
+        song, state.staged = state.staged, None
+        if song is not None and not self._played(state, song.info):
+            radio_picks.inc(staged='yes')
+            return song
+        if state.task is None or state.task.done():
+            self.prepare(guild_id, requester)
+        task = state.task
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise # this mainloop is the one being cancelled
+        song, state.staged = state.staged, None
+        if song is not None:
+            radio_picks.inc(staged='no')
+        return song
+
+    @staticmethod
+    def _played(state: RadioState, info: dict) -> bool:
+        return any(played['video_id'] == info['video_id'] or played['title'] == info['title'] for played in state.history)
+
+    async def _seed(self, state: RadioState):
+        '''after a restart the history goes on from the persistent play history'''
+        state.seeded = True
+        try:
+            videos = await asyncio.get_running_loop().run_in_executor(None, recent_videos, state.guild_id, RADIO_HISTORY)
+        except Exception as e:
+            print(f'[Radio] Failed to read the play history of guild {state.guild_id}: {e!r}')
+            return
+        known = {info['video_id'] for info in state.history}
+        older = [info for info in videos if info['video_id'] not in known]
+        # what played since the restart stays the latest
+        room = RADIO_HISTORY - len(state.history)
+        if room > 0:
+            for info in reversed(older[-room:]):
+                state.history.appendleft(info)
+
+    async def _stage(self, state: RadioState, requester: discord.Member):
+        if not state.seeded:
+            await self._seed(state)
+        seeds = []
+        for info in reversed(state.history):
+            if len(seeds) == RADIO_SEEDS:
+                break
+            if all(seed['video_id'] != info['video_id'] for seed in seeds):
+                seeds.append(info)
+        related = await asyncio.get_running_loop().run_in_executor(None, lambda: [self.related(seed) for seed in seeds])
+        for info in self.rank(state.history, related):
+            song = Song.from_info(info, requester)
+            try:
+                await prefetcher.ensure(song)
+            except Exception:
+                continue # not playable here, try the next one
+            state.staged = song
+            return
+
+    def related(self, info: dict) -> List[dict]:
+        '''blocking, looked up in the store before asking youtube'''
+        related = store.get_related(info['video_id'], RELATED_TTL)
+        if related is not None:
+            related_cache.inc(result='hit')
+            return related
+        related_cache.inc(result='miss')
+        try:
+            related = ytdl.get_related(info, RELATED_LIMIT)
+        except Exception as e:
+            print(f'[Radio] Failed to find videos related to {info["video_id"]}: {e!r}')
+            return []
+        store.save_related(info['video_id'], related)
+        return related
+
+    @staticmethod
+    def rank(history: Sequence[dict], related: Sequence[List[dict]]) -> List[dict]:
+        '''
+        best first. `related` holds one list per seed, latest seed first. a
+        video scores more the higher it ranks in the list of a more recent
+        seed, for every seed listing it and for every time its author was
+        played. played videos, reuploads of played titles and live streams
+        are left out
+        '''
+        played = {info['video_id'] for info in history} | {info['title'] for info in history}
+        authors = collections.Counter(info['author'] for info in history)
+        scores: Dict[str, float] = {}
+        candidates: Dict[str, dict] = {}
+        for age, videos in enumerate(related):
+            for position, info in enumerate(videos):
+                if info['video_id'] in played or info['title'] in played or info['stream']:
+                    continue
+                scores[info['video_id']] = scores.get(info['video_id'], 0) + 1 / (age + 1) / (position + 1)
+                candidates[info['video_id']] = info
+        for video_id, info in candidates.items():
+            scores[video_id] += authors[info['author']] / len(history)
+        return sorted(candidates.values(), key=lambda info: scores[info['video_id']], reverse=True)
@@ -0,0 +1,111 @@
+from typing import *
+import asyncio, os, sys, time
+
+from .metrics import Counter, Gauge
+
+GUILD_STATE_IDLE = float(os.getenv('GUILD_STATE_IDLE', 1800))
+
+guild_states = Gauge('tkablent_guild_states', 'Per guild state objects held, by kind', ('kind',))
+guild_state_evictions = Counter('tkablent_guild_state_evictions_total', 'Guilds whose state was dropped after being idle')
+
+class GuildRegistry:
+    '''
+    every piece of per guild state (player, playlist, ui) lives here, keyed by
+    kind. `registry[guild_id, kind]` creates an entry, `peek` never does. a
+    guild untouched for `idle` seconds that no guard reports busy is evicted
+    with all of its kinds at once
+    '''
+    def __init__(self, idle: float = GUILD_STATE_IDLE, sweep_interval: float = 60.0):
+        self.idle: float = idle
+        self.sweep_interval: float = sweep_interval
+        self._factories: Dict[str, Callable[[int], Any]] = {}
+        self._tables: Dict[str, Dict[int, Any]] = {}
+        self._touched: Dict[int, float] = {}
+        self._guards: Dict[str, Callable[[int], bool]] = {}
+        self._task: asyncio.Task = None
+
+    def register(self, kind: str, factory: Callable[[int], Any]):
+        self._factories[kind] = factory
+        self._tables.setdefault(kind, {})
+
+    def guard(self, kind: str, busy: Callable[[int], bool]):
+        '''a guild is never evicted while busy(guild_id) is true'''
+        self._guards[kind] = busy
+
+    def __getitem__(self, key: Tuple[int, str]) -> Any:
+        guild_id, kind = key
+        table = self._tables[kind]
+        self._touched[guild_id] = time.monotonic()
+        state = table.get(guild_id)
+        if state is None:
+            state = table[guild_id] = self._factories[kind](guild_id)
+        return state
+
+    def put(self, guild_id: int, kind: str, state: Any) -> Any:
+        '''store state built elsewhere unless the guild has some already, returns the kept one'''
+        self._touched[guild_id] = time.monotonic()
+        return self._tables[kind].setdefault(guild_id, state)
+
+    def peek(self, guild_id: int, kind: str) -> Optional[Any]:
+        return self._tables[kind].get(guild_id)
+
+    def table(self, kind: str) -> Dict[int, Any]:
+        '''live guild_id -> state mapping of one kind, do not modify'''
+        return self._tables.setdefault(kind, {})
+
+    def discard(self, guild_id: int, kind: str = None):
+        for name in ([kind] if kind is not None else list(self._tables)):
+            self._tables[name].pop(guild_id, None)
+        if not any(guild_id in table for table in self._tables.values()):
+            self._touched.pop(guild_id, None)
+
+    def clear(self):
+        for table in self._tables.values():
+            table.clear()
+        self._touched.clear()
+
+    def __len__(self):
+        return len(self._touched)
+
+    def busy(self, guild_id: int) -> bool:
+        return any(busy(guild_id) for busy in self._guards.values())
+
+    def evict_idle(self) -> int:
+        deadline = time.monotonic() - self.idle
+        idle = [guild_id for guild_id, touched in self._touched.items() if touched < deadline and not self.busy(guild_id)]
+        for guild_id in idle:
+            self.discard(guild_id)
+        guild_state_evictions.inc(len(idle))
+        for kind, table in self._tables.items():
+            guild_states.set(len(table), kind=kind)
+        return len(idle)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._sweep())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.evict_idle()
+
+    def report(self) -> dict:
+        now = time.monotonic()
+        ages = sorted(now - touched for touched in self._touched.values())
+        return {
+            'guilds': len(self._touched),
+            'busy': sum(1 for guild_id in self._touched if self.busy(guild_id)),
+            'kinds': {kind: len(table) for kind, table in self._tables.items()},
+            'bytes': {kind: sum(sys.getsizeof(state) + sys.getsizeof(getattr(state, '__dict__', {})) for state in table.values())
+                      for kind, table in self._tables.items()},
+            'idle_median': ages[len(ages) // 2] if ages else 0.0,
+            'idle_max': ages[-1] if ages else 0.0,
+            'evictions': guild_state_evictions.value(),
+        }
+
+registry = GuildRegistry()
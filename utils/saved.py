@@ -0,0 +1,158 @@
+from typing import *
+import asyncio, json, os, re
+from urllib.parse import urlsplit
+
+from .playlist import Song, ytdl, WATCH_URL
+from .store import store
+
+# tracks one saved playlist may hold
+SAVED_PLAYLIST_MAX = int(os.getenv('SAVED_PLAYLIST_MAX', 500))
+NAME_LENGTH = 32
+TEXT_LENGTH = 200
+THUMBNAIL_HOSTS = ('i.ytimg.com', 'i1.ytimg.com', 'i2.ytimg.com', 'i3.ytimg.com', 'i4.ytimg.com',
+                   'i9.ytimg.com', 'img.youtube.com', 'yt3.ggpht.com')
+
+class SavedPlaylistError(Exception): ...
+
+_video_id = re.compile(r'(?:v=|youtu\.be/|/shorts/)([0-9A-Za-z_-]{11})')
+_id = re.compile(r'[0-9A-Za-z_-]{11}')
+
+def export_json(name: str, infos: List[dict]) -> str:
+    return json.dumps({'name': name, 'tracks': infos}, ensure_ascii=False, indent=1)
+
+def export_m3u(infos: List[dict]) -> str:
+    lines = ['#EXTM3U']
+    for info in infos:
+        lines.append(f"#EXTINF:{-1 if info['stream'] else info['length']},{info['author']} - {info['title']}")
+        lines.append(info['watch_url'])
+    return '\n'.join(lines) + '\n'
+
+def _valid(track: dict) -> bool:
+    '''whether the metadata of an imported track looks like what ytdl produces'''
+    try:
+        return all(isinstance(track[key], str) and 0 < len(track[key]) <= TEXT_LENGTH for key in ('title', 'author')) \
+            and type(track['length']) is int and track['length'] >= 0 and type(track['stream']) is bool \
+            and isinstance(track['channel_url'], str) and track['channel_url'].startswith('https://www.youtube.com/') \
+            and isinstance(track['thumbnail_url'], str) and urlsplit(track['thumbnail_url']).scheme == 'https' \
+            and urlsplit(track['thumbnail_url']).hostname in THUMBNAIL_HOSTS
+    except (KeyError, ValueError):
+        return False
+
+def parse_import(text: str) -> List[Union[dict, str]]:
+    '''
+    the tracks of an exported file, JSON (ours, or a plain list of urls) or
+    M3U. a track is its metadata when the file has all of it and it is valid,
+    otherwise the url that still has to be resolved
+    '''
+    text = text.lstrip('\ufeff').strip()
+    if text.startswith(('{', '[')):
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise SavedPlaylistError(f'invalid JSON: {e}')
+        tracks = data.get('tracks', []) if isinstance(data, dict) else data
+        keys = ('video_id', 'title', 'author', 'channel_url', 'thumbnail_url', 'length', 'stream')
+        parsed = []
+        for track in tracks:
+            if isinstance(track, dict) and isinstance(track.get('video_id'), str) and _id.fullmatch(track['video_id']):
+                # only the id decides what is played, never a url from the file
+                if _valid(track):
+                    parsed.append(dict({key: track[key] for key in keys}, watch_url=WATCH_URL.format(track['video_id'])))
+                else:
+                    parsed.append(WATCH_URL.format(track['video_id']))
+            elif isinstance(track, dict) and isinstance(track.get('watch_url') or track.get('url'), str):
+                parsed.append(track.get('watch_url') or track.get('url'))
+            elif isinstance(track, str):
+                parsed.append(track)
+    else:
+        parsed = [line.strip() for line in text.splitlines() if line.strip() and not line.startswith('#')]
+    # urls are reduced to their video id as well
+    parsed = [track if isinstance(track, dict) else WATCH_URL.format(_video_id.search(track).group(1))
+              for track in parsed if isinstance(track, dict) or _video_id.search(track)]
+    if not parsed:
+        raise SavedPlaylistError('no youtube video found in the file')
+    return parsed[:SAVED_PLAYLIST_MAX]
+
+class SavedPlaylists:
+    '''
+    named playlists per guild. the metadata of every track is saved with it,
+    loading one builds the songs from the store without any extraction
+    '''
+    @staticmethod
+    def _name(name: str) -> str:
+        name = name.strip()
+        if not name or len(name) > NAME_LENGTH:
+            raise SavedPlaylistError(f'playlist names have 1 to {NAME_LENGTH} characters')
+        return name
+
+    async def _run(self, fn: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _check_owner(self, guild_id: int, name: str, member: int, manager: bool):
+        owner = await self._run(store.playlist_owner, guild_id, name)
+        if owner is not None and owner != member and not manager:
+            raise SavedPlaylistError(f'{name} belongs to <@{owner}>, only they or a server manager can change it')
+
+    async def _save(self, guild_id: int, name: str, owner: int, infos: List[dict], manager: bool, imported: Collection[str]=()):
+        if not await self._run(store.save_playlist, guild_id, name, owner, infos, manager, imported):
+            await self._check_owner(guild_id, name, owner, manager)
+            raise SavedPlaylistError(f'{name} was changed meanwhile, try again')
+
+    async def save(self, guild_id: int, name: str, owner: int, songs: List[Song], manager: bool=False) -> int:
+        name = self._name(name)
+        if not songs:
+            raise SavedPlaylistError('nothing to save')
+        await self._check_owner(guild_id, name, owner, manager)
+        # songs restored from a snapshot may not have their metadata yet
+        infos = await self._run(lambda: [song.info for song in songs[:SAVED_PLAYLIST_MAX]])
+        await self._save(guild_id, name, owner, infos, manager)
+        return len(infos)
+
+    async def save_youtube(self, guild_id: int, name: str, owner: int, url: str, manager: bool=False) -> Tuple[int, int]:
+        '''resolve a youtube playlist once and save it, (saved, failed)'''
+        name = self._name(name)
+        await self._check_owner(guild_id, name, owner, manager)
+        urls = await self._run(lambda: [ytdl.get_first_video(url)] + list(ytdl.get_playlist(url)))
+        return await self._resolve_and_save(guild_id, name, owner, urls, manager)
+
+    async def import_file(self, guild_id: int, name: str, owner: int, text: str, manager: bool=False) -> Tuple[int, int]:
+        '''(saved, failed), urls without metadata in the file are resolved now'''
+        name = self._name(name)
+        await self._check_owner(guild_id, name, owner, manager)
+        return await self._resolve_and_save(guild_id, name, owner, parse_import(text), manager)
+
+    async def _resolve_and_save(self, guild_id: int, name: str, owner: int, tracks: List[Union[dict, str]], manager: bool) -> Tuple[int, int]:
+        # tracks past the cap are not saved, they did not fail either
+        tracks = tracks[:SAVED_PLAYLIST_MAX]
+        def resolve() -> List[dict]:
+            infos = []
+            for track in tracks:
+                if isinstance(track, dict):
+                    infos.append(track)
+                    continue
+                try:
+                    infos.append(ytdl.get_info(track))
+                except Exception as e:
+                    print(f'[SavedPlaylists] Skipping {track}: {e!r}')
+            return infos
+        infos = await self._run(resolve)
+        if not infos:
+            raise SavedPlaylistError('none of the tracks could be resolved')
+        # metadata from a file never replaces what the bot extracted itself
+        await self._save(guild_id, name, owner, infos, manager, {track['video_id'] for track in tracks if isinstance(track, dict)})
+        return len(infos), len(tracks) - len(infos)
+
+    async def load(self, guild_id: int, name: str) -> List[dict]:
+        infos = await self._run(store.load_playlist, guild_id, self._name(name))
+        if infos is None:
+            raise SavedPlaylistError(f'no playlist named {name}')
+        return infos
+
+    async def names(self, guild_id: int) -> List[Tuple[str, int]]:
+        return await self._run(store.saved_playlists, guild_id)
+
+    async def delete(self, guild_id: int, name: str, member: int, manager: bool=False):
+        name = self._name(name)
+        if not await self._run(store.delete_playlist, guild_id, name, member, manager):
+            await self._check_owner(guild_id, name, member, manager)
+            raise SavedPlaylistError(f'no playlist named {name}')
@@ -0,0 +1,187 @@
+from typing import *
+import threading
+
+from discord import AudioSource
+from discord.opus import Encoder as OpusEncoder
+
+from .ffmpeg import SupervisedFFmpegPCMAudio
+
+# discord.py reads one 20ms frame per loop, 50 loops per second
+FRAMES_PER_SEC = 50
+
+class SharedStream:
+    '''
+    one ffmpeg download/decode pipeline shared by every reader of the same
+    (video id, offset window). decoded frames are kept as the original bytes
+    objects, readers only hold an index into the buffer so nothing is copied.
+    a producer thread of its own decodes ahead of the fastest reader, a
+    reader never waits on ffmpeg while holding the lock
+    '''
+    def __init__(self, key, url: str, start: float, ffmpeg_options: dict, retention: int, read_ahead: int):
+        self.key: Tuple[str, int] = key
+        self.start: float = start # media time of absolute frame 0
+        self.retention: int = retention # frames kept behind the slowest reader
+        self.read_ahead: int = read_ahead # frames decoded past the fastest reader
+        self.finished: bool = False
+        self._closed: bool = False
+        self._source: SupervisedFFmpegPCMAudio = SupervisedFFmpegPCMAudio(url, **ffmpeg_options)
+        self._frames: List[bytes] = []
+        self._base: int = 0 # absolute index of self._frames[0]
+        self._readers: Dict[int, int] = {} # id(reader) -> absolute position
+        self._cond = threading.Condition()
+        threading.Thread(target=self._produce, name=f'shared-{key[0]}-{key[1]}', daemon=True).start()
+
+    @property
+    def base(self) -> int:
+        return self._base
+
+    @property
+    def produced(self) -> int:
+        return self._base + len(self._frames)
+
+    def frame_at(self, timestamp: float) -> int:
+        return max(0, round((timestamp - self.start) * FRAMES_PER_SEC))
+
+    def attach(self, reader: 'SharedStreamReader', position: int):
+        with self._cond:
+            self._readers[id(reader)] = position
+            self._cond.notify_all()
+
+    def detach(self, reader: 'SharedStreamReader') -> int:
+        with self._cond:
+            self._readers.pop(id(reader), None)
+            return len(self._readers)
+
+    def _wanted(self) -> int:
+        return max(self._readers.values(), default=self._base) + self.read_ahead
+
+    def _produce(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._closed and self.produced >= self._wanted():
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                data = self._source.read()
+                with self._cond:
+                    if len(data) != OpusEncoder.FRAME_SIZE:
+                        self.finished = True
+                        return
+                    self._frames.append(data)
+                    self._cond.notify_all()
+        except Exception as e:
+            if not self._closed:
+                print(f'[SharedStream] Pipeline {self.key} failed: {e!r}')
+        finally:
+            with self._cond:
+                self.finished = True
+                self._cond.notify_all()
+
+    def read(self, reader: 'SharedStreamReader') -> bytes:
+        idx = reader.position
+        with self._cond:
+            # a late joiner ahead of the buffer waits for the producer,
+            # everyone else is served from the buffer meanwhile
+            while idx >= self.produced and not self.finished:
+                self._cond.wait()
+            if idx >= self.produced:
+                return b''
+            data = self._frames[idx - self._base]
+            reader.position = self._readers[id(reader)] = idx + 1
+            self._trim()
+            self._cond.notify_all()
+        return data
+
+    def _trim(self):
+        # keep `retention` frames behind the slowest reader for late joiners,
+        # a reader paused for longer than that is moved to a new pipeline
+        slowest = min(self._readers.values(), default=self.produced)
+        drop = min(slowest, self.produced) - self.retention - self._base
+        if drop > 0:
+            del self._frames[:drop]
+            self._base += drop
+
+    def cleanup(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._source.cleanup()
+        with self._cond:
+            self._frames.clear()
+
+class SharedStreamReader(AudioSource):
+    '''per guild cursor into a SharedStream'''
+    def __init__(self, pool: 'SharedStreamPool', video_id: str, url: str, timestamp: float, ffmpeg_options: Callable[[float], dict], live: bool = False):
+        self.pool = pool
+        self._video_id = video_id
+        self._url = url
+        self._ffmpeg_options = ffmpeg_options
+        self.stream: SharedStream = None
+        self.position: int = 0
+        pool._acquire(self, timestamp, live)
+
+    @property
+    def timestamp(self) -> float:
+        return self.stream.start + self.position / FRAMES_PER_SEC
+
+    def read(self) -> bytes:
+        if self.position < self.stream.base:
+            # fell out of the shared buffer, continue on a pipeline of our own
+            timestamp = self.timestamp
+            self.pool.release(self)
+            self.pool._acquire(self, timestamp)
+        return self.stream.read(self)
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        self.pool.release(self)
+
+class SharedStreamPool:
+    '''
+    hands out readers for (video id, offset window) keys, so several guilds
+    playing the same track only run a single ffmpeg process
+    '''
+    def __init__(self, window: float = 30.0, retention: float = 60.0, read_ahead: float = 5.0):
+        self.window: float = window
+        self.retention: int = int(retention * FRAMES_PER_SEC)
+        self.read_ahead: int = int(read_ahead * FRAMES_PER_SEC)
+        self._streams: Dict[Tuple[str, int], SharedStream] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._streams)
+
+    def _acquire(self, reader: SharedStreamReader, timestamp: float, live: bool = False):
+        '''point the reader at a stream, attached under the pool lock so release() never cleans up a stream being handed out'''
+        key = (reader._video_id, 0 if live else int(timestamp // self.window))
+        with self._lock:
+            stream = self._streams.get(key)
+            position = None
+            if stream is not None and not stream.finished:
+                if live:
+                    position = stream.produced
+                elif timestamp >= stream.start and stream.frame_at(timestamp) >= stream.base:
+                    position = stream.frame_at(timestamp)
+            if position is None:
+                stream = SharedStream(key, reader._url, timestamp, reader._ffmpeg_options(timestamp), self.retention, self.read_ahead)
+                # an older pipeline for the same key keeps running for its readers,
+                # only new joiners are pointed at the newest one
+                self._streams[key] = stream
+                position = 0
+            reader.stream, reader.position = stream, position
+            stream.attach(reader, position)
+
+    def open(self, video_id: str, url: str, timestamp: float, ffmpeg_options: Callable[[float], dict], live: bool = False) -> SharedStreamReader:
+        return SharedStreamReader(self, video_id, url, timestamp, ffmpeg_options, live)
+
+    def release(self, reader: SharedStreamReader):
+        stream = reader.stream
+        with self._lock:
+            if stream.detach(reader) > 0:
+                return
+            if self._streams.get(stream.key) is stream:
+                del self._streams[stream.key]
+        stream.cleanup()
@@ -0,0 +1,131 @@
+from typing import *
+import asyncio, os
+
+import discord
+
+from .playlist import Song, LoopState
+from .store import store, settings
+
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', 15))
+
+class Snapshotter:
+    '''
+    periodically write the queue and playback position of every guild that
+    changed (or is playing, since its position moves) to the store, and bring
+    them back after a restart without extracting any metadata up front
+    '''
+    def __init__(self, musicbot, interval: float = SNAPSHOT_INTERVAL):
+        self.musicbot = musicbot
+        self.interval: float = interval
+        self._task: asyncio.Task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = self.musicbot.bot.loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                print(f'[Snapshot] Failed to write snapshot: {e!r}')
+
+    def _playing_guilds(self) -> Set[int]:
+        guilds = set()
+        for guild_id in list(self.musicbot._playlist._guilds_info):
+            guild = self.musicbot.bot.get_guild(guild_id)
+            if guild is not None and guild.voice_client is not None and guild.voice_client.is_playing():
+                guilds.add(guild_id)
+        return guilds
+
+    def _state(self, guild_id: int) -> Optional[dict]:
+        playlist = self.musicbot._playlist._guilds_info.get(guild_id)
+        guild = self.musicbot.bot.get_guild(guild_id)
+        if playlist is None or len(playlist.order) == 0 or guild is None or guild.voice_client is None:
+            return None
+        data = playlist.to_dict()
+        data['voice'] = guild.voice_client.channel.id
+        text_channel = self.musicbot[guild_id].text_channel
+        data['text'] = text_channel.id if text_channel is not None else None
+        # a song whose metadata is not loaded yet is not extracted here, on the event loop
+        song = playlist[0]
+        data['position'] = 0 if song.loaded and song.info['stream'] else self.musicbot.current_timestamp(guild)
+        return data
+
+    async def snapshot(self):
+        dirty = self.musicbot._playlist.pop_dirty()
+        guilds = dirty | self._playing_guilds()
+        if not guilds:
+            return
+        states = {}
+        for guild_id in guilds:
+            try:
+                states[guild_id] = self._state(guild_id)
+            except Exception as e:
+                print(f'[Snapshot] Failed to snapshot guild {guild_id}: {e!r}')
+                self.musicbot._playlist.mark_dirty((guild_id,))
+
+        def write():
+            for guild_id, data in states.items():
+                if data is None:
+                    store.delete_queue(guild_id)
+                else:
+                    store.save_queue(guild_id, data)
+        try:
+            await self.musicbot.bot.loop.run_in_executor(store.queue_writer, write)
+        except Exception:
+            self.musicbot._playlist.mark_dirty(dirty)
+            raise
+
+    async def _member(self, guild: discord.Guild, member_id: int, cache: Dict[int, discord.Member]) -> discord.Member:
+        if member_id not in cache:
+            member = guild.get_member(member_id)
+            if member is None:
+                try:
+                    member = await guild.fetch_member(member_id)
+                except discord.HTTPException:
+                    member = guild.me # requester left the guild
+            cache[member_id] = member
+        return cache[member_id]
+
+    async def _delete(self, guild_id: int):
+        await self.musicbot.bot.loop.run_in_executor(store.queue_writer, store.delete_queue, guild_id)
+
+    async def restore(self):
+        '''rejoin and resume every guild of this shard that had a queue when we went down'''
+        loop = self.musicbot.bot.loop
+        for guild_id in await loop.run_in_executor(None, store.queued_guilds):
+            guild = self.musicbot.bot.get_guild(guild_id)
+            if guild is None:
+                continue # belongs to another shard / process
+            data = await loop.run_in_executor(None, store.load_queue, guild_id)
+            try:
+                await self._restore_guild(guild, data)
+            except Exception as e:
+                print(f'[Snapshot] Failed to restore guild {guild_id}: {e!r}')
+                await self._delete(guild_id)
+
+    async def _restore_guild(self, guild: discord.Guild, data: dict):
+        await settings.load(guild.id)
+        channel = guild.get_channel(data.get('voice'))
+        text_channel = guild.get_channel(data.get('text')) if data.get('text') else None
+        if not isinstance(channel, (discord.VoiceChannel, discord.StageChannel)) or not data['songs'] or text_channel is None:
+            await self._delete(guild.id)
+            return
+
+        members: Dict[int, discord.Member] = {}
+        playlist = self.musicbot._playlist[guild.id]
+        for video_id, requester_id in data['songs']:
+            playlist.append(Song.from_snapshot(video_id, await self._member(guild, requester_id, members)))
+        playlist.loop_state = LoopState[data['loop']]
+        playlist.times = data['times']
+        playlist[0].start_at = data.get('position', 0)
+
+        await self.musicbot._join(channel)
+        await self.musicbot._play(guild, text_channel)
@@ -0,0 +1,264 @@
+from typing import *
+import asyncio, sqlite3, threading, json, os, time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .registry import registry
+
+class Store:
+    '''
+    sqlite backed state shared by every bot process on the node. guilds are
+    split between processes by shard, so rows never have two writers, WAL
+    mode lets all processes read and write the file at the same time
+    '''
+    def __init__(self, path: str):
+        self.path: str = path
+        self._conn: sqlite3.Connection = None
+        self._lock = threading.Lock()
+        # queue snapshots and deletions, one thread so they land in the order they were made
+        self.queue_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='queues')
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # connect lazily, a connection must not be inherited by forked workers
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA foreign_keys=ON')
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS settings (
+                    guild_id INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (guild_id, key)
+                );
+                CREATE TABLE IF NOT EXISTS queues (
+                    guild_id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS related (
+                    video_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS play_blocks (
+                    guild_id INTEGER NOT NULL,
+                    first REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    tracks TEXT NOT NULL,
+                    track BLOB NOT NULL,
+                    requester BLOB NOT NULL,
+                    started BLOB NOT NULL,
+                    listened BLOB NOT NULL,
+                    skipped BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS play_blocks_guild ON play_blocks (guild_id, first);
+                CREATE TABLE IF NOT EXISTS play_totals (
+                    guild_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    plays INTEGER NOT NULL,
+                    skips INTEGER NOT NULL,
+                    listened REAL NOT NULL,
+                    PRIMARY KEY (guild_id, kind, key)
+                );
+                CREATE INDEX IF NOT EXISTS play_totals_plays ON play_totals (guild_id, kind, plays);
+                CREATE INDEX IF NOT EXISTS play_totals_skips ON play_totals (guild_id, kind, skips);
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS saved_playlists (
+                    id INTEGER PRIMARY KEY,
+                    guild_id INTEGER NOT NULL,
+                    name TEXT NOT NULL COLLATE NOCASE,
+                    owner INTEGER NOT NULL,
+                    updated REAL NOT NULL,
+                    UNIQUE (guild_id, name)
+                );
+                CREATE TABLE IF NOT EXISTS saved_tracks (
+                    playlist_id INTEGER NOT NULL REFERENCES saved_playlists (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    video_id TEXT NOT NULL,
+                    PRIMARY KEY (playlist_id, position)
+                ) WITHOUT ROWID;
+            ''')
+        return self._conn
+
+    def execute(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        with self._lock:
+            return self.conn.execute(sql, tuple(params)).fetchall()
+
+    def get_setting(self, guild_id: int, key: str, default=None):
+        rows = self.execute('SELECT value FROM settings WHERE guild_id = ? AND key = ?', (guild_id, key))
+        return json.loads(rows[0][0]) if rows else default
+
+    def get_settings(self, guild_id: int) -> Dict[str, Any]:
+        return {key: json.loads(value) for key, value in self.execute('SELECT key, value FROM settings WHERE guild_id = ?', (guild_id,))}
+
+    def set_setting(self, guild_id: int, key: str, value):
+        self.execute('INSERT OR REPLACE INTO settings (guild_id, key, value) VALUES (?, ?, ?)', (guild_id, key, json.dumps(value)))
+
+    def save_queue(self, guild_id: int, data: dict):
+        self.execute('INSERT OR REPLACE INTO queues (guild_id, data, updated) VALUES (?, ?, ?)', (guild_id, json.dumps(data, separators=(',', ':')), time.time()))
+
+    def load_queue(self, guild_id: int) -> Optional[dict]:
+        rows = self.execute('SELECT data FROM queues WHERE guild_id = ?', (guild_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def delete_queue(self, guild_id: int):
+        self.execute('DELETE FROM queues WHERE guild_id = ?', (guild_id,))
+
+    def queued_guilds(self) -> List[int]:
+        return [row[0] for row in self.execute('SELECT guild_id FROM queues')]
+
+    def get_related(self, video_id: str, max_age: float) -> Optional[List[dict]]:
+        rows = self.execute('SELECT data FROM related WHERE video_id = ? AND updated >= ?', (video_id, time.time() - max_age))
+        return json.loads(rows[0][0]) if rows else None
+
+    def save_related(self, video_id: str, related: List[dict]):
+        self.execute('INSERT OR REPLACE INTO related (video_id, data, updated) VALUES (?, ?, ?)', (video_id, json.dumps(related, separators=(',', ':')), time.time()))
+
+    def append_plays(self, guild_id: int, block: dict, totals: List[tuple], infos: List[dict] = ()):
+        '''one history block, what it adds to the totals and the metadata of its tracks, in one transaction'''
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany('INSERT OR REPLACE INTO videos (video_id, data) VALUES (?, ?)',
+                                      [(info['video_id'], json.dumps(info, separators=(',', ':'))) for info in infos])
+                self.conn.execute('INSERT INTO play_blocks (guild_id, first, count, tracks, track, requester, started, listened, skipped) '
+                                  'VALUES (:guild_id, :first, :count, :tracks, :track, :requester, :started, :listened, :skipped)', dict(block, guild_id=guild_id))
+                self.conn.executemany('''
+                    INSERT INTO play_totals (guild_id, kind, key, label, plays, skips, listened) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (guild_id, kind, key) DO UPDATE SET label = excluded.label, plays = plays + excluded.plays,
+                        skips = skips + excluded.skips, listened = listened + excluded.listened
+                ''', [(guild_id, *row) for row in totals])
+                self.conn.execute('COMMIT')
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def play_totals(self, guild_id: int, kind: str, order: str, limit: int, min_plays: int = 0) -> List[dict]:
+        '''the `limit` keys of a kind with the most plays, skips or the highest skip rate'''
+        order = {'plays': 'plays DESC', 'skips': 'skips DESC', 'skip_rate': 'CAST(skips AS REAL) / plays DESC, plays DESC'}[order]
+        rows = self.execute(f'SELECT key, label, plays, skips, listened FROM play_totals WHERE guild_id = ? AND kind = ? AND plays >= ? ORDER BY {order} LIMIT ?',
+                            (guild_id, kind, min_plays, limit))
+        return [{'key': key, 'label': label, 'plays': plays, 'skips': skips, 'listened': listened} for key, label, plays, skips, listened in rows]
+
+    def play_blocks(self, guild_id: int, since: float = 0) -> List[dict]:
+        rows = self.execute('SELECT first, count, tracks, track, requester, started, listened, skipped FROM play_blocks WHERE guild_id = ? AND first >= ? ORDER BY first',
+                            (guild_id, since))
+        names = ('first', 'count', 'tracks', 'track', 'requester', 'started', 'listened', 'skipped')
+        return [dict(zip(names, row)) for row in rows]
+
+    def latest_play_blocks(self, guild_id: int, count: int) -> List[dict]:
+        '''the `count` latest blocks of a guild, latest first'''
+        rows = self.execute('SELECT first, count, tracks, track, requester, started, listened, skipped FROM play_blocks WHERE guild_id = ? ORDER BY first DESC LIMIT ?',
+                            (guild_id, count))
+        names = ('first', 'count', 'tracks', 'track', 'requester', 'started', 'listened', 'skipped')
+        return [dict(zip(names, row)) for row in rows]
+
+    def videos(self, video_ids: List[str]) -> Dict[str, dict]:
+        '''the known metadata of some videos'''
+        videos = {}
+        for start in range(0, len(video_ids), 500): # sqlite caps the variables of a statement
+            chunk = video_ids[start:start + 500]
+            for video_id, data in self.execute(f'SELECT video_id, data FROM videos WHERE video_id IN ({",".join("?" * len(chunk))})', chunk):
+                videos[video_id] = json.loads(data)
+        return videos
+
+    def playlist_owner(self, guild_id: int, name: str) -> Optional[int]:
+        rows = self.execute('SELECT owner FROM saved_playlists WHERE guild_id = ? AND name = ?', (guild_id, name))
+        return rows[0][0] if rows else None
+
+    def save_playlist(self, guild_id: int, name: str, owner: int, infos: List[dict], manager: bool=False, imported: Collection[str]=()) -> bool:
+        '''
+        replace the saved playlist `name` of a guild, with the metadata of every
+        track. False when it belongs to someone else and `manager` is not set.
+        the metadata of `imported` videos is only kept where none is known yet
+        '''
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                rows = self.conn.execute('SELECT owner FROM saved_playlists WHERE guild_id = ? AND name = ?', (guild_id, name)).fetchall()
+                if rows and rows[0][0] != owner and not manager:
+                    self.conn.execute('ROLLBACK')
+                    return False
+                for verb, group in (('REPLACE', [info for info in infos if info['video_id'] not in imported]),
+                                    ('IGNORE', [info for info in infos if info['video_id'] in imported])):
+                    self.conn.executemany(f'INSERT OR {verb} INTO videos (video_id, data) VALUES (?, ?)',
+                                          [(info['video_id'], json.dumps(info, separators=(',', ':'))) for info in group])
+                self.conn.execute('DELETE FROM saved_playlists WHERE guild_id = ? AND name = ?', (guild_id, name))
+                playlist_id = self.conn.execute('INSERT INTO saved_playlists (guild_id, name, owner, updated) VALUES (?, ?, ?, ?)',
+                                                (guild_id, name, owner, time.time())).lastrowid
+                self.conn.executemany('INSERT INTO saved_tracks (playlist_id, position, video_id) VALUES (?, ?, ?)',
+                                      [(playlist_id, position, info['video_id']) for position, info in enumerate(infos)])
+                self.conn.execute('COMMIT')
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+        return True
+
+    def load_playlist(self, guild_id: int, name: str) -> Optional[List[dict]]:
+        rows = self.execute('SELECT id FROM saved_playlists WHERE guild_id = ? AND name = ?', (guild_id, name))
+        if not rows:
+            return None
+        rows = self.execute('SELECT videos.data FROM saved_tracks JOIN videos USING (video_id) WHERE playlist_id = ? ORDER BY position', (rows[0][0],))
+        return [json.loads(data) for data, in rows]
+
+    def saved_playlists(self, guild_id: int) -> List[Tuple[str, int]]:
+        '''(name, tracks) of every saved playlist of a guild'''
+        return self.execute('''
+            SELECT name, (SELECT COUNT(*) FROM saved_tracks WHERE playlist_id = id) FROM saved_playlists
+            WHERE guild_id = ? ORDER BY name
+        ''', (guild_id,))
+
+    def delete_playlist(self, guild_id: int, name: str, owner: int, manager: bool=False) -> bool:
+        with self._lock:
+            return self.conn.execute('DELETE FROM saved_playlists WHERE guild_id = ? AND name = ? AND (owner = ? OR ?)',
+                                     (guild_id, name, owner, manager)).rowcount > 0
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+store = Store(os.getenv('STORE_PATH', 'tkablent.db'))
+
+class Settings:
+    '''
+    settings of the guilds kept in memory. a guild's settings are read in one
+    query off the event loop before its first command, changes are written
+    by a single thread in the order they were made, so a writer of another
+    process holding the database never blocks the event loop. they live in
+    the registry, and are dropped with the rest of an evicted guild's state
+    '''
+    def __init__(self, store: Store):
+        self.store: Store = store
+        # not loaded ahead, only guild state created outside of a command reads them here
+        registry.register('settings', store.get_settings)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='settings')
+
+    async def load(self, guild_id: int):
+        if registry.peek(guild_id, 'settings') is None:
+            values = await asyncio.get_running_loop().run_in_executor(None, self.store.get_settings, guild_id)
+            registry.put(guild_id, 'settings', values)
+
+    def _values(self, guild_id: int) -> Dict[str, Any]:
+        return registry[guild_id, 'settings']
+
+    def get(self, guild_id: int, key: str, default=None):
+        return self._values(guild_id).get(key, default)
+
+    def set(self, guild_id: int, key: str, value):
+        self._values(guild_id)[key] = value
+        self._writer.submit(self.store.set_setting, guild_id, key, value).add_done_callback(self._written)
+
+    @staticmethod
+    def _written(future: Future):
+        if future.exception() is not None:
+            print(f'[Settings] Failed to write a setting: {future.exception()!r}')
+
+settings = Settings(store)
@@ -0,0 +1,125 @@
+from typing import *
+import asyncio, inspect, time
+
+from .metrics import Gauge
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+
+class Timer:
+    __slots__ = ('wheel', 'deadline', 'expires', 'callback', 'args', 'level', 'slot', 'fired', 'cancelled')
+
+    def __init__(self, wheel: 'TimerWheel', deadline: float, expires: int, callback: Callable, args: tuple):
+        self.wheel: TimerWheel = wheel
+        self.deadline: float = deadline # monotonic
+        self.expires: int = expires # wheel tick it fires on
+        self.callback: Callable = callback
+        self.args: tuple = args
+        self.level: int = None
+        self.slot: int = None
+        self.fired: bool = False
+        self.cancelled: bool = False
+
+    def cancel(self):
+        if not self.cancelled and not self.fired:
+            self.cancelled = True
+            self.wheel._remove(self)
+
+    def done(self) -> bool:
+        return self.fired or self.cancelled
+
+class TimerWheel:
+    '''
+    a hierarchical timer wheel shared by every guild: `levels` rings of 64
+    slots, level n slots span 64**n ticks (0.1s, 6.4s, 6.8min, 7.3h with the
+    defaults). a timer goes into the coarsest ring that can tell it apart
+    and falls down a ring each time the cursor reaches its slot, so
+    scheduling and cancelling are O(1) no matter how many timers wait.
+    one task walks the wheel and exits when it is empty. callbacks run on
+    the event loop like loop.call_later, a returned coroutine becomes a task
+    '''
+    def __init__(self, tick: float = 0.1, levels: int = 4):
+        self.tick: float = tick
+        self._rings: List[List[Set[Timer]]] = [[set() for _ in range(SLOTS)] for _ in range(levels)]
+        self._cursor: int = 0 # ticks walked since the wheel was created
+        self._origin: float = time.monotonic()
+        self._count: int = 0
+        self._task: asyncio.Task = None
+
+    def __len__(self):
+        return self._count
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._origin) / self.tick)
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        if self._task is None:
+            # nothing is waiting, the cursor can jump to now without skipping
+            self._cursor = max(self._cursor, self._now_tick())
+        deadline = time.monotonic() + max(delay, 0.0)
+        # round up, a timer never fires early and always waits for the next tick
+        expires = max(self._cursor + 1, -int(-(deadline - self._origin) // self.tick))
+        timer = Timer(self, deadline, expires, callback, args)
+        self._place(timer)
+        self._count += 1
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return timer
+
+    def _place(self, timer: Timer):
+        last = len(self._rings) - 1
+        # beyond the outermost ring the timer parks in its farthest slot and
+        # is placed again when that slot cascades
+        expires = min(timer.expires, self._cursor + (1 << (SLOT_BITS * (last + 1))) - 1)
+        delta = expires - self._cursor
+        level = 0
+        while level < last and delta >= 1 << (SLOT_BITS * (level + 1)):
+            level += 1
+        timer.level, timer.slot = level, (expires >> (SLOT_BITS * level)) & (SLOTS - 1)
+        self._rings[level][timer.slot].add(timer)
+
+    def _remove(self, timer: Timer):
+        if timer.slot is not None:
+            self._rings[timer.level][timer.slot].discard(timer)
+            timer.slot = None
+            self._count -= 1
+
+    def _advance(self):
+        self._cursor += 1
+        # rings above 0 hand their slot down whenever the cursor crosses it
+        for level in range(len(self._rings) - 1, 0, -1):
+            if self._cursor & ((1 << (SLOT_BITS * level)) - 1) == 0:
+                slot = self._rings[level][(self._cursor >> (SLOT_BITS * level)) & (SLOTS - 1)]
+                timers = list(slot)
+                slot.clear()
+                for timer in timers:
+                    self._place(timer)
+        slot = self._rings[0][self._cursor & (SLOTS - 1)]
+        due = list(slot)
+        slot.clear()
+        self._count -= len(due)
+        for timer in due:
+            timer.slot = None
+            self._fire(timer)
+
+    def _fire(self, timer: Timer):
+        timer.fired = True
+        try:
+            result = timer.callback(*timer.args)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception as e:
+            print(f'[TimerWheel] {getattr(timer.callback, "__qualname__", timer.callback)} failed: {e!r}')
+
+    async def _run(self):
+        try:
+            while self._count:
+                # catch up on every tick the loop was too busy to walk
+                while self._cursor < self._now_tick() and self._count:
+                    self._advance()
+                await asyncio.sleep(self._origin + (self._cursor + 1) * self.tick - time.monotonic())
+        finally:
+            self._task = None
+
+wheel = TimerWheel()
+Gauge('tkablent_timers', 'Timers waiting in the shared timer wheel', fn=lambda: len(wheel))
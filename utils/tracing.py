@@ -0,0 +1,154 @@
+from typing import *
+import contextvars, json, os, secrets, threading, time
+
+_current: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('tkablent_span', default=None)
+_UNSET = object()
+
+class Span:
+    def __init__(self, tracer: 'Tracer', name: str, parent: Optional['Span'], attributes: dict):
+        self.tracer = tracer
+        self.name: str = name
+        self.trace_id: str = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id: str = secrets.token_hex(8)
+        self.parent_id: Optional[str] = parent.span_id if parent is not None else None
+        self.attributes: dict = attributes
+        self.start: float = time.time()
+        self.end: float = None
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> 'Span':
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.error = repr(exc)
+        self.end = time.time()
+        _current.reset(self._token)
+        self.tracer._finish(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+class _NoopSpan:
+    def set(self, **attributes): ...
+    def __enter__(self): return self
+    def __exit__(self, *exc): ...
+
+class FileExporter:
+    '''one json object per finished span'''
+    def __init__(self, path: str):
+        self.path: str = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False) + '\n')
+
+class OTLPExporter:
+    '''posts spans to an OTLP/HTTP json collector (e.g. http://127.0.0.1:4318/v1/traces)'''
+    def __init__(self, endpoint: str, service: str = 'tkablent'):
+        self.endpoint: str = endpoint
+        self.service: str = service
+
+    def _payload(self, spans: List[Span]) -> dict:
+        def attribute(key, value):
+            kind = 'intValue' if isinstance(value, int) and not isinstance(value, bool) else \
+                'doubleValue' if isinstance(value, float) else 'stringValue'
+            return {'key': key, 'value': {kind: value if kind != 'stringValue' else str(value)}}
+        return {'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', self.service)]},
+            'scopeSpans': [{'spans': [{
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'startTimeUnixNano': int(span.start * 1e9),
+                'endTimeUnixNano': int(span.end * 1e9),
+                'attributes': [attribute(k, v) for k, v in span.attributes.items()],
+                'status': {'code': 2, 'message': span.error} if span.error else {},
+            } for span in spans]}],
+        }]}
+
+    def export(self, spans: List[Span]):
+        import urllib.request
+        request = urllib.request.Request(self.endpoint, data=json.dumps(self._payload(spans)).encode(), headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError as e:
+            print(f'[Tracing] Failed to export {len(spans)} spans: {e!r}')
+
+class Tracer:
+    '''
+    per request span tracing. without an exporter spans are not even created,
+    finished spans are handed to the exporter from a background thread
+    '''
+    def __init__(self, exporter=None, flush_interval: float = 2.0):
+        self.exporter = exporter
+        self.flush_interval: float = flush_interval
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def current(self) -> Optional[Span]:
+        return _current.get()
+
+    def detach(self):
+        '''background tasks inherit the span of whoever created them, start a new trace instead'''
+        _current.set(None)
+
+    def span(self, name: str, parent=_UNSET, **attributes) -> Union[Span, _NoopSpan]:
+        if not self.enabled:
+            return _NoopSpan()
+        if parent is _UNSET:
+            parent = _current.get()
+        return Span(self, name, parent, attributes)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self._pending.append(span)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_forever, name='tkablent-tracing', daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            spans, self._pending = self._pending, []
+        if spans:
+            self.exporter.export(spans)
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+def _exporter_from_env():
+    if os.getenv('OTLP_ENDPOINT'):
+        return OTLPExporter(os.getenv('OTLP_ENDPOINT'))
+    if os.getenv('TRACE_FILE'):
+        return FileExporter(os.getenv('TRACE_FILE'))
+    return None
+
+tracer = Tracer(_exporter_from_env())
@@ -1,11 +1,11 @@
 from typing import *
 import discord
 from discord.ext import commands
-import datetime
+import datetime, asyncio
 import copy
+import sys
 
 from pytube import exceptions as PytubeExceptions
-from yt_dlp import utils as YTDLPExceptions
 
 # Just for fetching current year
 cdt = datetime.datetime.now().date()
@@ -30,9 +30,19 @@ def _sec_to_hms(seconds, format) -> str:
         elif sec != 0:
             return f"{sec} 秒"
 
+def _ytdlp_error(exception, message: str) -> bool:
+    # yt_dlp is only imported on first use, if it is not loaded yet the
+    # exception can not have come from it
+    YTDLPExceptions = sys.modules.get('yt_dlp.utils')
+    return YTDLPExceptions is not None \
+        and isinstance(exception, YTDLPExceptions.DownloadError) and message in exception.msg
+
 from .player import MusicBot, Player
 from .playlist import Playlist, LoopState, PlaylistBase
 from .github import GithubIssue
+from .registry import registry
+from .panel import PanelEditor
+from .timerwheel import Timer, wheel
 
 class GuildUIInfo:
     def __init__(self, guild_id):
@@ -41,8 +51,62 @@ class GuildUIInfo:
         self.skip: bool = False
         self.mute: bool = False
         self.search: bool = False
-        self.searchmsg: discord.Message = None
-        self.playinfo: Coroutine[Any, Any, discord.Message] = None
+        self._searchmsg: discord.PartialMessage = None
+        self._playinfo: discord.PartialMessage = None # the now playing panel
+        self.status: str = None # panel headline, None shows the default one
+        self.panel_task: asyncio.Task = None # a panel write in flight
+        self.panel_timer: Timer = None # the next panel write, waiting out the interval
+        self.panel_stale: bool = False
+        self.panel_edited: float = 0.0 # monotonic time of the last panel write
+        self.progress_timer: Timer = None # next redraw of the live progress bar
+
+    # only the ids are kept, a full discord.Message holds its embeds,
+    # author and attachments for as long as the guild state lives
+    @property
+    def searchmsg(self) -> Optional[discord.PartialMessage]:
+        return self._searchmsg
+
+    @searchmsg.setter
+    def searchmsg(self, message: Optional[discord.Message]):
+        self._searchmsg = _partial(message)
+
+    @property
+    def playinfo(self) -> Optional[discord.PartialMessage]:
+        return self._playinfo
+
+    @playinfo.setter
+    def playinfo(self, message: Optional[discord.Message]):
+        self._playinfo = _partial(message)
+
+def _partial(message: Optional[discord.Message]) -> Optional[discord.PartialMessage]:
+    if message is None or isinstance(message, discord.PartialMessage):
+        return message
+    return message.channel.get_partial_message(message.id)
+
+class TimedView(discord.ui.View):
+    '''
+    a View whose timeout lives on the shared timer wheel, discord.py would
+    keep a sleeping task per view. like there, every interaction restarts it
+    '''
+    def __init__(self, *, timeout: float = 180.0):
+        super().__init__(timeout=None)
+        self.wheel_timeout: float = timeout
+        self._expiry: Timer = wheel.call_later(timeout, self._expire)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        self._expiry.cancel()
+        self._expiry = wheel.call_later(self.wheel_timeout, self._expire)
+        return True
+
+    def _expire(self):
+        if self.is_finished():
+            return
+        super().stop()
+        return self.on_timeout()
+
+    def stop(self):
+        self._expiry.cancel()
+        super().stop()
 
 class UI:
     def __init__(self, musicbot, bot_version):
@@ -51,7 +115,8 @@ class UI:
         self.musicbot: MusicBot = musicbot
         self.bot: commands.Bot = musicbot.bot
         self.github: GithubIssue = GithubIssue()
-        self._guild_ui_info = dict()
+        registry.register('ui', GuildUIInfo)
+        self.panel: PanelEditor = PanelEditor(self)
 
         self.music_errorcode_to_msg = {
             "VIDPRIVATE": "私人影片",
@@ -69,12 +134,15 @@ class UI:
             "SKIPFAIL": ["無法跳過歌曲，請確認目前候播清單是否為空", "skip", "來跳過音樂"],
             "STOPFAIL": ["無法停止播放歌曲，請確認目前是否有歌曲播放，或候播清單是否為空", "stop", "來停止播放音樂"],
             "VOLUMEADJUSTFAIL": ["無法調整音量，請確認您輸入的音量百分比是否有效\n            請以百分比格式(ex. 100%)執行指令", "volume", "來調整音量"],
+            "EFFECTFAIL": ["無法套用音效，請確認您輸入的效果名稱或數值是否有效\n            可用效果: nightcore / vaporwave / daycore / bassboost / reset", "effect [效果名稱]", "來套用音效"],
+            "CROSSFADEFAIL": ["無法調整淡入淡出長度，請確認您輸入的秒數是否有效\n            請以 0 到 12 秒的秒數格式(ex. 5)執行指令", "crossfade", "來調整淡入淡出長度"],
             "SEEKFAIL": ["無法跳轉歌曲，請確認您輸入的跳轉時間有效\n            或目前是否有歌曲播放，亦或候播清單是否為空\n            請以秒數格式(ex. 70)或時間戳格式(ex. 01:10)執行指令", "seek", "來跳轉音樂"],
             "REPLAYFAIL": ["無法重播歌曲，請確認目前是否有歌曲播放", "replay", "來重播歌曲"],
             "LOOPFAIL_SIG": ["無法啟動重複播放功能，請確認您輸入的重複次數有效", f"loop / {self.bot.command_prefix}loop [次數]", "來控制重複播放功能"],
             "REMOVEFAIL": ["無法刪除指定歌曲，請確認您輸入的順位數有效", "remove [順位數]", "來刪除待播歌曲"],
             "SWAPFAIL": ["無法交換指定歌曲，請確認您輸入的順位數有效", "swap [順位數1] [順位數2]", "來交換待播歌曲"],
             "MOVEFAIL": ["無法移動指定歌曲，請確認您輸入的目標順位數有效", "move [原順位數] [目標順位數]", "來移動待播歌曲"],
+            "SAVEDPLAYLISTFAIL": ["無法處理播放清單，請確認播放清單名稱是否存在\n            或匯入的檔案是否為有效的 JSON / M3U 格式", "playlist", "來查看儲存的播放清單"],
         }
 
         self.__embed_opt__: dict = {
@@ -84,10 +152,12 @@ class UI:
             },
         }
 
+    @property
+    def _guild_ui_info(self) -> Dict[int, GuildUIInfo]:
+        return registry.table('ui')
+
     def __getitem__(self, guild_id) -> GuildUIInfo:
-        if self._guild_ui_info.get(guild_id) is None:
-            self._guild_ui_info[guild_id] = GuildUIInfo(guild_id)
-        return self._guild_ui_info[guild_id]
+        return registry[guild_id, 'ui']
 
     def auto_stage_available(self, guild_id: int):
         return self[guild_id].auto_stage_available
@@ -268,7 +338,7 @@ class UI:
             async def on_timeout(self):
                 pass
 
-        class BugReportingView(discord.ui.View):
+        class BugReportingView(TimedView):
             def __init__(self, *, timeout=60):
                 super().__init__(timeout=timeout)
 
@@ -312,10 +382,16 @@ class UI:
         {self.bot.command_prefix}stop | 停止歌曲並清除所有隊列
         {self.bot.command_prefix}mute | 切換靜音狀態
         {self.bot.command_prefix}volume [音量] | 顯示機器人目前音量/更改音量(加上指定 [音量])
+        {self.bot.command_prefix}crossfade [秒數] | 顯示/設定歌曲間淡入淡出長度 (0 為關閉)
+        {self.bot.command_prefix}effect [效果名稱] | 顯示/套用音效 (nightcore / vaporwave / bassboost / reset)
+        {self.bot.command_prefix}speed [倍率] / pitch [倍率] | 調整播放速度 / 音高
+        {self.bot.command_prefix}bassboost [dB] / eq [頻率] [dB] | 重低音 / 等化器
         {self.bot.command_prefix}seek [秒/時間戳] | 快轉至指定時間 (時間戳格式 ex.00:04)
         {self.bot.command_prefix}restart | 重新播放目前歌曲
         {self.bot.command_prefix}loop | 切換單曲循環開關
         {self.bot.command_prefix}wholeloop | 切換全隊列循環開關
+        {self.bot.command_prefix}autoplay | 切換自動播放 (隊列播完後播放相關歌曲)
+        {self.bot.command_prefix}stats | 顯示本伺服器的播放統計
         ''', colour=0xF2F3EE)
     def _HelpEmbedQueue(self) -> discord.Embed:
         return discord.Embed(title=":regional_indicator_q: | 指令說明 | 隊列相關指令", description=f'''
@@ -323,11 +399,16 @@ class UI:
         {self.bot.command_prefix}remove [順位數] | 移除指定待播歌曲
         {self.bot.command_prefix}swap [順位數1] [順位數2] | 交換指定待播歌曲順序
         {self.bot.command_prefix}move [原順位數] [目標順位數] | 移動指定待播歌曲至指定順序
+        {self.bot.command_prefix}fairqueue | 切換公平隊列 (輪流播放每位成員點的歌)
+        {self.bot.command_prefix}playlist | 列出儲存的播放清單
+        {self.bot.command_prefix}playlist save [名稱] [播放清單URL] | 儲存目前隊列或指定的 YouTube 播放清單
+        {self.bot.command_prefix}playlist load / delete [名稱] | 播放 / 刪除儲存的播放清單
+        {self.bot.command_prefix}playlist export [名稱] [json/m3u] / import [名稱] [檔案] | 匯出 / 匯入播放清單
         ''', colour=0xF2F3EE)
     
     async def Help(self, ctx: commands.Context) -> None:
 
-        class Help(discord.ui.View):
+        class Help(TimedView):
 
             HelpEmbedBasic = self._HelpEmbedBasic
             HelpEmbedPlayback = self._HelpEmbedPlayback
@@ -400,7 +481,7 @@ class UI:
                 ''')
     
     async def JoinStage(self, ctx: commands.Context, guild_id: int) -> None:
-        botitself: discord.Member = await ctx.guild.fetch_member(self.bot.user.id)
+        botitself: discord.Member = ctx.guild.me
         if botitself not in ctx.author.voice.channel.moderators and self[guild_id].auto_stage_available == True:
             if not botitself.guild_permissions.manage_channels or not botitself.guild_permissions.administrator:
                 await ctx.send(f'''
@@ -512,15 +593,15 @@ class UI:
             self[ctx.guild.id].search = True
         else: self[ctx.guild.id].search = False
 
-    async def SearchFailed(self, ctx: commands.Context, url: str, exception: Union[YTDLPExceptions.DownloadError, Exception]) -> None:
+    async def SearchFailed(self, ctx: commands.Context, url: str, exception: Exception) -> None:
         if isinstance(exception, PytubeExceptions.VideoPrivate) \
-                or (isinstance(exception, YTDLPExceptions.DownloadError) and "Private Video" in exception.msg):
+                or _ytdlp_error(exception, "Private Video"):
             reason = 'VIDPRIVATE'
         elif isinstance(exception, PytubeExceptions.MembersOnly) \
-            or (isinstance(exception, YTDLPExceptions.DownloadError) and "members-only" in exception.msg):
+            or _ytdlp_error(exception, "members-only"):
             reason = 'FORMEMBERS'
         elif isinstance(exception, PytubeExceptions.LiveStreamError) \
-            or (isinstance(exception, YTDLPExceptions.DownloadError) and "This live event will begin in" in exception.msg):
+            or _ytdlp_error(exception, "This live event will begin in"):
             reason = 'NOTSTARTED'
         else:
             reason = 'UNAVAILIBLE'
@@ -531,7 +612,7 @@ class UI:
     ########
     # Info #
     ########
-    def _SongInfo(self, guild_id: int, color_code: str = None, index: int = 0):
+    def _SongInfo(self, guild_id: int, color_code: str = None, index: int = 0, progress: float = None):
         playlist = self.musicbot._playlist[guild_id]
         song = playlist[index]
 
@@ -567,12 +648,20 @@ class UI:
                embed.add_field(name="結束播放", value=f"輸入 ⏩ {self.bot.command_prefix}skip / ⏹️ {self.bot.command_prefix}stop\n來結束播放此直播", inline=True)
         else: 
             embed.add_field(name="歌曲時長", value=_sec_to_hms(song.info['length'], "zh"), inline=True)
+            if progress is not None:
+                position = min(progress, song.info['length'])
+                embed.add_field(name="播放進度", value="{} {} {}".format(
+                    _sec_to_hms(position, "symbol"), self.__ProgressBar(position, song.info['length']), _sec_to_hms(song.info['length'], "symbol")
+                ), inline=False)
         
         if self.musicbot[guild_id]._volume_level == 0: 
             embed._author['name'] += " | 🔇 靜音"
         
         if loopstate != LoopState.NOTHING: 
             embed._author['name'] += f"{loopicon}"
+
+        if self.musicbot._radio[guild_id].enabled:
+            embed._author['name'] += " | 📻 自動播放"
         
         
         if len(playlist.order) > 1 and color_code != 'red':
@@ -596,13 +685,33 @@ class UI:
         embed = discord.Embed.from_dict(dict(**embed.to_dict(), **self.__embed_opt__))
         return embed
 
-    async def _UpdateSongInfo(self, guild_id: int):
-        message = f'''
+    def _PanelContent(self, guild_id: int) -> Optional[dict]:
+        if self.musicbot._playlist[guild_id].current() is None:
+            return None
+        guild = self.bot.get_guild(guild_id)
+        if self[guild_id].status is not None:
+            message = self[guild_id].status
+        elif guild is not None and guild.voice_client is not None and guild.voice_client.is_paused():
+            message = f'''
+            **:pause_button: | 暫停歌曲**
+            歌曲已暫停播放
+            *按下 ⏯️ 或輸入 **{self.bot.command_prefix}resume** 以繼續播放*'''
+        else:
+            message = f'''
             **:arrow_forward: | 正在播放以下歌曲**
-            *輸入 **{self.bot.command_prefix}pause** 以暫停播放*'''
+            *按下 ⏯️ 或輸入 **{self.bot.command_prefix}pause** 以暫停播放*'''
         if not self[guild_id].auto_stage_available:
             message += '\n            *可能需要手動對機器人*` 邀請發言` *才能正常播放歌曲*'
-        await self[guild_id].playinfo.edit(content=message, embed=self._SongInfo(guild_id))
+        progress = None
+        if self.panel.progress and guild is not None and guild.voice_client is not None:
+            try:
+                progress = self.musicbot.current_timestamp(guild)
+            except AttributeError: # the player has not started yet
+                pass
+        return {'content': message, 'embed': self._SongInfo(guild_id, progress=progress)}
+
+    async def _UpdateSongInfo(self, guild_id: int):
+        self.panel.update(guild_id)
     
     ########
     # Play #
@@ -632,13 +741,11 @@ class UI:
                     or playlist.loop_state == LoopState.SINGLEINF:
                 return
 
-            msg = f'''
-            **:arrow_forward: | 正在播放以下歌曲**
-            *輸入 **{self.bot.command_prefix}pause** 以暫停播放*'''
+            msg = None
             
-        if not self[channel.guild.id].auto_stage_available:
-            msg += '\n            *可能需要手動對機器人*` 邀請發言` *才能正常播放歌曲*'
-        self[channel.guild.id].playinfo = await channel.send(msg, embed=self._SongInfo(guild_id=channel.guild.id))
+        # the panel is edited in place instead of sending a message per song
+        self[channel.guild.id].status = msg
+        self.panel.update(channel.guild.id, create=True)
         try: 
             await self._UpdateStageTopic(channel.guild.id)
         except: 
@@ -646,15 +753,15 @@ class UI:
 
     async def PlayingError(self, channel: discord.TextChannel, exception):
         if isinstance(exception, PytubeExceptions.VideoPrivate) \
-                or (isinstance(exception, YTDLPExceptions.DownloadError) and "Private Video" in exception.msg):
+                or _ytdlp_error(exception, "Private Video"):
             reason = 'PLAY_VIDPRIVATE'
         elif isinstance(exception, PytubeExceptions.MembersOnly) \
-            or (isinstance(exception, YTDLPExceptions.DownloadError) and "members-only" in exception.msg):
+            or _ytdlp_error(exception, "members-only"):
             reason = 'PLAY_FORMEMBERS'
         elif isinstance(exception, PytubeExceptions.LiveStreamError) \
-            or (isinstance(exception, YTDLPExceptions.DownloadError) and "This live event will begin in" in exception.msg):
+            or _ytdlp_error(exception, "This live event will begin in"):
             reason = 'PLAY_NOTSTARTED'
-        elif isinstance(exception, PytubeExceptions or YTDLPExceptions.DownloadError):
+        elif isinstance(exception, PytubeExceptions.PytubeError) or _ytdlp_error(exception, ''):
             reason = 'PLAY_UNAVAILIBLE'
         else:
             reason = "PLAYER_FAULT"
@@ -662,11 +769,13 @@ class UI:
         await self._MusicExceptionHandler(channel, reason, None, exception)
 
     async def DonePlaying(self, channel: discord.TextChannel) -> None:
-        await channel.send(f'''
+        msg = f'''
             **:clock4: | 播放完畢，等待播放動作**
             候播清單已全數播放完畢，等待使用者送出播放指令
             *輸入 **{self.bot.command_prefix}play [URL/歌曲名稱]** 即可播放/搜尋*
-        ''')
+        '''
+        if not await self.panel.close(channel.guild.id, content=msg, embed=None):
+            await channel.send(msg)
         try: 
             await self._UpdateStageTopic(channel.guild.id, 'done')
         except: 
@@ -675,7 +784,11 @@ class UI:
     # Pause #
     ######### 
     async def PauseSucceed(self, ctx: commands.Context, guild_id: int) -> None:
-        await ctx.send(f'''
+        if self[guild_id].playinfo is not None:
+            self[guild_id].status = None
+            self.panel.update(guild_id)
+        else:
+            await ctx.send(f'''
             **:pause_button: | 暫停歌曲**
             歌曲已暫停播放
             *輸入 **{self.bot.command_prefix}resume** 以繼續播放*
@@ -686,11 +799,16 @@ class UI:
             pass
     
     async def PauseOnAllMemberLeave(self, channel: discord.TextChannel, guild_id: int) -> None:
-        await channel.send(f'''
+        msg = f'''
             **:pause_button: | 暫停歌曲**
             所有人皆已退出語音頻道，歌曲已暫停播放
             *輸入 **{self.bot.command_prefix}resume** 以繼續播放*
-            ''')
+            '''
+        if self[guild_id].playinfo is not None:
+            self[guild_id].status = msg
+            self.panel.update(guild_id)
+        else:
+            await channel.send(msg)
         try: 
             await self._UpdateStageTopic(guild_id, 'pause')
         except: 
@@ -703,7 +821,11 @@ class UI:
     # Resume #
     ##########
     async def ResumeSucceed(self, ctx: commands.Context, guild_id: int) -> None:
-        await ctx.send(f'''
+        if self[guild_id].playinfo is not None:
+            self[guild_id].status = None
+            self.panel.update(guild_id)
+        else:
+            await ctx.send(f'''
             **:arrow_forward: | 續播歌曲**
             歌曲已繼續播放
             *輸入 **{self.bot.command_prefix}pause** 以暫停播放*
@@ -786,10 +908,50 @@ class UI:
             音量已設定為 0%，目前處於靜音模式
         ''')
             self[ctx.guild.id].mute = True
-        await self._UpdateSongInfo(ctx.guild.id, mute)
+        await self._UpdateSongInfo(ctx.guild.id)
 
     async def VolumeAdjustFailed(self, ctx: commands.Context) -> None:
         await self._CommonExceptionHandler(ctx, "VOLUMEADJUSTFAIL")
+
+    ##########
+    # Effect #
+    ##########
+    async def EffectSucceed(self, ctx: commands.Context, effects) -> None:
+        if not effects.active:
+            await ctx.send(f'''
+            **:level_slider: | 音效**
+            目前未套用任何音效
+            *輸入 **{self.bot.command_prefix}effect [效果名稱]** 以套用音效*
+        ''')
+        else:
+            await ctx.send(f'''
+            **:level_slider: | 音效**
+            目前套用的音效為 **{effects.describe()}**
+            *輸入 **{self.bot.command_prefix}effect reset** 以清除音效*
+        ''')
+
+    async def EffectFailed(self, ctx: commands.Context, exception) -> None:
+        await self._CommonExceptionHandler(ctx, "EFFECTFAIL", exception)
+
+    #############
+    # Crossfade #
+    #############
+    async def CrossfadeAdjust(self, ctx: commands.Context, seconds: float) -> None:
+        if seconds <= 0:
+            await ctx.send(f'''
+            **:twisted_rightwards_arrows: | 淡入淡出**
+            目前未啟用淡入淡出，歌曲將直接切換
+            *輸入 **{self.bot.command_prefix}crossfade [秒數]** 以啟用*
+        ''')
+        else:
+            await ctx.send(f'''
+            **:twisted_rightwards_arrows: | 淡入淡出**
+            歌曲間將以 {seconds} 秒淡入淡出切換
+            *輸入 **{self.bot.command_prefix}crossfade 0** 以關閉*
+        ''')
+
+    async def CrossfadeFailed(self, ctx: commands.Context) -> None:
+        await self._CommonExceptionHandler(ctx, "CROSSFADEFAIL")
         
     ########
     # Seek #
@@ -842,23 +1004,63 @@ class UI:
     async def SingleLoopFailed(self, ctx: commands.Context) -> None:
         await self._CommonExceptionHandler(ctx, "LOOPFAIL_SIG")
     
+    ############
+    # Autoplay #
+    ############
+    async def AutoplayToggle(self, ctx: commands.Context, enabled: bool) -> None:
+        if enabled:
+            await ctx.send(f'''
+            **:radio: | 自動播放**
+            已開啟自動播放，隊列播完後將自動播放相關歌曲
+            *輸入 **{self.bot.command_prefix}autoplay** 以關閉*
+        ''')
+        else:
+            await ctx.send(f'''
+            **:radio: | 自動播放**
+            已關閉自動播放，隊列播完後將停止播放
+            *輸入 **{self.bot.command_prefix}autoplay** 以開啟*
+        ''')
+        await self._UpdateSongInfo(ctx.guild.id)
+    
     #########
     # Queue #
     #########
+    # Fair queue
+    async def FairQueueToggle(self, ctx: commands.Context, enabled: bool) -> None:
+        if enabled:
+            await ctx.send(f'''
+            **:busts_in_silhouette: | 公平隊列**
+            已開啟公平隊列，之後加入的歌曲將輪流排入每位成員點的歌
+            *輸入 **{self.bot.command_prefix}fairqueue** 以關閉*
+        ''')
+        else:
+            await ctx.send(f'''
+            **:busts_in_silhouette: | 公平隊列**
+            已關閉公平隊列，之後加入的歌曲將排在隊列最後
+            *輸入 **{self.bot.command_prefix}fairqueue** 以開啟*
+        ''')
+
+    # Queue limits
+    async def QueueFull(self, ctx: commands.Context, exception) -> None:
+        await ctx.send(f'''
+            **:no_entry: | 隊列已滿**
+            {f"您在隊列中的歌曲已達上限 **{exception.limit}** 首" if exception.requester else f"隊列中的歌曲已達上限 **{exception.limit}** 首"}
+            *請等待隊列中的歌曲播放完畢後再加入*
+        ''')
+
     # Add to queue
-    async def Embed_AddedToQueue(self, ctx: commands.Context, url: str) -> None:
+    async def Embed_AddedToQueue(self, ctx: commands.Context, url: str, index: int) -> None:
         # If queue has more than 2 songs, then show message when
         # user use play command
         playlist: PlaylistBase = self.musicbot._playlist[ctx.guild.id]
         if len(playlist.order) > 1 or ('youtube.com/playlist?list=' in url):
-            index = len(playlist.order) - 1
 
             msg = '''
             **:white_check_mark: | 成功加入隊列**
                 以下{}已加入隊列中，{}
             '''.format(
                 "播放清單" if ('youtube.com/playlist?list=' in url) else "歌曲",
-                "以下為本清單第一首歌\n                *系統已開始處理播放清單\n                將暫時無法提供待播清單*" if ('youtube.com/playlist?list=' in url) else f"為第 **{len(playlist.order)-1}** 首歌"
+                "以下為本清單第一首歌\n                *系統已開始處理播放清單\n                將暫時無法提供待播清單*" if ('youtube.com/playlist?list=' in url) else f"為第 **{index}** 首歌"
             )
 
             if not self[ctx.guild.id].search: 
@@ -868,6 +1070,8 @@ class UI:
         else: 
             if self[ctx.guild.id].search: 
                 await self[ctx.guild.id].searchmsg.delete()
+        # the queue field of the panel
+        self.panel.update(ctx.guild.id)
     
     # Queue Embed Generator
     def _QueueEmbed(self, playlist: PlaylistBase, page: int=0) -> discord.Embed:
@@ -909,7 +1113,7 @@ class UI:
     async def ShowQueue(self, ctx: commands.Context) -> None:
         playlist: PlaylistBase = self.musicbot._playlist[ctx.guild.id]
 
-        class QueueListing(discord.ui.View):
+        class QueueListing(TimedView):
 
             QueueEmbed = self._QueueEmbed
             embed_opt = self.__embed_opt__
@@ -1069,4 +1273,105 @@ class UI:
         await ctx.send(embed=embed)
 
     async def MoveToFailed(self, ctx, exception) -> None:
-        await self._CommonExceptionHandler(ctx, "MOVEFAIL", exception)
\ No newline at end of file
+        await self._CommonExceptionHandler(ctx, "MOVEFAIL", exception)
+
+    ##################
+    # Saved Playlist #
+    ##################
+    async def SavedPlaylistList(self, ctx: commands.Context, playlists: List[Tuple[str, int]]) -> None:
+        if not playlists:
+            await ctx.send(f'''
+            **:floppy_disk: | 儲存的播放清單**
+            本伺服器尚未儲存任何播放清單
+            *輸入 **{self.bot.command_prefix}playlist save [名稱]** 以儲存目前隊列*
+        ''')
+            return
+        embed = discord.Embed(title=":floppy_disk: | 儲存的播放清單", description='\n'.join(
+            f"{name} | {count} 首歌" for name, count in playlists
+        ), colour=0xF2F3EE)
+        embed.add_field(name="播放", value=f"輸入 {self.bot.command_prefix}playlist load [名稱]", inline=False)
+        embed = discord.Embed.from_dict(dict(**embed.to_dict(), **self.__embed_opt__))
+        await ctx.send(embed=embed)
+
+    async def SavedPlaylistSaved(self, ctx: commands.Context, name: str, saved: int, failed: int) -> None:
+        msg = f'''
+            **:floppy_disk: | 已儲存播放清單**
+            播放清單 **{name}** 已儲存 {saved} 首歌'''
+        if failed:
+            msg += f'''
+            有 {failed} 首歌無法存取，已略過'''
+        await ctx.send(msg + f'''
+            *輸入 **{self.bot.command_prefix}playlist load {name}** 以播放*
+        ''')
+
+    async def SavedPlaylistLoaded(self, ctx: commands.Context, name: str, count: int, dropped: int = 0) -> None:
+        await ctx.send(f'''
+            **:floppy_disk: | 載入播放清單**
+            已將播放清單 **{name}** 的 {count} 首歌加入隊列{f"，隊列已滿，其餘 {dropped} 首未加入" if dropped else ""}
+            *輸入 **{self.bot.command_prefix}queue** 以查看待播清單*
+        ''')
+        self.panel.update(ctx.guild.id)
+
+    async def SavedPlaylistDeleted(self, ctx: commands.Context, name: str) -> None:
+        await ctx.send(f'''
+            **:wastebasket: | 已刪除播放清單**
+            播放清單 **{name}** 已刪除
+        ''')
+
+    async def SavedPlaylistExport(self, ctx: commands.Context, name: str, file: discord.File) -> None:
+        await ctx.send(f'''
+            **:outbox_tray: | 匯出播放清單**
+            播放清單 **{name}** 如附件所示
+            *輸入 **{self.bot.command_prefix}playlist import [名稱]** 並附上檔案即可匯入*
+        ''', file=file)
+
+    async def SavedPlaylistFailed(self, ctx: commands.Context, exception) -> None:
+        await self._CommonExceptionHandler(ctx, "SAVEDPLAYLISTFAIL", exception)
+
+    #########
+    # Stats #
+    #########
+    async def Stats(self, ctx: commands.Context, stats: dict) -> None:
+        total = stats['total']
+        if total['plays'] == 0:
+            await ctx.send(f'''
+            **:bar_chart: | 播放統計**
+            本伺服器尚未播放過任何歌曲
+            *輸入 **{self.bot.command_prefix}play [URL/歌曲名稱]** 即可播放/搜尋*
+        ''')
+            return
+        def rate(row: dict) -> str:
+            return f"{row['skips'] / row['plays']:.0%}"
+        embed = discord.Embed(title=":bar_chart: | 播放統計", description="共播放 {} 首 | 收聽 {} | 跳過率 {}".format(
+            total['plays'], _sec_to_hms(total['listened'], "zh") or "0 秒", rate(total)
+        ), colour=0xF2F3EE)
+        embed.add_field(name="熱門歌曲", value='\n'.join(
+            f"{i}. {row['label']} | {row['plays']} 次" for i, row in enumerate(stats['tracks'], 1)
+        ), inline=False)
+        embed.add_field(name="點歌排行", value='\n'.join(
+            f"{i}. {row['label']} | {row['plays']} 首 | 跳過率 {rate(row)}" for i, row in enumerate(stats['requesters'], 1)
+        ), inline=False)
+        if stats['skipped']:
+            embed.add_field(name="跳過率最高", value='\n'.join(
+                f"{i}. {row['label']} | 跳過率 {rate(row)} ({row['skips']} / {row['plays']} 次)" for i, row in enumerate(stats['skipped'], 1)
+            ), inline=False)
+        embed = discord.Embed.from_dict(dict(**embed.to_dict(), **self.__embed_opt__))
+        await ctx.send(embed=embed)
+
+    ##########
+    # Memory #
+    ##########
+    async def MemoryReport(self, ctx: commands.Context, report: dict) -> None:
+        kinds = ' / '.join(f'{kind} {count}' for kind, count in report['kinds'].items())
+        live = ' / '.join(f'{name} {count}' for name, count in report['live_objects'].items())
+        msg = f'''
+            **:bar_chart: | 記憶體使用狀況**
+            伺服器狀態 {report['guilds']} 個 (使用中 {report['busy']} 個) | {kinds}
+            閒置時間 中位數 {_sec_to_hms(report['idle_median'], "symbol")} / 最長 {_sec_to_hms(report['idle_max'], "symbol")} | 已回收 {report['evictions']:.0f} 個
+            待播歌曲 {report['queued_songs']} 首 | 存活物件 {live}
+            未在隊列中的歌曲 {report['untracked_songs']} 首 | FFmpeg 程序 {report['ffmpeg_processes']} 個 | 最高 RSS {report['max_rss_mb']:.1f} MB
+            快取成員 {report['cached_members']} 位 | 快取使用者 {report['cached_users']} 位
+            '''
+        if report.get('top_allocations'):
+            msg += '```\n' + '\n'.join(report['top_allocations']) + '\n```'
+        await ctx.send(msg)
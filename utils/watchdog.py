@@ -0,0 +1,94 @@
+from typing import *
+import asyncio, os, sys, threading, time, traceback, weakref
+
+from .metrics import Counter
+
+loop_stalls = Counter('tkablent_event_loop_stalls_total', 'Times the event loop was blocked longer than the watchdog threshold')
+
+class LoopWatchdog:
+    '''
+    a task on the event loop bumps a heartbeat, a separate thread checks it.
+    when the loop stops beating for longer than `threshold` the thread samples
+    the stack of the loop thread until it recovers, then prints what blocked
+    it together with the guild/command that was running
+    '''
+    def __init__(self, threshold: float = None, interval: float = 0.05, max_samples: int = 5):
+        self.loop: asyncio.AbstractEventLoop = None
+        self.threshold: float = threshold if threshold is not None else float(os.getenv('WATCHDOG_THRESHOLD', 0.25))
+        self.interval: float = interval
+        self.max_samples: int = max_samples
+        self._beat: float = time.monotonic()
+        self._loop_thread: int = None
+        self._contexts: 'weakref.WeakKeyDictionary[asyncio.Task, dict]' = weakref.WeakKeyDictionary()
+        self._heartbeat: asyncio.Task = None
+        self._thread: threading.Thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        '''must be called from the event loop it should watch'''
+        if self._heartbeat is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._heartbeat = self.loop.create_task(self._beat_forever())
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name='tkablent-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    def tag(self, task: asyncio.Task = None, /, **context):
+        '''attach guild/command information to a task, shown when it blocks the loop'''
+        task = task or asyncio.current_task()
+        if task is not None:
+            self._contexts[task] = context
+
+    async def _beat_forever(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _current_context(self) -> dict:
+        try:
+            task = asyncio.current_task(self.loop)
+            return dict(self._contexts.get(task, {})) if task is not None else {}
+        except (RuntimeError, TypeError):
+            return {}
+
+    def _sample(self) -> Optional[str]:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+        return ''.join(traceback.format_stack(frame))
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            stalled = time.monotonic() - self._beat
+            if stalled < self.threshold:
+                continue
+            context = self._current_context()
+            samples: Dict[str, int] = {}
+            # keep sampling while the loop is still blocked, distinct stacks
+            # show where the time actually goes
+            beat = self._beat
+            while self._beat == beat and not self._stopped.is_set():
+                stack = self._sample()
+                if stack is not None and (stack in samples or len(samples) < self.max_samples):
+                    samples[stack] = samples.get(stack, 0) + 1
+                time.sleep(self.interval)
+            self._report(time.monotonic() - beat - self.interval, context, samples)
+
+    def _report(self, duration: float, context: dict, samples: Dict[str, int]):
+        loop_stalls.inc()
+        where = ' '.join(f'{key}={value}' for key, value in context.items()) or 'unknown task'
+        lines = [f'[Watchdog] Event loop blocked for {duration:.2f}s ({where})']
+        total = sum(samples.values()) or 1
+        for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+            lines.append(f'--- {count * 100 // total}% of samples ---')
+            lines.append(stack.rstrip())
+        print('\n'.join(lines))
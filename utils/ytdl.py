@@ -1,6 +1,10 @@
-import pytube, yt_dlp
+from typing import *
+
+import pytube
 import pytube.exceptions
 
+from .metrics import extraction_seconds, extraction_errors
+
 ytdl_format_options = {
     'format': 'bestaudio/best',
     'noplaylist': True,
@@ -13,7 +17,66 @@ ytdl_format_options = {
     'source_address': '0.0.0.0' # bind to ipv4 since ipv6 addresses cause issues sometimes
 }
 
-ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+_ytdl = None
+
+def ytdl():
+    # yt_dlp and its extractor registry take a long time to import and it is
+    # only the fallback, load it the first time it is needed
+    global _ytdl
+    if _ytdl is None:
+        import yt_dlp
+        _ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+    return _ytdl
+
+def _loudness(info: pytube.YouTube) -> Optional[float]:
+    '''loudness youtube measured for the track in dB, from the player response already fetched'''
+    try:
+        return float(info.vid_info['playerConfig']['audioConfig']['loudnessDb'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+def _pytube_info(info: pytube.YouTube) -> dict:
+    return {
+        'video_id': info.video_id,
+        'title': info.title,
+        'author': info.author,
+        'channel_url': info.channel_url,
+        'watch_url': info.watch_url,
+        'thumbnail_url': info.thumbnail_url,
+        'length': info.length,
+        'stream': info.length == 0,
+        'loudness': _loudness(info),
+    }
+
+def _video_renderers(response: dict) -> Iterator[dict]:
+    try:
+        sections = response['contents']['twoColumnSearchResultsRenderer']['primaryContents']['sectionListRenderer']['contents']
+    except KeyError:
+        return
+    for section in sections:
+        for item in section.get('itemSectionRenderer', {}).get('contents', []):
+            if 'videoRenderer' in item:
+                yield item['videoRenderer']
+
+def _search_info(renderer: dict) -> dict:
+    '''the info of a search result, from the fields of its videoRenderer'''
+    video_id = renderer['videoId']
+    owner = renderer['ownerText']['runs'][0]
+    length = 0 # live and upcoming videos have no length
+    if 'lengthText' in renderer:
+        for part in renderer['lengthText']['simpleText'].split(':'):
+            length = length * 60 + int(part)
+    return {
+        'video_id': video_id,
+        'title': renderer['title']['runs'][0]['text'],
+        'author': owner['text'],
+        'channel_url': 'https://www.youtube.com' + owner['navigationEndpoint']['commandMetadata']['webCommandMetadata']['url'],
+        'watch_url': f'https://youtube.com/watch?v={video_id}',
+        'thumbnail_url': renderer['thumbnail']['thumbnails'][-1]['url'],
+        'length': length,
+        'stream': length == 0,
+        'loudness': None,
+    }
 
 class YTDL:
     def __init__(self):
@@ -24,62 +87,56 @@ class YTDL:
 
     def get_url(self, url) -> str:
         try:
-            return pytube.YouTube(url).streams.get_highest_resolution().url
+            with extraction_seconds.time(backend='pytube', op='url'):
+                return pytube.YouTube(url).streams.get_highest_resolution().url
         except pytube.exceptions.VideoPrivate \
                 or pytube.exceptions.MembersOnly \
                 or pytube.exceptions.LiveStreamError \
                 or pytube.exceptions.VideoUnavailable as e:
+            extraction_errors.inc(backend='pytube', op='url')
             raise e
         except:
+            extraction_errors.inc(backend='pytube', op='url')
             try:
-                return ytdl.extract_info(url, download=False)['url']
+                with extraction_seconds.time(backend='yt_dlp', op='url'):
+                    return ytdl().extract_info(url, download=False)['url']
             except Exception as e:
+                extraction_errors.inc(backend='yt_dlp', op='url')
                 raise e
 
     def get_playlist(self, url) -> pytube.Playlist:
         urls = pytube.Playlist(url).video_urls
         for i in range(1, len(urls)):
-            url = urls[i]
-            print(url)
-            yield url
+            yield urls[i]
 
     def get_playlist_id(self, url):
         return pytube.Playlist(url).playlist_id
 
     def get_first_video(self, url) -> str:
         playlist = pytube.Playlist(url)
-        print(playlist.video_urls[0])
         return playlist.video_urls[0]
 
     def get_info(self, url) -> dict:
         try:
             song_info_dict = {}
-            if ("http" not in url) and ("www" not in url):
-                info = pytube.Search(url).results[0]
-            else:
-                info = pytube.YouTube(url)
-                
-                    # the value below is for high audio quality
-            song_info_dict['video_id'] = info.video_id
-            song_info_dict['title'] = info.title
-            song_info_dict['author'] = info.author
-            song_info_dict['channel_url'] = info.channel_url
-            song_info_dict['watch_url'] = info.watch_url
-            song_info_dict['thumbnail_url'] = info.thumbnail_url
-            song_info_dict['length'] = info.length
-            if info.length != 0:
-                song_info_dict['stream'] = False
-            else:
-                song_info_dict['stream'] = True
+            with extraction_seconds.time(backend='pytube', op='info'):
+                if ("http" not in url) and ("www" not in url):
+                    info = pytube.Search(url).results[0]
+                else:
+                    info = pytube.YouTube(url)
+                song_info_dict = _pytube_info(info)
         except pytube.exceptions.VideoPrivate or pytube.exceptions.MembersOnly as e:
+            extraction_errors.inc(backend='pytube', op='info')
             raise e
         except:
+            extraction_errors.inc(backend='pytube', op='info')
             try:
                 print('[ytdlCore] Failsafe: Using yt_dlp')
-                if ("http" not in url) and ("www" not in url):
-                    info = ytdl.extract_info(url, download=False)['entries'][0]
-                else:
-                    info = ytdl.extract_info(url, download=False)
+                with extraction_seconds.time(backend='yt_dlp', op='info'):
+                    if ("http" not in url) and ("www" not in url):
+                        info = ytdl().extract_info(url, download=False)['entries'][0]
+                    else:
+                        info = ytdl().extract_info(url, download=False)
 
                 song_info_dict['video_id'] = info['video_id']
                 song_info_dict['title'] = info["title"]
@@ -93,6 +150,7 @@ class YTDL:
                 else:
                     song_info_dict['stream'] = True
             except Exception as e: 
+                extraction_errors.inc(backend='yt_dlp', op='info')
                 raise e
         return song_info_dict
 
@@ -114,4 +172,23 @@ class YTDL:
     # Length: It is a stream, how can you tell the length?
     # AudioCodec: Not availible
     # Bitrate: Not availible
-    #         ''')
\ No newline at end of file
+    #         ''')
+
+    def get_related(self, info: dict, limit: int = 10) -> List[dict]:
+        '''more videos of the author of `info`, what autoplay picks from'''
+        related = []
+        with extraction_seconds.time(backend='pytube', op='related'):
+            # the raw response already carries what autoplay needs, the
+            # results pytube builds from it would fetch every video again
+            response = pytube.Search(info['author']).fetch_query()
+        for renderer in _video_renderers(response):
+            try:
+                video = _search_info(renderer)
+            except (KeyError, IndexError, ValueError):
+                continue
+            if video['video_id'] == info['video_id']:
+                continue
+            related.append(video)
+            if len(related) >= limit:
+                break
+        return related